@@ -0,0 +1,352 @@
+""" Admission by maximum flow
+
+choose_student and choose_student_extension fill one class after another, first come first served, so a student
+may take the last seat of a class that someone else could only have taken at that time. flow_admit instead fills
+as many seats as the fixed schedule allows in the basic version, and is a heuristic built on the same flow in the
+extension.
+
+Students, classes and time slots form a flow network: the source feeds every class up to the capacity of its
+room, a class passes one unit to every (student, slot of the class) pair of a student who asked for it, and every
+such pair passes at most one unit to the sink, so a student takes at most one class per slot. A maximum flow is a
+maximum b-matching between classes and (student, slot) pairs, found with phases of shortest augmenting paths
+(Hopcroft-Karp) on top of a greedy matching.
+
+In the basic version only equal slots conflict, so the flow is the best admission there is. In the extension,
+slots may overlap without being equal and a lecture with a lab needs the student in both sections, which a flow
+can't express. The flow is computed on the lecture slots and then repaired: every student keeps a largest set of
+their classes that don't overlap, and the seats freed that way are refilled first come first served. Nothing
+guarantees that the result beats greedy admission there; on the Haverford schedule the two score about the same.
+
+`python3 admission.py --check N` compares max_b_matching with a plain Edmonds-Karp max flow on N small random
+bipartite graphs.
+"""
+
+import argparse
+import random
+from collections import deque
+import numpy as np
+from components import TimeTable
+from instrument import stats
+from pool import Roster, schedule_sections
+
+
+def admissible_sections(schedule, time_list=None, registry=None):
+    """ The classes of a schedule students can be admitted to, as choose_student_extension decides
+        Args:
+            schedule (dict): {Course: (ClassRoom, time, [Students])}
+            time_list (TimeTable): given for the extension, None for the basic version
+            registry (CourseRegistry): to look up labs
+        Returns:
+            sections (list): (lecture, lab or None, capacity, the lecture's value, the lab's value or None)
+            tuples, labs and lectures whose lab wasn't scheduled are left out in the extension
+    """
+    sections = []
+    for course, value, lab, lab_value in schedule_sections(schedule, registry):
+        if time_list is None or course.has_lab == 0:
+            sections.append((course, None, value[0].capacity, value, None))
+        elif course.has_lab > 0 and lab is not None:
+            # students attend both sections, so the smaller room is the limit
+            sections.append((course, lab, min(value[0].capacity, lab_value[0].capacity), value, lab_value))
+    return sections
+
+
+def max_b_matching(adj, capacity, nunits):
+    """ Maximum b-matching of a bipartite graph, every section matched to at most `capacity` units and every
+        unit to at most one section
+        Args:
+            adj (list): adj[c] lists the units section c may be matched to
+            capacity (list): capacity[c] is the most units section c may be matched to
+            nunits (int): units are numbered 0..nunits-1
+        Returns:
+            match (list): match[u] is the section unit u is matched to, -1 if none
+    """
+    nsections = len(adj)
+    match = [-1] * nunits
+    load = [0] * nsections
+
+    # a greedy matching first, the phases only have to fix what it got wrong
+    for c in range(nsections):
+        cap = capacity[c]
+        for u in adj[c]:
+            if load[c] >= cap:
+                break
+            if match[u] < 0:
+                match[u] = c
+                load[c] += 1
+
+    while True:
+        free = [c for c in range(nsections) if load[c] < min(capacity[c], len(adj[c]))]
+        # sections by their distance from a section with spare seats on alternating paths, a section is one
+        # step further than the section that owns a unit it could take
+        dist = [-1] * nsections
+        for c in free:
+            dist[c] = 0
+        limit = None
+        queue = list(free)
+        for c in queue:
+            if limit is not None and dist[c] > limit:
+                break
+            step = dist[c] + 1
+            for u in adj[c]:
+                owner = match[u]
+                if owner < 0:
+                    if limit is None:
+                        limit = dist[c]
+                elif dist[owner] < 0:
+                    dist[owner] = step
+                    queue.append(owner)
+        if limit is None:
+            break
+        stats.count('flow_phases')
+
+        augmented = 0
+        position = [0] * nsections
+        for c in free:
+            while load[c] < capacity[c] and _augment(c, adj, match, dist, position):
+                load[c] += 1
+                augmented += 1
+        stats.count('augmenting_paths', augmented)
+        if augmented == 0:
+            break
+    return match
+
+
+def _augment(root, adj, match, dist, position):
+    """ Find one augmenting path from section `root` along increasing distances and flip it
+        position[c] is how far the units of section c have been tried in this phase, sections found to be dead
+        ends get distance -1
+    """
+    path = [root]
+    units = []
+    while path:
+        c = path[-1]
+        units_c = adj[c]
+        i = position[c]
+        step = dist[c] + 1
+        child = -1
+        while i < len(units_c):
+            u = units_c[i]
+            owner = match[u]
+            if owner < 0:
+                # every section on the path takes the unit of the next one, the last takes the free unit
+                units.append(u)
+                for section, unit in zip(path, units):
+                    match[unit] = section
+                position[c] = i + 1
+                return True
+            if owner != c and dist[owner] == step:
+                child = owner
+                break
+            i += 1
+        position[c] = i
+        if child >= 0:
+            path.append(child)
+            units.append(units_c[i])
+        else:
+            dist[c] = -1
+            path.pop()
+            if units:
+                units.pop()
+                position[path[-1]] += 1
+    return False
+
+
+def flow_admit(schedule, time_list=None, registry=None, pool=None):
+    """ Admit as many students as the schedule can hold, instead of choose_student or choose_student_extension
+        Args:
+            schedule (dict): {Course: (ClassRoom, time, [Students])}, students come from the `specs` of courses
+            time_list (TimeTable): the time slots of an extension schedule, None for the basic version
+            registry (CourseRegistry): to look up labs
+            pool (StudentPool): if `specs` hold positions in this pool, rosters become Roster objects
+        Returns:
+            admitted (int): the number of seats filled in lectures
+    """
+    if time_list is not None and (not isinstance(time_list, TimeTable) or not time_list.overlap):
+        time_list = TimeTable(time_list)
+        time_list.compile_overlaps()
+    overlap = time_list.overlap if time_list is not None else {}
+    sections = admissible_sections(schedule, time_list, registry)
+
+    # the slots every section needs, and the slots it blocks because they overlap one of those
+    need = []
+    blocks = []
+    for course, lab, capacity, value, lab_value in sections:
+        times = [value[1]] + ([lab_value[1]] if lab is not None else [])
+        need.append(sum(1 << t for t in set(times)))
+        mask = 0
+        for t in times:
+            mask |= overlap.get(t, 1 << t)
+        blocks.append(mask)
+
+    # units are (student, lecture slot) pairs
+    slot_ids = {}
+    for course, lab, capacity, value, lab_value in sections:
+        slot_ids.setdefault(value[1], len(slot_ids))
+    nslots = max(len(slot_ids), 1)
+    student_ids = {}
+    unit_ids = {}
+    unit_student = []
+    adj = []
+    for course, lab, capacity, value, lab_value in sections:
+        slot = slot_ids[value[1]]
+        units = []
+        for student in course.specs:
+            s = student_ids.setdefault(student, len(student_ids))
+            key = s * nslots + slot
+            u = unit_ids.get(key)
+            if u is None:
+                u = unit_ids[key] = len(unit_student)
+                unit_student.append(s)
+            units.append(u)
+        adj.append(units)
+    students = list(student_ids)
+
+    match = max_b_matching(adj, [section[2] for section in sections], len(unit_student))
+
+    classes_of = [[] for _ in students]
+    for u, c in enumerate(match):
+        if c >= 0:
+            classes_of[unit_student[u]].append(c)
+
+    # a student keeps the classes with the fewest overlaps with their other classes first
+    taken = [0] * len(students)
+    rosters = [[] for _ in sections]
+    for s, classes in enumerate(classes_of):
+        if len(classes) > 1 and overlap:
+            classes.sort(key=lambda c: sum(1 for d in classes if d != c and blocks[c] & need[d]))
+        mask = 0
+        for c in classes:
+            if mask & need[c]:
+                stats.count('flow_repairs')
+                continue
+            mask |= blocks[c]
+            rosters[c].append(s)
+        taken[s] = mask
+
+    if overlap:
+        # refill the seats the repair freed
+        for c, (course, lab, capacity, value, lab_value) in enumerate(sections):
+            roster = rosters[c]
+            if len(roster) >= capacity:
+                continue
+            for student in course.specs:
+                s = student_ids[student]
+                if not taken[s] & need[c]:
+                    taken[s] |= blocks[c]
+                    roster.append(s)
+                    stats.count('flow_refills')
+                    if len(roster) >= capacity:
+                        break
+
+    admitted = 0
+    for c, (course, lab, capacity, value, lab_value) in enumerate(sections):
+        roster = sorted(rosters[c])
+        admitted += len(roster)
+        entries = [(course, value)] + ([(lab, lab_value)] if lab is not None else [])
+        for entry, (room, time, admitted_list) in entries:
+            if pool is not None:
+                schedule[entry] = (room, time, Roster(pool, np.array([students[s] for s in roster], dtype=np.int64)))
+            else:
+                for s in roster:
+                    admitted_list.append(students[s])
+                    students[s].taken.append(time)
+    return admitted
+
+
+def edmonds_karp(adj, capacity, nunits):
+    """ The size of a maximum b-matching, as max_b_matching should find it, by Edmonds-Karp on the flow network
+        source -> sections -> units -> sink. It takes O(VE^2) time, it's only for checking max_b_matching on
+        small graphs.
+        Args:
+            adj, capacity, nunits: as for max_b_matching
+        Returns:
+            flow (int)
+    """
+    nsections = len(adj)
+    source, sink = nsections + nunits, nsections + nunits + 1
+    residual = [dict() for _ in range(nsections + nunits + 2)]
+
+    def edge(a, b, cap):
+        residual[a][b] = residual[a].get(b, 0) + cap
+        residual[b].setdefault(a, 0)
+
+    for c in range(nsections):
+        edge(source, c, capacity[c])
+        for u in set(adj[c]):
+            edge(c, nsections + u, 1)
+    for u in range(nunits):
+        edge(nsections + u, sink, 1)
+
+    flow = 0
+    while True:
+        parent = {source: None}
+        queue = deque([source])
+        while queue and sink not in parent:
+            a = queue.popleft()
+            for b, cap in residual[a].items():
+                if cap > 0 and b not in parent:
+                    parent[b] = a
+                    queue.append(b)
+        if sink not in parent:
+            return flow
+        path = []
+        b = sink
+        while parent[b] is not None:
+            path.append((parent[b], b))
+            b = parent[b]
+        push = min(residual[a][b] for a, b in path)
+        for a, b in path:
+            residual[a][b] -= push
+            residual[b][a] += push
+        flow += push
+
+
+def check_max_b_matching(trials, seed=0):
+    """ Compare max_b_matching with edmonds_karp on `trials` random bipartite graphs
+        Returns:
+            failure (tuple): (adj, capacity, nunits, what went wrong) of the first graph it got wrong, None if none
+    """
+    rng = random.Random(seed)
+    for _ in range(trials):
+        nsections = rng.randint(1, 8)
+        nunits = rng.randint(1, 12)
+        density = rng.random()
+        # units may repeat, as a student may list a class twice
+        adj = [[u for u in range(nunits) for _ in range(rng.choice((1, 1, 1, 2))) if rng.random() < density]
+               for _ in range(nsections)]
+        for units in adj:
+            rng.shuffle(units)
+        capacity = [rng.randint(0, 4) for _ in range(nsections)]
+        match = max_b_matching(adj, capacity, nunits)
+
+        load = [0] * nsections
+        for u, c in enumerate(match):
+            if c >= 0:
+                if u not in adj[c]:
+                    return adj, capacity, nunits, "unit %d was matched to section %d, which doesn't list it" % (u, c)
+                load[c] += 1
+        over = [c for c in range(nsections) if load[c] > capacity[c]]
+        if over:
+            return adj, capacity, nunits, "section %d got more units than its capacity" % over[0]
+        best = edmonds_karp(adj, capacity, nunits)
+        if sum(load) != best:
+            return adj, capacity, nunits, "matched %d units, the maximum is %d" % (sum(load), best)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Usage: python3 admission.py --check <trials>, checks max_b_matching against Edmonds-Karp')
+    parser.add_argument('--check', type=int, default=1000, metavar='TRIALS',
+                        help="how many random bipartite graphs to compare on (default: 1000)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the random graphs (default: 0)")
+    args = parser.parse_args()
+    failure = check_max_b_matching(args.check, args.seed)
+    if failure is not None:
+        adj, capacity, nunits, problem = failure
+        print("max_b_matching is wrong: %s" % problem)
+        print("adj =", adj)
+        print("capacity =", capacity, " nunits =", nunits)
+        exit(-1)
+    print("max_b_matching found a maximum b-matching on all %d graphs." % args.check)
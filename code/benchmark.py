@@ -0,0 +1,283 @@
+#! /usr/bin/env python3
+""" Scaling benchmarks
+
+Sweeps one input size at a time (students s, classes c, rooms r, time slots t) around a base point, times the
+scheduler on random instances from generator.py with fixed seeds, and fits the scaling exponent k of
+time ~ size^k on a log-log scale. Results are written as JSON and CSV, and as one chart per sweep if matplotlib
+is installed. A previous JSON file can be passed as a baseline to catch exponents that got worse.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import timeit
+import numpy as np
+from main import *
+from generator import check_basic_sizes, random_basic_instance, random_extension_students, EXTENSION_CLASSES
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the sweep of the paper is 1000-5000 students at 15 rooms, 160 classes and 8 slots, which has more classes than
+# room-slots, so the base point here has 20 rooms
+BASIC_BASE = {'s': 2000, 'c': 160, 'r': 20, 't': 8}
+BASIC_SWEEPS = {
+    's': [1000, 2000, 3000, 4000, 5000],
+    'c': [40, 80, 120, 160],
+    'r': [20, 40, 80, 160],
+    't': [8, 16, 32, 64],
+}
+# large enough to hold a million students
+LARGE_BASE = {'s': 100000, 'c': 4000, 'r': 200, 't': 20}
+LARGE_SWEEPS = {
+    's': [10000, 30000, 100000, 300000, 1000000],
+    'c': [1000, 2000, 4000],
+    'r': [200, 400, 800],
+    't': [20, 40, 80],
+}
+# the Haverford data fixes the time slots, classes and rooms are cut down to the first c or r of them
+EXTENSION_BASE = {'s': 2000}
+EXTENSION_SWEEPS = {
+    's': [1000, 2000, 5000, 10000, 20000],
+    'c': [65, 130, 195, 260],
+    'r': [10, 20, 40],
+}
+
+# timings recorded for every run
+METRICS = ['schedule_time', 'admit_time', 'total_time']
+RUN_FIELDS = ['mode', 'param', 'value', 'repeat', 'seed', 's', 'c', 'r', 't', 'score'] + METRICS
+
+
+def run_basic(size, seed):
+    """ Time the basic scheduler on one random instance
+        Args:
+            size (dict): {'s': #students, 'c': #classes, 'r': #rooms, 't': #time slots}
+        Returns:
+            timings (dict): `schedule_time` for make_schedule_basic, `admit_time` for counting and admitting
+            students, and their sum `total_time`
+            score (int): the number of students placed
+    """
+    random.seed(seed)
+    all_students, ntimes, all_rooms, all_classes, all_teachers = random_basic_instance(
+        size['r'], size['c'], size['t'], size['s'], seed)
+
+    timer = timeit.default_timer
+    start = timer()
+    count_prefs(CourseRegistry(all_classes), all_students)
+    counted = timer()
+    schedule = make_schedule_basic(all_students, all_classes, all_rooms, ntimes, all_teachers)
+    scheduled = timer()
+    choose_student(schedule)
+    admitted = timer()
+
+    timings = {
+        'schedule_time': scheduled - counted,
+        'admit_time': (counted - start) + (admitted - scheduled),
+        'total_time': admitted - start,
+    }
+    return timings, sum(len(v[2]) for v in schedule.values())
+
+
+def load_extension(datadir, seed):
+    """ Read the Haverford constraints, teacher conflicts are drawn from `random` and depend on the seed """
+    random.seed(seed)
+    past_students = read_enrollment(os.path.join(datadir, 'S14Enrollment.txt'))
+    all_times, all_rooms, all_classes, all_teachers = read_extension_constraints(
+        os.path.join(datadir, 'haverfordConstraints_1.txt'), os.path.join(datadir, 'haverfordConstraints_2.txt'))
+    build_time_table(all_times)
+    return past_students, all_times, all_rooms, all_classes, all_teachers
+
+
+def run_extension(size, seed, datadir):
+    """ Time the extension scheduler on the Haverford data with random student preferences
+        Args:
+            size (dict): {'s': #students, 'c': #classes (optional), 'r': #rooms (optional)}
+        Returns:
+            timings (dict): `schedule_time` for scheduling from past enrollment, `admit_time` for admitting
+            students, and their sum `total_time`
+            score (int): the number of students placed in lectures
+    """
+    past_students, all_times, all_rooms, all_classes, all_teachers = load_extension(datadir, seed)
+    all_classes = all_classes[:size.get('c', len(all_classes))]
+    all_rooms = all_rooms[:size.get('r', len(all_rooms))]
+    all_students = random_extension_students(size['s'], all_classes, seed, min(EXTENSION_CLASSES, len(all_classes)))
+    random.seed(seed)
+
+    timer = timeit.default_timer
+    start = timer()
+    schedule, registry = schedule_extension(past_students, all_times, all_rooms, all_classes, all_teachers)
+    scheduled = timer()
+    admit_extension(schedule, registry, all_students, all_times)
+    admitted = timer()
+
+    timings = {
+        'schedule_time': scheduled - start,
+        'admit_time': admitted - scheduled,
+        'total_time': admitted - start,
+    }
+    return timings, sum(len(v[2]) for c, v in schedule.items() if c.has_lab > -1)
+
+
+def sweep(mode, param, values, base, repeats, first_seed, datadir):
+    """ Run every value of one parameter `repeats` times, other parameters stay at the base point
+        Returns:
+            runs (list): one dict per run, see RUN_FIELDS
+    """
+    runs = []
+    for value in values:
+        size = dict(base, **{param: value})
+        if mode == 'basic':
+            try:
+                check_basic_sizes(size['r'], size['c'], size['t'], size['s'])
+            except ValueError as e:
+                print("Skipping %s %s=%d: %s" % (mode, param, value, e))
+                continue
+        for repeat in range(repeats):
+            seed = first_seed + repeat
+            if mode == 'basic':
+                timings, score = run_basic(size, seed)
+            else:
+                timings, score = run_extension(size, seed, datadir)
+            run = {'mode': mode, 'param': param, 'value': value, 'repeat': repeat, 'seed': seed, 'score': score}
+            run.update({k: size.get(k, '') for k in 'scrt'})
+            run.update({k: round(v, 6) for k, v in timings.items()})
+            runs.append(run)
+            print("%s %s=%d repeat %d: %.4fs" % (mode, param, value, repeat, run['total_time']))
+    return runs
+
+
+def fit_exponents(runs):
+    """ Fit time ~ a * size^k to the median of the repeats of every sweep, for every metric
+        Returns:
+            fits (list): dicts with `mode`, `param`, `metric`, `exponent` k and `coefficient` a
+    """
+    fits = []
+    groups = {}
+    for run in runs:
+        groups.setdefault((run['mode'], run['param']), []).append(run)
+    for (mode, param), group in groups.items():
+        values = sorted(set(run['value'] for run in group))
+        if len(values) < 2:
+            continue
+        for metric in METRICS:
+            medians = [np.median([run[metric] for run in group if run['value'] == v]) for v in values]
+            if min(medians) <= 0:
+                continue
+            k, log_a = np.polyfit(np.log(values), np.log(medians), 1)
+            fits.append({'mode': mode, 'param': param, 'metric': metric, 'exponent': round(float(k), 4),
+                         'coefficient': float(np.exp(log_a)), 'values': values,
+                         'medians': [round(float(m), 6) for m in medians]})
+    return fits
+
+
+def plot_fits(fits, outdir):
+    """ Draw one log-log chart per sweep, returns the names of the files written """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed, no charts are drawn.")
+        return []
+
+    charts = []
+    sweeps = {}
+    for fit in fits:
+        sweeps.setdefault((fit['mode'], fit['param']), []).append(fit)
+    for (mode, param), group in sweeps.items():
+        fig, ax = plt.subplots()
+        for fit in group:
+            x = np.array(fit['values'], dtype=float)
+            points = ax.loglog(x, fit['medians'], 'o', label="%s (k = %.2f)" % (fit['metric'], fit['exponent']))
+            ax.loglog(x, fit['coefficient'] * x ** fit['exponent'], '-', color=points[0].get_color())
+        ax.set_xlabel(param)
+        ax.set_ylabel("time (s)")
+        ax.set_title("%s: time vs. %s" % (mode, param))
+        ax.legend()
+        fname = os.path.join(outdir, "%s_%s.png" % (mode, param))
+        fig.savefig(fname)
+        plt.close(fig)
+        charts.append(fname)
+    return charts
+
+
+def compare_to_baseline(fits, baseline, tolerance):
+    """ List the fits whose exponent grew by more than `tolerance` compared to the same fit in `baseline` """
+    old = {(f['mode'], f['param'], f['metric']): f['exponent'] for f in baseline}
+    regressions = []
+    for fit in fits:
+        key = (fit['mode'], fit['param'], fit['metric'])
+        if key in old and fit['exponent'] > old[key] + tolerance:
+            regressions.append("%s %s %s: exponent %.3f, was %.3f" % (key + (fit['exponent'], old[key])))
+    return regressions
+
+
+def write_runs(runs, fname):
+    with open(fname, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RUN_FIELDS)
+        writer.writeheader()
+        writer.writerows(runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Usage: python3 benchmark.py [--mode basic extension] [--param s c r t] [--values ...] '
+                    '[-n <#repeats>] [-d <outdir>]')
+    parser.add_argument('--mode', nargs='+', choices=['basic', 'extension'], default=['basic', 'extension'],
+                        help='which schedulers to benchmark, both by default')
+    parser.add_argument('--param', nargs='+', choices=['s', 'c', 'r', 't'], default=['s', 'c', 'r', 't'],
+                        help='which sizes to sweep, all by default. The extension has no t sweep')
+    parser.add_argument('--values', type=int, nargs='+',
+                        help='values to sweep instead of the default ones, needs exactly one --param')
+    parser.add_argument('--base', type=int, nargs=4, metavar=('S', 'C', 'R', 'T'),
+                        help='base point of the basic sweeps')
+    parser.add_argument('--large', action='store_true',
+                        help='sweep the basic version around a larger base point, up to 10^6 students')
+    parser.add_argument('--repeats', '-n', type=int, default=3, help='runs per point, seeds are seed..seed+n-1')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first repeat')
+    parser.add_argument('--outdir', '-d', type=str, default='benchmark', help='directory for results and charts')
+    parser.add_argument('--data', type=str, default=CODE_DIR,
+                        help="directory with S14Enrollment.txt and the haverfordConstraints files")
+    parser.add_argument('--baseline', type=str, help='benchmark.json of an earlier run to compare exponents to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='how much an exponent may grow over the baseline, 0.2 by default')
+    args = parser.parse_args()
+
+    if args.values and len(args.param) != 1:
+        print("--values needs exactly one --param.")
+        exit(-1)
+
+    basic_base, basic_sweeps = (LARGE_BASE, LARGE_SWEEPS) if args.large else (BASIC_BASE, BASIC_SWEEPS)
+    if args.base:
+        basic_base = dict(zip('scrt', args.base))
+    plan = {'basic': (basic_base, basic_sweeps), 'extension': (EXTENSION_BASE, EXTENSION_SWEEPS)}
+
+    os.makedirs(args.outdir, exist_ok=True)
+    runs = []
+    for mode in args.mode:
+        base, sweeps = plan[mode]
+        for param in args.param:
+            if param not in sweeps:
+                continue
+            runs += sweep(mode, param, args.values or sweeps[param], base, args.repeats, args.seed, args.data)
+
+    fits = fit_exponents(runs)
+    for fit in fits:
+        print("%s, %s sweep, %s ~ %s^%.3f" % (fit['mode'], fit['param'], fit['metric'], fit['param'],
+                                             fit['exponent']))
+
+    results_file = os.path.join(args.outdir, 'benchmark.json')
+    with open(results_file, 'w') as f:
+        json.dump({'repeats': args.repeats, 'seed': args.seed, 'runs': runs, 'fits': fits}, f, indent=2)
+    write_runs(runs, os.path.join(args.outdir, 'benchmark.csv'))
+    charts = plot_fits(fits, args.outdir)
+    print("Results written to", results_file, "and", len(charts), "charts")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(fits, json.load(f)['fits'], args.tolerance)
+        for line in regressions:
+            print("Scaling regression:", line)
+        if regressions:
+            exit(1)
@@ -0,0 +1,228 @@
+#! /usr/bin/env python3
+""" Compiled problem bundles
+
+A bundle is a directory holding one problem instance as NumPy arrays, one `.npy` file per array, plus a
+`meta.json` with the sizes that aren't arrays. Compiling parses the text inputs once; loading memory-maps the
+arrays and builds the scheduler's objects from them without any parsing, so repeated runs over the same term
+skip reading the text files.
+
+Ragged data (preference lists, the classes and unavailable times of every teacher) is stored in CSR form: an
+`_indptr` array and the concatenated values, row i being values[indptr[i]:indptr[i + 1]].
+
+For the extension, teachers' personal conflicts are drawn at random while the constraints are read, so the
+ones drawn at compile time are frozen into the bundle.
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+import numpy as np
+from components import ClassRoom, Course, TimeTable
+from loaders import read_pref_lists, read_constraints, make_students, read_extension_constraints, build_time_table
+
+FORMAT_VERSION = 2
+META_FILE = 'meta.json'
+# the order days of a slot are written in, days that aren't in it follow in the order they're first seen
+WEEK = ['M', 'T', 'W', 'H', 'F', 'S', 'U']
+
+
+def to_csr(rows):
+    """ Turn a list of lists of ints into (indptr, values) """
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rows], out=indptr[1:])
+    values = np.fromiter((v for r in rows for v in r), dtype=np.int64, count=int(indptr[-1]))
+    return indptr, values
+
+
+def from_csr(indptr, values):
+    """ Turn (indptr, values) back into a list of lists """
+    indptr = indptr.tolist()
+    values = values.tolist()
+    return [values[indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1)]
+
+
+def write_bundle(path, kind, arrays, **meta):
+    """ Write `arrays` ({name: ndarray}) and `meta` to the bundle directory `path` """
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array))
+    meta.update({'format': FORMAT_VERSION, 'kind': kind, 'arrays': sorted(arrays)})
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def open_bundle(path, kind=None):
+    """ Memory-map every array of a bundle
+        Args:
+            kind (string): 'basic' or 'extension', raise ValueError if the bundle is of another kind
+        Returns:
+            meta (dict): the contents of meta.json
+            arrays (dict): {name: read-only memory-mapped ndarray}
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_VERSION:
+        raise ValueError("Bundle " + path + " has format " + str(meta.get('format')) + ", expected " +
+                         str(FORMAT_VERSION) + ". Please compile it again.")
+    if kind is not None and meta['kind'] != kind:
+        raise ValueError("Bundle " + path + " holds a " + meta["kind"] + " instance, expected " + kind + ".")
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in meta['arrays']}
+    return meta, arrays
+
+
+def pref_arrays(prefix, ids, indptr, classes):
+    return {prefix + '_ids': ids, prefix + '_indptr': indptr, prefix + '_classes': classes}
+
+
+def teacher_arrays(all_teachers, with_conflicts=False):
+    """ Teachers and their classes (and unavailable times) in CSR form, in the order of `all_teachers` """
+    teachers = list(all_teachers)
+    arrays = {'teacher_ids': np.array(teachers, dtype=np.int64)}
+    if with_conflicts:
+        classes = [all_teachers[t][0] for t in teachers]
+        indptr, values = to_csr([all_teachers[t][1] for t in teachers])
+        arrays.update({'teacher_conflicts_indptr': indptr, 'teacher_conflicts': values})
+    else:
+        classes = [all_teachers[t] for t in teachers]
+    indptr, values = to_csr(classes)
+    arrays.update({'teacher_classes_indptr': indptr, 'teacher_classes': values})
+    return arrays
+
+
+def compile_basic(prefs, constraints, path):
+    """ Compile a basic instance (read_prefs and read_constraints inputs) into a bundle at `path` """
+    ntimes, all_rooms, all_classes, all_teachers = read_constraints(constraints)
+    arrays = {
+        'room_idx': np.array([r.idx for r in all_rooms], dtype=str),
+        'room_capacity': np.array([r.capacity for r in all_rooms], dtype=np.int64),
+        'course_name': np.array([c.name for c in all_classes], dtype=np.int64),
+        'course_teacher': np.array([c.teacher for c in all_classes], dtype=np.int64),
+    }
+    arrays.update(teacher_arrays(all_teachers))
+    arrays.update(pref_arrays('prefs', *read_pref_lists(prefs)))
+    write_bundle(path, 'basic', arrays, ntimes=ntimes)
+
+
+def load_basic(path, compact=False):
+    """ Load a basic bundle
+        Args:
+            compact (bool): return the students as a StudentPool, see make_students
+        Returns:
+            the values of read_prefs and read_constraints: all_students, ntimes, all_rooms, all_classes,
+            all_teachers
+    """
+    meta, a = open_bundle(path, 'basic')
+    all_rooms = [ClassRoom(idx, capacity) for idx, capacity in zip(a['room_idx'].tolist(),
+                                                                     a['room_capacity'].tolist())]
+    all_classes = [Course(name, teacher) for name, teacher in zip(a['course_name'].tolist(),
+                                                                  a['course_teacher'].tolist())]
+    all_teachers = dict(zip(a['teacher_ids'].tolist(), from_csr(a['teacher_classes_indptr'], a['teacher_classes'])))
+    all_students = make_students(a['prefs_ids'], a['prefs_indptr'], a['prefs_classes'], compact)
+    return all_students, meta['ntimes'], all_rooms, all_classes, all_teachers
+
+
+def compile_extension(enrollment, constraints_rt, constraints_c, path, prefs=None):
+    """ Compile the Haverford extension inputs into a bundle at `path`
+        Args:
+            enrollment (string): past enrollment, as for read_enrollment
+            constraints_rt, constraints_c (string): the two constraint files of read_extension_constraints
+            prefs (string): optional preference lists, as for read_extension_prefs
+    """
+    all_times, all_rooms, all_classes, all_teachers = read_extension_constraints(constraints_rt, constraints_c)
+    build_time_table(all_times)
+    slots = sorted(all_times)
+    days = list(WEEK)
+    day_mask = np.zeros(len(slots), dtype=np.int64)
+    for i, t in enumerate(slots):
+        for day in all_times[t][2]:
+            if day not in days:
+                days.append(day)
+            day_mask[i] |= 1 << days.index(day)
+
+    arrays = {
+        'slot_id': np.array(slots, dtype=np.int64),
+        'slot_start': np.array([all_times[t][0] for t in slots], dtype=np.int64),
+        'slot_end': np.array([all_times[t][1] for t in slots], dtype=np.int64),
+        # bit i is set if the slot meets on days[i] of meta.json, days are decoded in that order
+        'slot_days': day_mask,
+        'room_idx': np.array([r.idx for r in all_rooms], dtype=str),
+        'room_capacity': np.array([r.capacity for r in all_rooms], dtype=np.int64),
+        'course_name': np.array([c.name for c in all_classes], dtype=np.int64),
+        'course_teacher': np.array([c.teacher for c in all_classes], dtype=np.int64),
+        'course_lab': np.array([c.has_lab for c in all_classes], dtype=np.int64),
+        'course_dept': np.array([c.dept for c in all_classes], dtype=str),
+        'course_level': np.array([c.level for c in all_classes], dtype=np.int64),
+    }
+    arrays.update(teacher_arrays(all_teachers, with_conflicts=True))
+    arrays.update(pref_arrays('past', *read_pref_lists(enrollment)))
+    if prefs is not None:
+        arrays.update(pref_arrays('prefs', *read_pref_lists(prefs)))
+    write_bundle(path, 'extension', arrays, days=days)
+
+
+def load_extension(path):
+    """ Load an extension bundle
+        Returns:
+            past_students (list): as read_enrollment returns
+            all_times (TimeTable): in 24h clock form with overlaps compiled, as after build_time_table
+            all_rooms, all_classes, all_teachers: as read_extension_constraints returns
+            prefs (tuple): CSR preferences (ids, indptr, classes) that refer to classes by position, None if the
+            bundle has none. Turn them into students with make_extension_students once all_classes is in the
+            order the positions refer to, as read_extension_prefs would.
+    """
+    meta, a = open_bundle(path, 'extension')
+    all_times = TimeTable()
+    days = meta['days']
+    for t, start, end, mask in zip(a['slot_id'].tolist(), a['slot_start'].tolist(), a['slot_end'].tolist(),
+                                   a['slot_days'].tolist()):
+        all_times[t] = [start, end, [day for i, day in enumerate(days) if (mask >> i) & 1]]
+    all_times.compile_overlaps()
+
+    all_rooms = [ClassRoom(idx, capacity) for idx, capacity in zip(a['room_idx'].tolist(),
+                                                                     a['room_capacity'].tolist())]
+    all_classes = []
+    for name, teacher, lab, dept, level in zip(a['course_name'].tolist(), a['course_teacher'].tolist(),
+                                               a['course_lab'].tolist(), a['course_dept'].tolist(),
+                                               a['course_level'].tolist()):
+        course = Course(name, teacher, None, dept, level)
+        course.has_lab = lab
+        all_classes.append(course)
+
+    classes = from_csr(a['teacher_classes_indptr'], a['teacher_classes'])
+    conflicts = from_csr(a['teacher_conflicts_indptr'], a['teacher_conflicts'])
+    all_teachers = defaultdict(list)
+    all_teachers.update((t, [c, u]) for t, c, u in zip(a['teacher_ids'].tolist(), classes, conflicts))
+
+    past_students = make_students(a['past_ids'], a['past_indptr'], a['past_classes'])
+    prefs = None
+    if 'prefs_ids' in a:
+        prefs = (a['prefs_ids'], a['prefs_indptr'], a['prefs_classes'])
+    return past_students, all_times, all_rooms, all_classes, all_teachers, prefs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Usage: python3 bundle.py basic <studentprefs.txt> <constraints.txt> <bundle_dir> or '
+                    'python3 bundle.py extension <S14Enrollment.txt> <haverfordConstraints_1.txt> '
+                    '<haverfordConstraints_2.txt> <bundle_dir> [--prefs <studentprefs.txt>]')
+    modes = parser.add_subparsers(dest='mode')
+    basic = modes.add_parser('basic', help='compile a basic instance')
+    basic.add_argument('prefs', type=str)
+    basic.add_argument('constraints', type=str)
+    basic.add_argument('bundle', type=str)
+    extension = modes.add_parser('extension', help='compile the Haverford extension inputs')
+    extension.add_argument('enrollment', type=str)
+    extension.add_argument('constraints_rt', type=str)
+    extension.add_argument('constraints_c', type=str)
+    extension.add_argument('bundle', type=str)
+    extension.add_argument('--prefs', type=str, help='student preferences to include in the bundle')
+    args = parser.parse_args()
+
+    if args.mode == 'basic':
+        compile_basic(args.prefs, args.constraints, args.bundle)
+    elif args.mode == 'extension':
+        compile_extension(args.enrollment, args.constraints_rt, args.constraints_c, args.bundle, args.prefs)
+    else:
+        parser.print_help()
+        exit(1)
@@ -1,68 +1,79 @@
+""" Files for checking extension schedules with is_valid.pl
+
+is_valid.pl knows neither labs nor readable times, so an extension schedule is checked on three extra files: the
+preferences with class names instead of positions, constraints with rooms numbered by position, and the schedule
+without labs and with room positions. All three are made from the objects in memory, without reading any input
+again, so main.py writes them on a worker thread while it writes the readable schedule.
+"""
+
+import os
 import subprocess
-from collections import OrderedDict
-import pandas as pd
+from collections import namedtuple
+from pool import StudentPool
+from writers import write_schedule, BUFFER_SIZE
+
+# the files handed to is_valid.pl
+PerlFiles = namedtuple('PerlFiles', ['constraints', 'studentprefs', 'schedule'])
 
-def map_prefs_for_perl(i, all_classes):
-    """ Used for map, need all_classes to be global"""
-    return str(all_classes[int(i)-1].name)
 
-def print_prefs(nstudents, all_classes, studentprefs, original_prefs):
-    df = pd.read_csv(original_prefs, skiprows=1, sep="\t", names=['Student', 'Classes'])
-    f = open(studentprefs, 'w')
-    f.write("Students\t"+str(nstudents))
-    for index, row in df.iterrows():
-        f.write("\n"+str(row['Student'])+'\t'+' '.join([map_prefs_for_perl(i, all_classes) for i in row['Classes'].split()]))
-    f.close()
+def perl_files(outfile, prefs_file):
+    """ Where the files for is_valid.pl go: next to the schedule `outfile`, `<name>_test<ext>` for the schedule
+        and the constraints in place of the trailing `schedule` of its name, e.g. 2_extension_schedule.txt gives
+        2_extension_extension_constraints.txt, and `<name>_test.txt` next to the preferences
+        Returns:
+            files (PerlFiles)
+    """
+    stem, ext = os.path.splitext(outfile)
+    if os.path.basename(stem).endswith('schedule'):
+        constraints = stem[:-len('schedule')] + 'extension_constraints.txt'
+    else:
+        constraints = stem + '_extension_constraints.txt'
+    return PerlFiles(constraints, os.path.splitext(prefs_file)[0] + '_test.txt', stem + '_test' + (ext or '.txt'))
+
+
+def print_prefs(all_students, studentprefs):
+    """ Write the preferences of students (Student objects or a StudentPool) with class names """
+    with open(studentprefs, 'w', buffering=BUFFER_SIZE) as f:
+        f.write("Students\t"+str(len(all_students)))
+        if isinstance(all_students, StudentPool):
+            ids = all_students.ids.tolist()
+            indptr = all_students.indptr.tolist()
+            classes = all_students.classes.tolist()
+            rows = ((ids[i], classes[indptr[i]:indptr[i + 1]]) for i in range(len(ids)))
+        else:
+            rows = ((s.idx, s.classes) for s in all_students)
+        for idx, names in rows:
+            f.write("\n"+str(idx)+'\t'+' '.join(map(str, names)))
 
 
 def print_constraints(all_rooms, all_classes, all_times, all_teachers,constraints):
     """
     all_rooms (list): a list of Classroom objects, with attributes `idx` (str) and `capacity` (int)
-    all_classes (list): a list of Course objects, with attributes `name` (str), `teacher` (int), and 
+    all_classes (list): a list of Course objects, with attributes `name` (str), `teacher` (int), and
     `specs` (empty list), `dept` (string), `level` (int), core=False
     all_times (dict): {index_time: [start(int), end(int), day(list of string)]}
     all_teachers (dict): {teacher_id (int): [class_name (int), personal_conflicts (list of ints)]}
     """
-    nrooms = len(all_rooms)
-    ntimes = len(all_times)
-    nteachers = len(all_teachers)
-    nclasses = len(all_classes)
-
-    f = open(constraints, 'w')
-    f.write("Class Times\t"+str(ntimes))
-    f.write("\nRooms\t"+str(nrooms))
-    for i in range(nrooms):
-        f.write("\n"+str(i)+"\t"+str(all_rooms[i].capacity))
-    f.write("\nClasses\t"+str(nclasses))
-    f.write("\nTeachers\t"+str(nteachers))
-    for c in all_classes:
-        f.write("\n"+str(c.name)+"\t"+str(c.teacher))
-    f.close()
+    lines = ["Class Times\t"+str(len(all_times)), "Rooms\t"+str(len(all_rooms))]
+    lines += [str(i)+"\t"+str(room.capacity) for i, room in enumerate(all_rooms)]
+    lines += ["Classes\t"+str(len(all_classes)), "Teachers\t"+str(len(all_teachers))]
+    lines += [str(c.name)+"\t"+str(c.teacher) for c in all_classes]
+    with open(constraints, 'w', buffering=BUFFER_SIZE) as f:
+        f.write("\n".join(lines))
 
 
-
-def print_schedule_call_perl(schedule, fname, all_times, all_rooms, constraints, studentprefs):
-    """ Output schedule using pandas
+def export_for_perl(files, schedule, all_students, all_classes, all_rooms, all_times, all_teachers):
+    """ Write the files for is_valid.pl
         Args:
-            schedule (dict): {Course: (ClassRoom, time, [Students])}
+            files (PerlFiles): from perl_files
+            schedule, all_students, all_classes, all_rooms, all_times, all_teachers: of the extension
     """
-    # create a dictionary for pandas to print
-    schedule = OrderedDict(sorted(schedule.items(), key=lambda t:t[0].name))
+    print_prefs(all_students, files.studentprefs)
+    print_constraints(all_rooms, all_classes, all_times, all_teachers, files.constraints)
+    # labs are left out, is_valid.pl doesn't know about them
+    write_schedule(schedule, files.schedule, all_rooms=all_rooms, skip_labs=True)
+
 
-    f = open(fname, 'w')
-    f.write("Course\tRoom\tTeacher\tTime\tStudents\n")
-    for course in schedule:
-        if course.has_lab > -1:
-            f.write(str(course.name))
-            f.write("\t")
-            f.write(str(all_rooms.index(schedule[course][0])))
-            f.write("\t")
-            f.write(str(course.teacher))
-            f.write("\t")
-            f.write(str(schedule[course][1]))
-            f.write("\t")
-            f.write(' '.join([str(s.idx) for s in sorted(schedule[course][2], key=lambda t: t.idx)]))
-            f.write("\n")
-        #prev_course = course.name
-    f.close()
-    subprocess.call(["perl", "is_valid.pl", constraints, studentprefs, fname])
+def call_perl(files):
+    """ Check the files written by export_for_perl with is_valid.pl """
+    subprocess.call(["perl", "is_valid.pl", files.constraints, files.studentprefs, files.schedule])
@@ -1,3 +1,7 @@
+from bisect import bisect_right
+from instrument import stats
+
+
 class Student:
     """A student is a class containing unique identity and a list of preference classes
         
@@ -7,6 +11,8 @@ class Student:
             taken: list of times this student is unavailable
 
     """
+    __slots__ = ('idx', 'classes', 'taken')
+
     def __init__(self, idx, classes=None):
         self.idx = idx
         if classes is None:
@@ -23,6 +29,8 @@ class ClassRoom:
             capacity: the size of thie room
             
     """
+    __slots__ = ('idx', 'capacity', 'taken')
+
     def __init__(self, idx, size=0):
         self.idx = idx
         self.capacity = size
@@ -40,6 +48,8 @@ class Course:
             specs: Students who will take this class, by defaul an empty list
             dept: four-letter string represeting department number
     """
+    __slots__ = ('name', 'teacher', 'dept', 'level', 'is_core', 'has_lab', 'specs')
+
     def __init__(self, name, teacher, specs=None, dept="", level=0):
         self.name = name
         self.teacher = teacher
@@ -51,3 +61,313 @@ class Course:
             self.specs = []
         else:
             self.specs = specs
+
+
+class CourseRegistry:
+    """An index of Course objects by name, with lectures and labs kept apart
+
+       Args:
+            courses: lecture Course objects to register
+
+       Attributes:
+            lectures: {name: Course} for lectures
+            labs: {name: Course} for lab sections, which share the name of their lecture
+            demand: {name: set of Students} who asked for the lecture, mirrors its `specs`
+    """
+    def __init__(self, courses=()):
+        self.lectures = {}
+        self.labs = {}
+        self.demand = {}
+        for course in courses:
+            self.add(course)
+
+    def add(self, course):
+        # like a scan of the course list, the first course registered under a name wins
+        if course.name not in self.lectures:
+            self.lectures[course.name] = course
+            self.demand[course.name] = set(course.specs)
+
+    def add_lab(self, lab):
+        self.labs[lab.name] = lab
+
+    def lecture(self, name):
+        """ Returns the lecture called `name`, False if there is none """
+        return self.lectures.get(name, False)
+
+    def lab(self, name):
+        """ Returns the lab of the lecture called `name`, False if there is none """
+        return self.labs.get(name, False)
+
+    def add_demand(self, name, student):
+        """ Add a student to the specs of a lecture, returns False if the student was already there """
+        wanted_by = self.demand[name]
+        if student in wanted_by:
+            return False
+        wanted_by.add(student)
+        self.lectures[name].specs.append(student)
+        return True
+
+    def clear_demand(self):
+        for name, course in self.lectures.items():
+            course.specs = []
+            self.demand[name] = set()
+        for lab in self.labs.values():
+            lab.specs = []
+
+    def __contains__(self, name):
+        return name in self.lectures
+
+    def __iter__(self):
+        return iter(self.lectures.values())
+
+    def __len__(self):
+        return len(self.lectures)
+
+
+class TimeTable(dict):
+    """Time slots {index_time: [start (int), end (int), days (list of strings)]} together with the slots they
+       overlap, compiled once by compile_overlaps so that conflict checks are a constant time lookup
+
+       Attributes:
+            overlap: {index_time: int}, bit t2 of overlap[t1] is set if t1 and t2 share a day and their hours
+                     overlap (a slot always overlaps itself)
+            overlap_matrix: boolean array, overlap_matrix[i, j] tells whether slots[i] and slots[j] overlap
+            slots: list of slot indices in the order of overlap_matrix
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.overlap = {}
+        self.overlap_matrix = None
+        self.slots = []
+
+    def compile_overlaps(self):
+        """ Build `overlap` and `overlap_matrix`, the slots must already be in 24h clock form """
+        import numpy as np
+
+        self.slots = sorted(self)
+        n = len(self.slots)
+        start = np.array([self[t][0] for t in self.slots], dtype=np.int64)
+        end = np.array([self[t][1] for t in self.slots], dtype=np.int64)
+        day_bits = {}
+        days = np.zeros(n, dtype=np.int64)
+        for i, t in enumerate(self.slots):
+            for day in self[t][2]:
+                days[i] |= 1 << day_bits.setdefault(day, len(day_bits))
+
+        # the slot that starts later must start before the earlier one ends
+        share_day = (days[:, None] & days[None, :]) != 0
+        first_earlier = start[:, None] <= start[None, :]
+        hours_overlap = np.where(first_earlier, start[None, :] <= end[:, None], start[:, None] <= end[None, :])
+        self.overlap_matrix = share_day & hours_overlap
+
+        # turn every row into a bitmask indexed by slot number
+        slot_ids = np.array(self.slots, dtype=np.int64)
+        width = int(slot_ids.max()) + 1 if n else 0
+        self.overlap = {}
+        for i, t in enumerate(self.slots):
+            row = np.zeros(width, dtype=bool)
+            row[slot_ids[self.overlap_matrix[i]]] = True
+            self.overlap[t] = int.from_bytes(np.packbits(row, bitorder='little').tobytes(), 'little')
+
+    def conflict(self, t1, t2):
+        """ Return true if time slots t1 and t2 overlap """
+        return (self.overlap[t1] >> t2) & 1 == 1
+
+
+class Occupancy:
+    """The times at which rooms and teachers are blocked, kept as integer bitmasks over slot numbers that are
+       closed under slot overlap: bit t is set if t overlaps anything the room or teacher already has
+
+       Args:
+            time_list (TimeTable): the time slots, compiled if that hasn't happened yet
+            all_rooms (list): ClassRoom objects, rooms are referred to by their position in this list
+            teacherList (dict): {teacher_id (int): [class_name (int), personal_conflicts (list of ints)]}
+
+       Attributes:
+            free (FreeSlots): the slots the scheduler skipped and rooms that are still free in them
+    """
+    def __init__(self, time_list, all_rooms, teacherList):
+        if not isinstance(time_list, TimeTable) or not time_list.overlap:
+            time_list = TimeTable(time_list)
+            time_list.compile_overlaps()
+        self.overlap = time_list.overlap
+        self.all_rooms = all_rooms
+        self.room = [self.closure(room.taken) for room in all_rooms]
+        self.teacher = {t: self.closure(teacherList[t][1]) for t in teacherList}
+        self.free = FreeSlots(self.overlap, [room.capacity for room in all_rooms])
+
+    def closure(self, times):
+        """ Returns the mask of all slots overlapping any of `times` """
+        mask = 0
+        for t in times:
+            mask |= self.overlap[t]
+        return mask
+
+    def conflict(self, slot, teacher, index_r):
+        """ Return true if the room at position index_r or the teacher can't take `slot` """
+        stats.count('conflict_checks')
+        return ((self.room[index_r] | self.teacher[teacher]) >> slot) & 1 == 1
+
+    def skip(self, index_r, slot):
+        """ The scheduler passed the room at position index_r at `slot` without using it, keep it in `free` for
+            later classes unless the room is taken then
+        """
+        stats.count('slots_skipped')
+        if not (self.room[index_r] >> slot) & 1:
+            self.free.release(index_r, slot)
+
+    def first_free(self, teacher, times):
+        """ The first skipped (room position, slot) in the scheduler's order whose slot is in the bitmask `times`
+            and that the teacher can take, None if there is none
+        """
+        return self.free.first(times & ~self.teacher[teacher])
+
+    def block_room(self, index_r, slot):
+        self.room[index_r] |= self.overlap[slot]
+        self.all_rooms[index_r].taken.append(slot)
+        self.free.block(index_r, slot)
+
+    def block_teacher(self, teacher, slot):
+        self.teacher[teacher] |= self.overlap[slot]
+
+
+class FreeSlots:
+    """Room-time pairs the scheduler skipped, e.g. because the teacher of the class at hand was busy, and that
+       later classes may still take. Rooms are referred to by their position in the room list, which is sorted
+       by capacity, largest first, and the scheduler's order is by room position, then by slot.
+
+       Every room keeps the slots it's free at as a bitmask, and the rooms are the leaves of a segment tree whose
+       nodes hold the union of the masks below them. A lookup walks down from the root to the first or last room
+       in a range of positions that is free at one of the slots a teacher can use, so it visits O(log r) nodes
+       for r rooms, each one bitmask AND over the t slots (t/64 machine words). Release, claim and block update
+       one leaf and its O(log r) ancestors. Of the slots that room is free at, first takes the earliest in O(1);
+       best_fit with a `load` compares the slots that room is free at, O(t) for that one room.
+
+       Args:
+            overlap (dict): {slot: bitmask of the slots overlapping it} as in TimeTable, None if only equal slots
+            conflict
+            capacities (list): the capacities of the rooms by position, for best_fit
+    """
+    def __init__(self, overlap=None, capacities=()):
+        self.overlap = overlap
+        # negated so that they're ascending, for bisect
+        self.neg_capacities = [-c for c in capacities]
+        self.size = 1
+        while self.size < len(capacities):
+            self.size *= 2
+        # tree[1] is the root, tree[size + r] the free slots of the room at position r
+        self.tree = [0] * (2 * self.size)
+
+    @property
+    def times(self):
+        """ The bitmask of the slots some room is free at """
+        return self.tree[1]
+
+    def __bool__(self):
+        return self.tree[1] != 0
+
+    def _grow(self, index_r):
+        """ Make room for the room at position index_r, doubling the tree as needed """
+        size = self.size
+        while size <= index_r:
+            size *= 2
+        if size == self.size:
+            return
+        leaves = self.tree[self.size:]
+        self.size = size
+        self.tree = [0] * (2 * size)
+        self.tree[size:size + len(leaves)] = leaves
+        for node in range(size - 1, 0, -1):
+            self.tree[node] = self.tree[2 * node] | self.tree[2 * node + 1]
+
+    def _set(self, index_r, mask):
+        """ Make `mask` the free slots of the room at position index_r """
+        tree = self.tree
+        node = self.size + index_r
+        tree[node] = mask
+        node //= 2
+        while node:
+            union = tree[2 * node] | tree[2 * node + 1]
+            if tree[node] == union:
+                break
+            tree[node] = union
+            node //= 2
+
+    def release(self, index_r, slot):
+        """ Make the room at position index_r free at `slot` """
+        if index_r >= self.size:
+            self._grow(index_r)
+        self._set(index_r, self.tree[self.size + index_r] | 1 << slot)
+
+    def claim(self, index_r, slot):
+        """ Take the room at position index_r at `slot` out of the free pairs, if it's there """
+        if index_r < self.size and (self.tree[self.size + index_r] >> slot) & 1:
+            self._set(index_r, self.tree[self.size + index_r] & ~(1 << slot))
+
+    def block(self, index_r, slot):
+        """ The room at position index_r is taken at `slot`, so it isn't free at any slot overlapping it """
+        if self.overlap is None:
+            self.claim(index_r, slot)
+            return
+        if index_r < self.size and self.tree[self.size + index_r] & self.overlap[slot]:
+            self._set(index_r, self.tree[self.size + index_r] & ~self.overlap[slot])
+
+    def _first(self, times):
+        """ The lowest room position free at a slot in `times`, None if there is none """
+        tree = self.tree
+        if not tree[1] & times:
+            return None
+        node = 1
+        while node < self.size:
+            node = 2 * node if tree[2 * node] & times else 2 * node + 1
+        return node - self.size
+
+    def _last(self, times, limit, node=1, lo=0, hi=None):
+        """ The highest room position below `limit` free at a slot in `times`, None if there is none """
+        if hi is None:
+            hi = self.size
+        if lo >= limit or not self.tree[node] & times:
+            return None
+        if node >= self.size:
+            return lo
+        mid = (lo + hi) // 2
+        found = self._last(times, limit, 2 * node + 1, mid, hi)
+        return found if found is not None else self._last(times, limit, 2 * node, lo, mid)
+
+    def first(self, times):
+        """ The first free (room position, slot) in the scheduler's order with a slot in the bitmask `times`,
+            i.e. the largest room free at any of them at its earliest such slot, None if there is none
+        """
+        stats.count('free_slot_lookups')
+        index_r = self._first(times)
+        if index_r is None:
+            return None
+        free = self.tree[self.size + index_r] & times
+        return index_r, (free & -free).bit_length() - 1
+
+    def best_fit(self, times, demand, load=None):
+        """ The free (room position, slot) with a slot in the bitmask `times` whose room is the smallest one that
+            holds `demand` students, the largest free room if none does. Among the slots the room is free at, the
+            one with the smallest `load` (a dict {slot: number}) is chosen, then the earliest one.
+            Returns None if no room is free at any of `times`.
+        """
+        stats.count('free_slot_lookups')
+        # rooms are sorted largest first, so the rooms holding `demand` are the first ones and the highest
+        # position among them is the smallest room
+        index_r = self._last(times, bisect_right(self.neg_capacities, -demand))
+        if index_r is None:
+            index_r = self._first(times)
+            if index_r is None:
+                return None
+        free = self.tree[self.size + index_r] & times
+        slot = (free & -free).bit_length() - 1
+        if load:
+            best = load.get(slot, 0)
+            free ^= 1 << slot
+            while free:
+                low = free & -free
+                free ^= low
+                if load.get(low.bit_length() - 1, 0) < best:
+                    slot = low.bit_length() - 1
+                    best = load[slot]
+        return index_r, slot
@@ -0,0 +1,362 @@
+#! /usr/bin/env python3
+""" Scheduling daemon
+
+Loads one term's constraints once, builds the time table, and for the extension also the schedule made from past
+enrollment, then answers what-if requests over HTTP on localhost. Every request works on its own copy of the warm
+state, so requests are answered concurrently and never change the term.
+
+    POST /schedule   {"prefs": "<student>\\t<class> <class>\\n..." or "students": [[id, [classes]], ...],
+                      "admission": "greedy" | "flow", "rooms": "sweep" | "best-fit", "improve": seconds,
+                      "seed": n, "rows": true}
+        schedules the term for these preferences (in the extension, admits them to the term's schedule) and
+        stores the result
+    POST /admit      {"schedule": id, "prefs" or "students", "admission", "seed", "rows"}
+        admits other preferences to the classes, rooms and times of a stored schedule and stores the result
+    GET /schedules/<id>, DELETE /schedules/<id>
+        a stored schedule with its rows, or forget it
+    GET /term
+        the sizes of the term and the stored schedules
+
+Preferences are given as in preference files: class names for the basic version, class positions for the
+extension. Answers are JSON with the id of the stored schedule, whether it's valid, the errors, the student
+preferences value and, with "rows", the classes with their students. Every request draws its local search and
+admission from a random generator of its own, seeded with its "seed" if it has one, so that the same seed gives
+the same result whatever else is running. "improve" is capped at the daemon's --max-improve seconds.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import timeit
+from collections import OrderedDict
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from bundle import load_basic, load_extension
+from components import CourseRegistry
+from loaders import read_constraints, read_enrollment, read_extension_constraints, make_students, \
+    make_extension_students, parse_pref_lists, build_time_table
+from admission import flow_admit
+from main import schedule_basic, schedule_extension, admit_extension, count_prefs, choose_student
+from pool import StudentPool
+from validator import Validator
+from writers import schedule_rows
+
+
+class RequestError(Exception):
+    """ A request that can't be answered, `status` is the HTTP status to answer with """
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class Term:
+    """ The warm state of one term and the schedules made for it
+
+        Args:
+            kind (string): 'basic' or 'extension'
+            instance (tuple): (ntimes, all_rooms, all_classes, all_teachers) as read_constraints returns them, or
+            (past_students, all_times, all_rooms, all_classes, all_teachers) for the extension, with the time
+            table built
+            keep (int): how many schedules are stored, the oldest ones are forgotten first
+            max_improve (float): the most seconds of local search a request may ask for
+    """
+    def __init__(self, kind, instance, keep=100, max_improve=10.0):
+        self.kind = kind
+        self.instance = instance
+        self.keep = keep
+        self.max_improve = max_improve
+        self.schedules = OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # the extension's schedules from past enrollment, by room assignment, made when first asked for
+        self.bases = {}
+
+    def _base(self, rooms):
+        """ The extension schedule made from past enrollment, before anyone is admitted """
+        with self.lock:
+            if rooms not in self.bases:
+                past_students, all_times, all_rooms, all_classes, all_teachers = deepcopy(self.instance)
+                schedule, registry = schedule_extension(past_students, all_times, all_rooms, all_classes,
+                                                        all_teachers, rooms)
+                self.bases[rooms] = (schedule, registry, all_classes, all_rooms, all_times, all_teachers)
+            return self.bases[rooms]
+
+    def prepare(self):
+        """ Make the default extension schedule now instead of at the first request """
+        if self.kind == 'extension':
+            self._base('sweep')
+
+    def _students(self, request, all_classes):
+        """ Students from the "prefs" or "students" of a request """
+        if 'prefs' in request:
+            text = request['prefs']
+            # a header line is optional
+            if text.startswith('Students'):
+                text = text.partition('\n')[2]
+            try:
+                ids, indptr, classes = parse_pref_lists(text)
+            except ValueError:
+                raise RequestError("preferences must be lines of integers")
+        elif 'students' in request:
+            try:
+                rows = [(int(idx), [int(c) for c in classes]) for idx, classes in request['students']]
+            except (TypeError, ValueError):
+                raise RequestError('"students" must be a list of [id, [classes]]')
+            ids = np.array([idx for idx, classes in rows], dtype=np.int64)
+            indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum([len(classes) for idx, classes in rows], out=indptr[1:])
+            classes = np.array([c for idx, cs in rows for c in cs], dtype=np.int64)
+        else:
+            raise RequestError('give the preferences as "prefs" or "students"')
+        if self.kind == 'basic':
+            return make_students(ids, indptr, classes)
+        try:
+            return make_extension_students(all_classes, ids, indptr, classes)
+        except IndexError:
+            raise RequestError("a preference is out of range, there are %d classes" % len(all_classes))
+
+    def _rng(self, request):
+        """ The random generator of a request, seeded with its "seed" if it has one """
+        seed = request.get('seed')
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, (int, str))):
+            raise RequestError('"seed" must be an integer or a string')
+        return random.Random(seed)
+
+    def _improve(self, request):
+        """ The seconds of local search a request asks for, at most max_improve """
+        try:
+            improve = float(request.get('improve', 0))
+        except (TypeError, ValueError):
+            raise RequestError('"improve" must be a number of seconds')
+        # NaN fails this too
+        if not improve >= 0:
+            raise RequestError('"improve" must be a number of seconds, not %r' % request['improve'])
+        return min(improve, self.max_improve)
+
+    def _store(self, schedule, registry, all_classes, all_rooms, all_times):
+        with self.lock:
+            key = next(self.ids)
+            self.schedules[key] = (schedule, registry, all_classes, all_rooms, all_times)
+            while len(self.schedules) > self.keep:
+                self.schedules.popitem(last=False)
+        return key
+
+    def _answer(self, key, schedule, all_students, all_classes, all_times, request, start):
+        report = Validator(all_students, all_classes, all_times).validate(schedule)
+        answer = {'schedule': key, 'valid': report.valid, 'errors': report.errors, 'score': report.score,
+                  'seconds': round(timeit.default_timer() - start, 4)}
+        if request.get('rows'):
+            answer['rows'] = self.rows(schedule, all_times)
+        return answer
+
+    def rows(self, schedule, all_times=None):
+        return [{'course': name, 'room': room, 'teacher': teacher, 'time': time, 'students': ids.tolist()}
+                for name, room, teacher, time, ids in schedule_rows(schedule, all_times)]
+
+    def schedule(self, request):
+        """ Answer POST /schedule """
+        start = timeit.default_timer()
+        admission = request.get('admission', 'greedy')
+        rooms = request.get('rooms', 'sweep')
+        improve = self._improve(request)
+        if admission not in ('greedy', 'flow') or rooms not in ('sweep', 'best-fit'):
+            raise RequestError('"admission" is greedy or flow, "rooms" is sweep or best-fit')
+        rng = self._rng(request)
+
+        if self.kind == 'basic':
+            ntimes, all_rooms, all_classes, all_teachers = deepcopy(self.instance)
+            all_students = self._students(request, all_classes)
+            schedule = schedule_basic(all_students, ntimes, all_rooms, all_classes, all_teachers, admission, improve,
+                                      rooms, rng)
+            registry = CourseRegistry(all_classes)
+            all_times = None
+        else:
+            schedule, registry, all_classes, all_rooms, all_times, all_teachers = deepcopy(self._base(rooms))
+            all_students = self._students(request, all_classes)
+            admit_extension(schedule, registry, all_students, all_times, admission, improve, all_rooms, all_teachers,
+                            rng)
+        key = self._store(schedule, registry, all_classes, all_rooms, all_times)
+        return self._answer(key, schedule, all_students, all_classes, all_times, request, start)
+
+    def admit(self, request):
+        """ Answer POST /admit """
+        start = timeit.default_timer()
+        with self.lock:
+            stored = self.schedules.get(request.get('schedule'))
+            if stored is None:
+                raise RequestError("no schedule %r" % request.get('schedule'), 404)
+            schedule, registry, all_classes, all_rooms, all_times = deepcopy(stored)
+        admission = request.get('admission', 'greedy')
+        if admission not in ('greedy', 'flow'):
+            raise RequestError('"admission" is greedy or flow')
+        rng = self._rng(request)
+
+        # the same classes, rooms and times, without students
+        for course in schedule:
+            room, time, students = schedule[course]
+            schedule[course] = (room, time, [])
+        registry.clear_demand()
+        all_students = self._students(request, all_classes)
+
+        if self.kind == 'extension':
+            admit_extension(schedule, registry, all_students, all_times, admission, rng=rng)
+        else:
+            count_prefs(registry, all_students)
+            pool = all_students if isinstance(all_students, StudentPool) else None
+            if admission == 'flow':
+                flow_admit(schedule, pool=pool)
+            else:
+                choose_student(schedule, pool, rng)
+        key = self._store(schedule, registry, all_classes, all_rooms, all_times)
+        return self._answer(key, schedule, all_students, all_classes, all_times, request, start)
+
+    def get(self, key):
+        """ Answer GET /schedules/<id> """
+        with self.lock:
+            stored = self.schedules.get(key)
+        if stored is None:
+            raise RequestError("no schedule %r" % key, 404)
+        schedule, registry, all_classes, all_rooms, all_times = stored
+        return {'schedule': key, 'rows': self.rows(schedule, all_times)}
+
+    def forget(self, key):
+        """ Answer DELETE /schedules/<id> """
+        with self.lock:
+            if self.schedules.pop(key, None) is None:
+                raise RequestError("no schedule %r" % key, 404)
+        return {'schedule': key, 'deleted': True}
+
+    def describe(self):
+        """ Answer GET /term """
+        rooms, classes, teachers = self.instance[-3:]
+        times = self.instance[0] if self.kind == 'basic' else len(self.instance[1])
+        with self.lock:
+            stored = list(self.schedules)
+        return {'kind': self.kind, 'times': times, 'rooms': len(rooms), 'classes': len(classes),
+                'teachers': len(teachers), 'schedules': stored}
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ Routes requests to the Term of the server """
+    quiet = False
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        term = self.server.term
+        try:
+            match = re.fullmatch(r'/schedules/(\d+)', self.path)
+            if method == 'GET' and self.path == '/term':
+                answer = term.describe()
+            elif method == 'GET' and match:
+                answer = term.get(int(match.group(1)))
+            elif method == 'DELETE' and match:
+                answer = term.forget(int(match.group(1)))
+            elif method == 'POST' and self.path in ('/schedule', '/admit'):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    raise RequestError("the body must be JSON")
+                if not isinstance(request, dict):
+                    raise RequestError("the body must be a JSON object")
+                answer = term.schedule(request) if self.path == '/schedule' else term.admit(request)
+            else:
+                raise RequestError("no such endpoint: %s %s" % (method, self.path), 404)
+        except RequestError as e:
+            self._reply(e.status, {'error': str(e)})
+            return
+        except Exception as e:
+            # keep serving, the term is never changed by a request
+            self.log_error("%s %s failed: %r", method, self.path, e)
+            self._reply(500, {'error': repr(e)})
+            return
+        self._reply(200, answer)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def load_term(args):
+    """ Read the term given on the command line, returns kind and instance as Term takes them """
+    if args.extension:
+        if args.bundle:
+            past_students, all_times, all_rooms, all_classes, all_teachers, prefs = load_extension(args.bundle)
+        else:
+            past_students = read_enrollment(args.infiles[0])
+            all_times, all_rooms, all_classes, all_teachers = read_extension_constraints(args.infiles[1],
+                                                                                         args.infiles[2])
+            build_time_table(all_times)
+        return 'extension', (past_students, all_times, all_rooms, all_classes, all_teachers)
+    if args.bundle:
+        all_students, ntimes, all_rooms, all_classes, all_teachers = load_basic(args.bundle)
+    else:
+        ntimes, all_rooms, all_classes, all_teachers = read_constraints(args.infiles[0])
+    return 'basic', (ntimes, all_rooms, all_classes, all_teachers)
+
+
+def serve(term, host='127.0.0.1', port=8765, quiet=False):
+    """ Answer requests about `term` until interrupted """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.term = term
+    Handler.quiet = quiet
+    print("Serving the %s term on http://%s:%d" % (term.kind, host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Usage: python3 daemon.py <basic_constraints.txt> | '
+                    '<enrollment.txt> <extension_constraints-1.txt> <extension_constraints-2.txt> --extension')
+    parser.add_argument('infiles', type=str, nargs='*',
+                        help='the constraints of the term: the basic constraints, or for the extension the past '
+                             'enrollment and the two constraint files')
+    parser.add_argument('--extension', action='store_true',
+                        help="serve a Haverford extension term")
+    parser.add_argument('--bundle', type=str,
+                        help="load the term from a directory compiled by bundle.py instead of the text files")
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help="the address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765,
+                        help="the port to listen on (default: 8765)")
+    parser.add_argument('--keep', type=int, default=100,
+                        help="how many schedules are kept for /admit and /schedules (default: 100)")
+    parser.add_argument('--max-improve', type=float, default=10.0, metavar='SECONDS',
+                        help="the most seconds of local search a request may ask for (default: 10)")
+    parser.add_argument('--quiet', action='store_true',
+                        help="don't log every request")
+    args = parser.parse_args()
+    if not args.bundle and len(args.infiles) < (3 if args.extension else 1):
+        parser.error("not enough input files")
+
+    if not args.max_improve >= 0:
+        parser.error("--max-improve must be at least 0")
+
+    term = Term(*load_term(args), keep=args.keep, max_improve=args.max_improve)
+    term.prepare()
+    serve(term, args.host, args.port, args.quiet)
@@ -0,0 +1,208 @@
+#! /usr/bin/env python3
+""" Random problem instances
+
+A NumPy replacement for make_random_input.pl and make_random_input_e_student.pl. It draws the same
+distributions, writes the same file formats, and can also hand an instance straight to the scheduler without
+touching the disk. Preference lists are sampled for a whole chunk of students at once and written chunk by
+chunk, so files with millions of students can be generated with bounded memory.
+"""
+
+import argparse
+import numpy as np
+from components import ClassRoom, Course
+from loaders import make_students, make_extension_students
+
+MAX_ROOM_CAPACITY = 1000
+MIN_ROOM_CAPACITY = 10
+CLASSES_PER_STUDENT = 4
+
+# make_random_input_e_student.pl draws from the first 260 classes, 2 to 5 per student
+EXTENSION_CLASSES = 260
+EXTENSION_MIN_CLASSES = 2
+EXTENSION_MAX_CLASSES = 5
+
+# number of students sampled and written at a time
+CHUNK_SIZE = 100000
+
+
+def check_basic_sizes(nr, nc, nt, ns):
+    """ Raise ValueError for sizes make_random_input.pl would refuse """
+    if nc % 2 != 0:
+        raise ValueError("The number of classes must be even, since we're assuming each teacher teaches 2 classes.")
+    if nc * MAX_ROOM_CAPACITY < ns * CLASSES_PER_STUDENT:
+        raise ValueError("The number of students must be less than the number of classes times one-forth the max "
+                         "room capacity.")
+    if nc > nt * nr:
+        raise ValueError("The number of classes must not be greater than the number of time slots times the number "
+                         "of rooms in order for all classes to be scheduled.")
+    if nr * MAX_ROOM_CAPACITY * nt < CLASSES_PER_STUDENT * ns:
+        raise ValueError("The total room capacities over all time slots must be large enough to hold all the "
+                         "students for 4 classes.")
+
+
+def sample_constraints(nr, nc, rng):
+    """ Draw room capacities and the teacher of every class
+        Returns:
+            capacities (ndarray): capacity of rooms 1..nr
+            teachers (ndarray): teacher of classes 1..nc, every teacher teaches exactly two classes
+    """
+    capacities = rng.integers(MIN_ROOM_CAPACITY, MAX_ROOM_CAPACITY, size=nr)
+    teachers = rng.permutation(np.repeat(np.arange(1, nc // 2 + 1), 2))
+    return capacities, teachers
+
+
+def sample_prefs(ns, nclasses, rng, min_classes=CLASSES_PER_STUDENT, max_classes=CLASSES_PER_STUDENT):
+    """ Draw distinct preferences for `ns` students
+        Args:
+            nclasses (int): classes are numbered 1..nclasses
+            min_classes, max_classes (int): every student asks for a uniformly drawn number of classes in this range
+        Returns:
+            indptr (ndarray): student i asks for classes[indptr[i]:indptr[i + 1]]
+            classes (ndarray): all preference lists concatenated
+    """
+    if nclasses < max_classes:
+        raise ValueError("Can't draw %d distinct classes out of %d." % (max_classes, nclasses))
+    if nclasses <= 4 * max_classes:
+        # few classes to choose from, rejection would be slow
+        choices = rng.random((ns, nclasses)).argsort(axis=1)[:, :max_classes] + 1
+    else:
+        choices = rng.integers(1, nclasses + 1, size=(ns, max_classes))
+        while True:
+            ordered = np.sort(choices, axis=1)
+            redo = np.flatnonzero((ordered[:, 1:] == ordered[:, :-1]).any(axis=1))
+            if len(redo) == 0:
+                break
+            choices[redo] = rng.integers(1, nclasses + 1, size=(len(redo), max_classes))
+
+    lengths = rng.integers(min_classes, max_classes + 1, size=ns)
+    keep = np.arange(max_classes) < lengths[:, None]
+    indptr = np.zeros(ns + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    return indptr, choices[keep]
+
+
+def iter_prefs(ns, nclasses, seed=None, min_classes=CLASSES_PER_STUDENT, max_classes=CLASSES_PER_STUDENT,
+               chunk_size=CHUNK_SIZE):
+    """ Yield (ids, indptr, classes) chunks of random preferences, students are numbered from 1 """
+    rng = np.random.default_rng(seed)
+    for first in range(0, ns, chunk_size):
+        count = min(chunk_size, ns - first)
+        indptr, classes = sample_prefs(count, nclasses, rng, min_classes, max_classes)
+        yield np.arange(first + 1, first + count + 1), indptr, classes
+
+
+def random_prefs(ns, nclasses, seed=None, min_classes=CLASSES_PER_STUDENT, max_classes=CLASSES_PER_STUDENT):
+    """ Draw random preferences for all students at once, as CSR arrays like read_pref_lists returns """
+    indptr, classes = sample_prefs(ns, nclasses, np.random.default_rng(seed), min_classes, max_classes)
+    return np.arange(1, ns + 1), indptr, classes
+
+
+def write_prefs(fname, ns, nclasses, seed=None, min_classes=CLASSES_PER_STUDENT, max_classes=CLASSES_PER_STUDENT):
+    """ Stream random preferences to `fname` in the format read_prefs expects """
+    with open(fname, 'w') as f:
+        f.write("Students\t" + str(ns) + "\n")
+        for chunk in iter_prefs(ns, nclasses, seed, min_classes, max_classes):
+            f.write(format_prefs(*chunk))
+
+
+def format_prefs(ids, indptr, classes):
+    """ Format CSR preferences as `<student>\t<class> <class> ...` lines
+        Every token is followed by its separator, the pieces are laid out in one array and joined once rather
+        than line by line.
+    """
+    n = len(ids)
+    lengths = np.diff(indptr)
+    row_start = 2 * (indptr[:-1] + np.arange(n))
+    token = row_start.repeat(lengths) + 2 + 2 * (np.arange(len(classes)) - indptr[:-1].repeat(lengths))
+    pieces = np.full(2 * (n + len(classes)), " ", dtype=object)
+    pieces[row_start] = list(map(str, ids.tolist()))
+    pieces[row_start + 1] = "\t"
+    if len(classes):
+        # there are few distinct classes, so convert each of them to a string only once
+        labels = np.array([str(c) for c in range(classes.max() + 1)], dtype=object)
+        pieces[token] = labels[classes]
+    pieces[2 * (indptr[1:] + np.arange(n)) + 1] = "\n"
+    return "".join(pieces.tolist())
+
+
+def write_constraints(fname, capacities, ntimes, teachers):
+    """ Write rooms and teachers in the format read_constraints expects """
+    with open(fname, 'w') as f:
+        f.write("Class Times\t" + str(ntimes) + "\n")
+        f.write("Rooms\t" + str(len(capacities)) + "\n")
+        f.write("".join(str(r + 1) + "\t" + str(c) + "\n" for r, c in enumerate(capacities.tolist())))
+        f.write("Classes\t" + str(len(teachers)) + "\n")
+        f.write("Teachers\t" + str(len(teachers) // 2) + "\n")
+        f.write("".join(str(c + 1) + "\t" + str(t) + "\n" for c, t in enumerate(teachers.tolist())))
+
+
+def write_basic_instance(nr, nc, nt, ns, constraints, prefs, seed=None):
+    """ Write a random basic instance, like make_random_input.pl but overwriting existing files """
+    check_basic_sizes(nr, nc, nt, ns)
+    seeds = np.random.SeedSequence(seed).spawn(2)
+    capacities, teachers = sample_constraints(nr, nc, np.random.default_rng(seeds[0]))
+    write_constraints(constraints, capacities, nt, teachers)
+    write_prefs(prefs, ns, nc, seeds[1])
+
+
+def random_basic_instance(nr, nc, nt, ns, seed=None):
+    """ Make a random basic instance in memory
+        Returns:
+            the values read_prefs and read_constraints would return for the same instance written to disk:
+            all_students, ntimes, all_rooms, all_classes, all_teachers
+    """
+    check_basic_sizes(nr, nc, nt, ns)
+    seeds = np.random.SeedSequence(seed).spawn(2)
+    capacities, teachers = sample_constraints(nr, nc, np.random.default_rng(seeds[0]))
+    all_rooms = [ClassRoom(str(r + 1), c) for r, c in enumerate(capacities.tolist())]
+    all_classes = [Course(c + 1, t) for c, t in enumerate(teachers.tolist())]
+    all_teachers = {t: [] for t in range(1, nc // 2 + 1)}
+    for c in all_classes:
+        all_teachers[c.teacher].append(c.name)
+
+    ids, indptr, classes = random_prefs(ns, nc, seeds[1])
+    return make_students(ids, indptr, classes), nt, all_rooms, all_classes, all_teachers
+
+
+def write_extension_prefs(fname, ns, seed=None, nclasses=EXTENSION_CLASSES):
+    """ Write random preferences for the Haverford extension, like make_random_input_e_student.pl """
+    write_prefs(fname, ns, nclasses, seed, EXTENSION_MIN_CLASSES, EXTENSION_MAX_CLASSES)
+
+
+def random_extension_students(ns, all_classes, seed=None, nclasses=EXTENSION_CLASSES):
+    """ Make random extension preferences in memory, mapped to class names the way read_extension_prefs does
+        Returns:
+            all_students (list): a list of Student objects, `classes` hold names of Courses in all_classes
+    """
+    ids, indptr, classes = random_prefs(ns, nclasses, seed, EXTENSION_MIN_CLASSES, EXTENSION_MAX_CLASSES)
+    return make_extension_students(all_classes, ids, indptr, classes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Usage: python3 generator.py basic <#rooms> <#classes> <#times> <#students> <constraints.txt> '
+                    '<studentprefs.txt> or python3 generator.py extension <#students> <studentprefs.txt>')
+    parser.add_argument('--seed', type=int, help='seed for a reproducible instance')
+    modes = parser.add_subparsers(dest='mode')
+    basic = modes.add_parser('basic', help='random rooms, classes, teachers and preferences')
+    for arg in ['nrooms', 'nclasses', 'ntimes', 'nstudents']:
+        basic.add_argument(arg, type=int)
+    basic.add_argument('constraints', type=str)
+    basic.add_argument('prefs', type=str)
+    extension = modes.add_parser('extension', help='random preferences for the Haverford extension')
+    extension.add_argument('nstudents', type=int)
+    extension.add_argument('prefs', type=str)
+    args = parser.parse_args()
+
+    try:
+        if args.mode == 'basic':
+            write_basic_instance(args.nrooms, args.nclasses, args.ntimes, args.nstudents, args.constraints,
+                                 args.prefs, args.seed)
+        elif args.mode == 'extension':
+            write_extension_prefs(args.prefs, args.nstudents, args.seed)
+        else:
+            parser.print_help()
+            exit(1)
+    except ValueError as e:
+        print(e)
+        exit(1)
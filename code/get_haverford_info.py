@@ -1,108 +1,103 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 import csv
 import sys
-from collections import OrderedDict
-
-def get_data_list_of_dicts(filename):
-  list = []
-  with open(filename) as f:
-    f_csv = csv.DictReader(f)
-    for row in f_csv:
-      list.append(row)
-  return list
-
-def get_room_sizes(list_of_dicts):
-  room_sizes_dict = {}
-  for dict in list_of_dicts:
-    room = dict["Facil ID 1"]
-    status = dict["Status"]
-    course = dict["Course ID"]
-    campus = dict["College"]
-    if status == "E" and campus == "H" and not room == "":
-      if room in room_sizes_dict:
-        if course in room_sizes_dict[room]:
-          room_sizes_dict[room][course] = room_sizes_dict[room][course] + 1
+
+# columns of the registrar export this script reads
+COLUMNS = ["Student", "Course ID", "Subject", "College", "Level", "Section", "Status", "Unit Taken",
+           "Instructor ID", "Srt1 AM/PM", "End 1 AMPM", "Days 1", "Facil ID 1"]
+
+class Enrollment:
+  """ Everything the output files need, collected in one pass over the export
+
+      Attributes:
+        room_sizes (dict): {room: {course: number of enrolled Haverford students}}
+        student_prefs (dict): {student: [courses the student is enrolled in]}
+        courses (dict): {course: (instructor, subject, level)} of Haverford courses with units
+        labs (dict): {course + "L": (instructor, subject, level)} of Haverford lab sections
+        prof_courses (dict): {instructor: set of courses} of Haverford instructors
+        class_times (dict): {(start, end, days): None} of Haverford meeting times, in order of appearance
+  """
+  def __init__(self):
+    self.room_sizes = {}
+    self.student_prefs = {}
+    self.courses = {}
+    self.labs = {}
+    self.prof_courses = {}
+    self.class_times = {}
+
+def read_enrollment_csv(filename, colleges=("H",)):
+  """ Stream the enrollment export once and fill every aggregate, only the fields used are kept per row. Rooms,
+      courses, labs, instructors and times come from the rows of `colleges` (values of the College column), the
+      preferences of students from every row.
+  """
+  data = Enrollment()
+  room_sizes = data.room_sizes
+  student_prefs = data.student_prefs
+  courses = data.courses
+  labs = data.labs
+  prof_courses = data.prof_courses
+  class_times = data.class_times
+
+  with open(filename, newline='') as f:
+    reader = csv.reader(f)
+    header = next(reader)
+    try:
+      (i_student, i_course, i_subject, i_campus, i_level, i_section, i_status, i_units, i_prof, i_start,
+       i_end, i_days, i_room) = [header.index(column) for column in COLUMNS]
+    except ValueError:
+      print("Missing column in " + filename + ", expected all of: " + ", ".join(COLUMNS))
+      exit(1)
+
+    for row in reader:
+      course = row[i_course]
+      enrolled = row[i_status] == "E"
+      if enrolled:
+        student = row[i_student]
+        if student in student_prefs:
+          student_prefs[student].append(course)
+        else:
+          student_prefs[student] = [course]
+      if row[i_campus] not in colleges:
+        continue
+
+      room = row[i_room]
+      if enrolled and room != "":
+        counts = room_sizes.get(room)
+        if counts is None:
+          counts = room_sizes[room] = {}
+        counts[course] = counts.get(course, 0) + 1
+
+      units = row[i_units]
+      if units != "0":
+        if course not in courses:
+          courses[course] = (row[i_prof], row[i_subject], row[i_level])
+      elif row[i_section].startswith("00") and course != "297" and course + "L" not in labs:
+        labs[course + "L"] = (row[i_prof], row[i_subject], row[i_level])
+
+      prof = row[i_prof]
+      if prof != "":
+        if prof in prof_courses:
+          prof_courses[prof].add(course)
         else:
-          room_sizes_dict[room][course] = 1
-      else:
-        room_sizes_dict[room] = {}
-        room_sizes_dict[room][course] = 1
-
-  room_capacities = {}
-  for room in room_sizes_dict:
-    capacity = 0
-    for course in room_sizes_dict[room]:
-      if room_sizes_dict[room][course] > capacity:
-        capacity = room_sizes_dict[room][course]
-    room_capacities[room] = capacity
-  return room_capacities
-
-def get_student_prefs_enrolled(list_of_dicts):
-  student_prefs = {}
-  for dict in list_of_dicts:
-    student = dict["Student"]
-    course = dict["Course ID"]
-    status = dict["Status"]
-    if status == "E":
-      if student in student_prefs:
-        student_prefs[student].append(course)
-      else:
-        student_prefs[student] = [course]
-  return student_prefs
-
-def get_courses(list_of_dicts):
-  courses = {}
-  for dict in list_of_dicts: 
-    course = dict["Course ID"]
-    campus = dict["College"]
-    units = dict["Unit Taken"]
-    if not course in courses and campus == "H" and units != "0":
-      courses[course] = dict
-  labs = get_labs(list_of_dicts)
-  courses.update(labs)
+          prof_courses[prof] = {course}
+
+      start = row[i_start]
+      end = row[i_end]
+      days = row[i_days]
+      if start != "" and end != "" and days != "":
+        class_times[(start, end, days)] = None
+  return data
+
+def get_room_sizes(data):
+  """ The capacity of a room is the largest number of students enrolled in one course there """
+  return {room: max(counts.values()) for room, counts in data.room_sizes.items()}
+
+def get_courses(data):
+  courses = dict(data.courses)
+  courses.update(data.labs)
   return courses
 
-
-def get_labs(list_of_dicts):
-  labs = {}
-  for dict in list_of_dicts: 
-    course = dict["Course ID"]
-    campus = dict["College"]
-    section = dict["Section"]
-    days = dict["Days 1"]
-    units = dict["Unit Taken"]
-    if section.startswith("00") and not (course+"L" in labs) and units == "0" and campus == "H" and course != "297":
-      labs[course + "L"] = dict
-  return labs
-
-def get_prof_courses(list_of_dicts):
-  profs = {}
-  for dict in list_of_dicts:
-    prof = dict["Instructor ID"]
-    course = dict["Course ID"]
-    campus = dict["College"]
-    if not prof == "" and campus == "H":
-      if prof in profs:
-        if not course in profs[prof]:
-          profs[prof].append(course)
-      else:
-        profs[prof] = [course]
-  return profs 
-
-def get_class_times(list_of_dicts):
-  times = []
-  for dict in list_of_dicts:
-    start = dict["Srt1 AM/PM"]
-    end = dict["End 1 AMPM"]
-    days = dict["Days 1"]
-    class_time = (start, end, days)
-    campus = dict["College"]
-    if not class_time in times and campus == "H" and not start == "" \
-        and not end == "" and not days == "":
-      times.append(class_time)
-  return times
-
 # One possibility for how to find out which labs go with which courses.
 # Currently catches some "labs" that aren't actually labs for those courses.
 # Course '333' seems especially to be a strange corner case.
@@ -137,76 +132,52 @@ def get_class_times(list_of_dicts):
 #              lab_courses[enrolled_course] = [course]
 #  return lab_courses
 
-def write_prefs_to_file(list_of_dicts, filename):
-  student_prefs = get_student_prefs_enrolled(list_of_dicts)
-  f = open(filename, 'w')
-  f.write("Students\t" + str(len(student_prefs)) + "\n")
-  for student in student_prefs:
-    towrite = student + "\t"
-    for course in student_prefs[student]:
-      towrite = towrite + course + " "
-    towrite = towrite + "\n"
-    f.write(towrite)
-
-def write_class_times_to_file(list_of_dicts, f):
-  class_times = get_class_times(list_of_dicts)
+def write_prefs_to_file(data, filename):
+  student_prefs = data.student_prefs
+  with open(filename, 'w') as f:
+    f.write("Students\t" + str(len(student_prefs)) + "\n")
+    f.writelines(student + "\t" + "".join(course + " " for course in courses) + "\n"
+                 for student, courses in student_prefs.items())
+
+def write_class_times_to_file(data, f):
+  class_times = data.class_times
   f.write("Class Times\t" + str(len(class_times)) + "\n")
-  i = 1
-  for (start, end, days) in class_times:
-    f.write(str(i) + "\t" + start + " " + end + " " + days + "\n")
-    i = i + 1
+  f.writelines(str(i) + "\t" + start + " " + end + " " + days + "\n"
+               for i, (start, end, days) in enumerate(class_times, 1))
 
-def write_rooms_to_file(list_of_dicts, f):
-  room_capacities = get_room_sizes(list_of_dicts)
+def write_rooms_to_file(data, f):
+  room_capacities = get_room_sizes(data)
   f.write("Rooms\t" + str(len(room_capacities)) + "\n")
-  for room in room_capacities:
-    f.write(room + "\t" + str(room_capacities[room]) + "\n")
-
-def write_num_classes_to_file(list_of_dicts, f):
-  num_classes = len(get_courses(list_of_dicts))
-  f.write("Classes\t" + str(num_classes) + "\n") 
-
-def write_teachers_to_file(list_of_dicts, f):
-  courses = get_courses(list_of_dicts)
-  for course in courses:
-    f.write(course + "\t")
-    f.write(courses[course]["Instructor ID"])
-    f.write("\t")
-    f.write(courses[course]["Subject"])
-    f.write("\t")
-    f.write(courses[course]["Level"])
-    f.write("\n")
-
-
-def write_time_rooms_to_file(list_of_dicts, filename):
-  prof_courses = get_prof_courses(list_of_dicts)
-  num_profs = len(prof_courses)
-  f = open(filename, 'w')
-  write_class_times_to_file(list_of_dicts, f)
-  write_rooms_to_file(list_of_dicts, f)
-  f.write("Teachers\t" + str(num_profs) + "\n")
-  write_num_classes_to_file(list_of_dicts, f)
-  f.close()
-
-def write_classes_to_file(list_of_dicts, filename): 
-  courses = OrderedDict(sorted(get_courses(list_of_dicts).iteritems(), key=lambda x: x[0]))
-  f = open(filename, 'w')
-  for course in courses:
-    f.write(course + "\t")
-    f.write(courses[course]["Instructor ID"])
-    f.write("\t")
-    f.write(courses[course]["Subject"])
-    f.write("\t")
-    f.write(courses[course]["Level"])
-    f.write("\n")
-  f.close()
-
-if len(sys.argv) != 5:
-  print ("Usage: " + sys.argv[0] + " <enrollment.csv> <student_prefs.txt> <room_time.txt> <class_dept_level.txt>")
-  exit(1) 
-list_of_dicts = get_data_list_of_dicts(sys.argv[1])
-write_prefs_to_file(list_of_dicts, sys.argv[2])
-write_time_rooms_to_file(list_of_dicts, sys.argv[3])
-write_classes_to_file(list_of_dicts, sys.argv[4])
-
-
+  f.writelines(room + "\t" + str(capacity) + "\n" for room, capacity in room_capacities.items())
+
+def write_num_classes_to_file(data, f):
+  num_classes = len(get_courses(data))
+  f.write("Classes\t" + str(num_classes) + "\n")
+
+def write_teachers_to_file(data, f):
+  courses = get_courses(data)
+  f.writelines(course + "\t" + "\t".join(courses[course]) + "\n" for course in courses)
+
+def write_time_rooms_to_file(data, filename):
+  num_profs = len(data.prof_courses)
+  with open(filename, 'w') as f:
+    write_class_times_to_file(data, f)
+    write_rooms_to_file(data, f)
+    f.write("Teachers\t" + str(num_profs) + "\n")
+    write_num_classes_to_file(data, f)
+
+def write_classes_to_file(data, filename):
+  courses = get_courses(data)
+  with open(filename, 'w') as f:
+    f.writelines(course + "\t" + "\t".join(courses[course]) + "\n" for course in sorted(courses))
+
+if __name__ == "__main__":
+  if len(sys.argv) not in (5, 6):
+    print ("Usage: " + sys.argv[0] + " <enrollment.csv> <student_prefs.txt> <room_time.txt> <class_dept_level.txt>"
+           " [<colleges, e.g. H,B (default: H)>]")
+    exit(1)
+  colleges = sys.argv[5].split(",") if len(sys.argv) == 6 else ["H"]
+  data = read_enrollment_csv(sys.argv[1], colleges)
+  write_prefs_to_file(data, sys.argv[2])
+  write_time_rooms_to_file(data, sys.argv[3])
+  write_classes_to_file(data, sys.argv[4])
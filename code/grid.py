@@ -0,0 +1,319 @@
+""" Schedules as a room x time grid
+
+A ScheduleGrid keeps a schedule the way the complexity analysis of the scheduler counts it: an array with a cell
+per room and time slot holding the class placed there, and parallel arrays over the classes (entries) with their
+room, slot, teacher and whether they're a lab. Rooms and slots are referred to by their position in the lists
+the grid was made with. Utilization, occupancy and conflict queries are a few NumPy operations over those arrays.
+Courses are found by their identity: the grid keys its entries by `id(course)`, so no mutable Course is ever
+hashed, and the schedulers place classes by room position with place_at.
+
+The rest of the code reads and writes schedules as dicts {Course: (ClassRoom, time, [Students])}. A grid's `view`
+is such a dict, a ScheduleView that stores every assignment into the arrays, so make_schedule_basic and
+make_schedule_extension fill a grid while everything downstream keeps working on the view. A lab is linked to its
+lecture when it's placed, so the view finds the lab of a lecture without searching, and `sections()` lists every
+class with its lab straight from the arrays for admission.
+"""
+
+from collections.abc import MutableMapping
+import numpy as np
+from components import TimeTable
+
+
+class ScheduleGrid:
+    """ A schedule as arrays, see the module docstring
+
+        Args:
+            all_rooms (list): ClassRoom objects, rooms are referred to by their position in this list
+            time_list (TimeTable or iterable): the slots of the extension, where overlapping slots conflict, or
+            the slot numbers of the basic version, where only equal slots do
+
+        Attributes:
+            cells (ndarray): (rooms, slots) int array, the entry placed in every cell, -1 if none. If two
+            entries share a cell, it holds the later one.
+            room, slot, teacher (ndarray): the room position, slot position and teacher of every entry, room is -1
+            for entries that were removed
+            is_lab (ndarray): whether every entry is a lab section
+            lab (ndarray): the entry of the lab of every lecture, -1 if none
+            entries (list): the Course of every entry, it keeps removed courses alive so their ids stay unique
+            values (list): the (ClassRoom, time, [Students]) of every entry, as the view returns them
+            index (dict): {id(course): entry} of the courses that are placed, in the order they were placed
+    """
+    def __init__(self, all_rooms, time_list):
+        self.rooms = list(all_rooms)
+        self.room_index = {id(r): i for i, r in enumerate(self.rooms)}
+        self.slots = list(time_list)
+        self.slot_index = {t: i for i, t in enumerate(self.slots)}
+        if isinstance(time_list, TimeTable):
+            if not time_list.overlap:
+                time_list.compile_overlaps()
+            positions = [time_list.slots.index(t) for t in self.slots]
+            self.overlap = time_list.overlap_matrix[np.ix_(positions, positions)]
+        else:
+            self.overlap = np.eye(len(self.slots), dtype=bool)
+        self.capacity = np.array([r.capacity for r in self.rooms], dtype=np.int64)
+        self.cells = np.full((len(self.rooms), len(self.slots)), -1, dtype=np.int32)
+
+        self.entries = []
+        self.values = []
+        self.index = {}
+        self.lecture_by_name = {}
+        self.lab_by_name = {}
+        self.room = np.zeros(0, dtype=np.int32)
+        self.slot = np.zeros(0, dtype=np.int32)
+        self.teacher = np.zeros(0, dtype=np.int64)
+        self.is_lab = np.zeros(0, dtype=bool)
+        self.lab = np.zeros(0, dtype=np.int32)
+        self.view = ScheduleView(self)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # rooms and courses are found by identity, which a copied or unpickled grid has new ones of
+        self.room_index = {id(r): i for i, r in enumerate(self.rooms)}
+        self.index = {id(self.entries[i]): i for i in state['index'].values()}
+
+    def _grow(self):
+        """ Make room for one more entry, doubling the arrays when they're full """
+        n = len(self.entries)
+        if n < len(self.room):
+            return
+        size = max(16, 2 * n)
+        for name, fill in (('room', -1), ('slot', -1), ('teacher', 0), ('is_lab', False), ('lab', -1)):
+            old = getattr(self, name)
+            new = np.full(size, fill, dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+
+    def place(self, course, room, time, students):
+        """ Put `course` in `room` (a ClassRoom) at `time`, as `schedule[course] = (room, time, students)` does
+            Returns:
+                i (int): the entry of the course
+        """
+        return self.place_at(course, self.room_index[id(room)], time, students, room)
+
+    def place_at(self, course, r, time, students, room=None):
+        """ Put `course` in the room at position `r` at `time`, as place does
+            Returns:
+                i (int): the entry of the course
+        """
+        s = self.slot_index[time]
+        i = self.index.get(id(course))
+        if i is None:
+            self._grow()
+            i = len(self.entries)
+            self.entries.append(course)
+            self.values.append(None)
+            self.index[id(course)] = i
+            self.teacher[i] = course.teacher
+            self.is_lab[i] = course.has_lab == -1
+            self._link(i)
+        else:
+            self._clear_cell(i)
+        self.room[i] = r
+        self.slot[i] = s
+        self.cells[r, s] = i
+        self.values[i] = (self.rooms[r] if room is None else room, time, students)
+        return i
+
+    def _link(self, i):
+        """ Link a lab and its lecture, by name """
+        course = self.entries[i]
+        if self.is_lab[i]:
+            self.lab_by_name[course.name] = i
+            lecture = self.lecture_by_name.get(course.name)
+            if lecture is not None:
+                self.lab[lecture] = i
+        else:
+            self.lecture_by_name.setdefault(course.name, i)
+            lab = self.lab_by_name.get(course.name)
+            if lab is not None and self.lecture_by_name[course.name] == i:
+                self.lab[i] = lab
+
+    def _clear_cell(self, i):
+        r, s = self.room[i], self.slot[i]
+        if r >= 0 and self.cells[r, s] == i:
+            self.cells[r, s] = -1
+
+    def remove(self, course):
+        """ Take `course` out, as `del schedule[course]` does """
+        i = self.index.pop(id(course))
+        self._clear_cell(i)
+        self.room[i] = -1
+        self.values[i] = None
+        if self.is_lab[i]:
+            if self.lab_by_name.get(course.name) == i:
+                del self.lab_by_name[course.name]
+            self.lab[self.lab == i] = -1
+        else:
+            if self.lecture_by_name.get(course.name) == i:
+                del self.lecture_by_name[course.name]
+            self.lab[i] = -1
+
+    def at(self, room, time):
+        """ The course in the room at position `room` at `time`, None if the cell is free """
+        i = self.cells[room, self.slot_index[time]]
+        return self.entries[i] if i >= 0 else None
+
+    def lab_of(self, course):
+        """ The scheduled lab of a lecture, None if it has none """
+        i = self.index.get(id(course))
+        if i is None or self.lab[i] < 0:
+            return None
+        return self.entries[self.lab[i]]
+
+    def _live(self):
+        """ The entries that are placed, as an index array """
+        return np.flatnonzero(self.room[:len(self.entries)] >= 0)
+
+    def sections(self):
+        """ The placed classes in the order they were first placed, with the lab of every lecture that has one,
+            read from the arrays instead of looked up by course
+            Returns:
+                sections (list): (course, (ClassRoom, time, [Students]), lab or None, the lab's value or None)
+        """
+        entries, values = self.entries, self.values
+        labs = self.lab[:len(entries)].tolist()
+        return [(entries[i], values[i], entries[labs[i]], values[labs[i]]) if labs[i] >= 0 else
+                (entries[i], values[i], None, None) for i in self._live().tolist()]
+
+    def occupancy(self, closed=False):
+        """ Whether every cell is taken, a (rooms, slots) bool array. With `closed`, cells overlapping a taken
+            cell of the same room count as taken too.
+        """
+        taken = self.cells >= 0
+        if closed:
+            taken = (taken.astype(np.int64) @ self.overlap.astype(np.int64)) > 0
+        return taken
+
+    def room_totals(self):
+        """ The classes and students of every room
+            Returns:
+                used (list): the positions of the rooms with a class, in the order they were first used
+                classes (ndarray): the number of classes in every room
+                students (ndarray): the number of students in the classes of every room
+        """
+        live = self._live()
+        rooms = self.room[live]
+        classes = np.bincount(rooms, minlength=len(self.rooms))
+        students = np.bincount(rooms, weights=[len(self.values[i][2]) for i in live.tolist()],
+                               minlength=len(self.rooms)).astype(np.int64)
+        used, first = np.unique(rooms, return_index=True)
+        return used[np.argsort(first)].tolist(), classes, students
+
+    def utilization(self):
+        """ How much every room is used
+            Returns:
+                slots (ndarray): the share of slots every room has a class in
+                fill (ndarray): the share of seats taken in the classes of every room, students over capacity
+                times classes, 0 for unused rooms
+        """
+        used, classes, students = self.room_totals()
+        seats = classes * self.capacity
+        fill = np.divide(students, seats, out=np.zeros(len(self.rooms)), where=seats > 0)
+        return classes / max(len(self.slots), 1), fill
+
+    def _overlapping_pairs(self, owner):
+        """ The number of pairs of entries with the same `owner` (an array over live entries) at overlapping
+            slots
+        """
+        live = self._live()
+        if len(live) == 0:
+            return 0
+        owners, codes = np.unique(owner, return_inverse=True)
+        counts = np.zeros((len(owners), len(self.slots)), dtype=np.int64)
+        np.add.at(counts, (codes, self.slot[live]), 1)
+        overlap = self.overlap.astype(np.int64)
+        # every entry overlaps itself once, every pair is counted from both sides
+        return int((((counts @ overlap) * counts).sum() - counts.sum()) // 2)
+
+    def conflicts(self):
+        """ The number of pairs of classes in the same room, or taught by the same teacher, at overlapping slots
+            Returns:
+                conflicts (dict): {'room': pairs, 'teacher': pairs}
+        """
+        live = self._live()
+        return {'room': self._overlapping_pairs(self.room[live]),
+                'teacher': self._overlapping_pairs(self.teacher[live])}
+
+    def check(self):
+        """ Whether the arrays agree with what the view returns
+            Returns:
+                problems (list): a message for every disagreement, empty if there is none
+        """
+        problems = []
+        live = self._live().tolist()
+        if sorted(self.index.values()) != live:
+            problems.append("%d courses in the index, %d placed entries" % (len(self.index), len(live)))
+        for key, i in self.index.items():
+            course = self.entries[i]
+            room, time, students = self.values[i]
+            r, s = self.room[i], self.slot[i]
+            if id(course) != key:
+                problems.append("entry %d isn't %s" % (i, course.name))
+            elif r < 0 or self.rooms[r] is not room or self.slots[s] != time:
+                problems.append("%s is in room %s at time %s, its entry says room position %d slot %d"
+                                % (course.name, room.idx, time, r, s))
+            elif self.cells[r, s] < 0 or (self.room[self.cells[r, s]], self.slot[self.cells[r, s]]) != (r, s):
+                problems.append("the cell of %s doesn't hold a class placed there" % course.name)
+            if self.teacher[i] != course.teacher:
+                problems.append("%s is taught by %d, its entry says %d" % (course.name, course.teacher,
+                                                                          self.teacher[i]))
+        for r, s in zip(*np.nonzero(self.cells >= 0)):
+            i = self.cells[r, s]
+            if self.room[i] != r or self.slot[i] != s:
+                problems.append("cell (%d, %d) holds entry %d, which isn't there" % (r, s, i))
+        for name, lecture in self.lecture_by_name.items():
+            lab = self.lab_by_name.get(name, -1)
+            if self.lab[lecture] != lab:
+                problems.append("the lab of %s is entry %d, not %d" % (name, self.lab[lecture], lab))
+        return problems
+
+
+class ScheduleView(MutableMapping):
+    """ A ScheduleGrid as the dict {Course: (ClassRoom, time, [Students])} the rest of the code works with,
+        iterating in the order classes were first placed, like a dict
+    """
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __getitem__(self, course):
+        i = self.grid.index.get(id(course))
+        if i is None:
+            raise KeyError(course)
+        return self.grid.values[i]
+
+    def __setitem__(self, course, value):
+        self.grid.place(course, *value)
+
+    def __delitem__(self, course):
+        if id(course) not in self.grid.index:
+            raise KeyError(course)
+        self.grid.remove(course)
+
+    def __contains__(self, course):
+        return id(course) in self.grid.index
+
+    def __iter__(self):
+        entries = self.grid.entries
+        return iter([entries[i] for i in self.grid.index.values()])
+
+    def __len__(self):
+        return len(self.grid.index)
+
+    def items(self):
+        entries, values = self.grid.entries, self.grid.values
+        return [(entries[i], values[i]) for i in self.grid.index.values()]
+
+    def values(self):
+        values = self.grid.values
+        return [values[i] for i in self.grid.index.values()]
+
+    def lab(self, course):
+        """ The scheduled lab of a lecture, None if it has none """
+        return self.grid.lab_of(course)
+
+    def place_at(self, course, r, time, students):
+        """ `self[course] = (room, time, students)` with the room given by its position in the grid """
+        self.grid.place_at(course, r, time, students)
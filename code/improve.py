@@ -0,0 +1,312 @@
+""" Local search on a finished schedule
+
+make_schedule_basic and make_schedule_extension place every class once and never look back. LocalSearch takes
+their schedule, before students are admitted, and keeps applying random moves until a wall-clock deadline:
+
+- relocate a class to a free room and time,
+- swap the room and time of two classes,
+- swap two lectures together with their labs.
+
+A move must keep rooms and teachers free of overlapping classes and keep teachers' personal conflicts, and a
+class only moves to a slot of its own kind, i.e. lectures stay in lecture slots and labs in lab slots.
+
+Admitting students after every move would be far too slow, so moves are judged by an estimate of the number of
+preferences admission can satisfy: every lecture contributes the smaller of its demand and the seats of its room
+(and of its lab's room), and every student who asked for two lectures at overlapping times costs one. A move
+changes the estimate only through the lectures it moves and the lectures that share students with them, so it is
+updated in time proportional to those. Moves that don't lower the estimate are kept.
+"""
+
+import random
+import timeit
+from collections import defaultdict
+from instrument import stats
+
+# how often the deadline is looked at, in moves
+DEADLINE_CHECK = 64
+
+
+class Placement:
+    """ Where the classes of a schedule are, in a form that tells quickly whether a class can go somewhere else
+
+        Classes of the schedule are entries, referred to by their position in `entries`, rooms by their position
+        in `all_rooms` and slots by their position in `slots`. A section is a lecture together with its lab, the
+        unit students are admitted to.
+
+        Args:
+            schedule (dict): {Course: (ClassRoom, time, [Students])}
+            all_rooms (list): ClassRoom objects classes may move to
+            time_list (TimeTable or iterable): the slots of the extension, or slot numbers of the basic version,
+            where only equal slots conflict
+            unavailable (dict): {teacher: [slots the teacher can't teach in]}
+            lab_slots (iterable): slots only labs may use, every other slot is for lectures
+            registry (CourseRegistry): to look up labs
+    """
+    def __init__(self, schedule, all_rooms, time_list, unavailable=None, lab_slots=(), registry=None):
+        self.schedule = schedule
+        self.all_rooms = list(all_rooms)
+        self.slots = list(time_list)
+        self.slot_index = slot_index = {t: i for i, t in enumerate(self.slots)}
+        overlap = getattr(time_list, 'overlap', None) or {}
+        # overlapping[i] lists the slots overlapping slot i, closure[i] is their bitmask
+        self.overlapping = []
+        self.closure = []
+        for t in self.slots:
+            mask = overlap.get(t, 1 << t)
+            same = [j for j, t2 in enumerate(self.slots) if (mask >> t2) & 1]
+            self.overlapping.append(same)
+            self.closure.append(sum(1 << j for j in same))
+        lab_slots = set(lab_slots)
+        self.kinds = [[i for i, t in enumerate(self.slots) if (t in lab_slots) == is_lab] for is_lab in (False, True)]
+
+        room_index = {id(r): i for i, r in enumerate(self.all_rooms)}
+        self.entries = list(schedule)
+        self.room = [room_index[id(schedule[c][0])] for c in self.entries]
+        self.slot = [slot_index[schedule[c][1]] for c in self.entries]
+        self.kind = [int(self.slots[s] in lab_slots) for s in self.slot]
+        # a lecture blocks the instructor of its lab too, so that the lab can't overlap it
+        self.teachers = [tuple(dict.fromkeys((c.teacher, c.has_lab))) if c.has_lab > 0 else (c.teacher,)
+                         for c in self.entries]
+
+        self.room_use = [[0] * len(self.slots) for _ in self.all_rooms]
+        self.teacher_use = defaultdict(lambda: [0] * len(self.slots))
+        self.blocked = defaultdict(int)
+        for teacher, times in (unavailable or {}).items():
+            for t in times:
+                if t in slot_index:
+                    self.blocked[teacher] |= self.closure[slot_index[t]]
+        for i in range(len(self.entries)):
+            self._add(i)
+
+        self._build_sections(registry)
+
+    def _build_sections(self, registry):
+        """ Group entries into sections, a lecture with its lab """
+        entry_index = {id(c): i for i, c in enumerate(self.entries)}
+        self.sections = []
+        self.section_of = [-1] * len(self.entries)
+        for i, course in enumerate(self.entries):
+            if course.has_lab == -1:
+                continue
+            members = [i]
+            if course.has_lab > 0:
+                lab = registry.lab(course.name) if registry is not None else None
+                if not lab or id(lab) not in entry_index:
+                    # lectures without a scheduled lab admit no one
+                    continue
+                members.append(entry_index[id(lab)])
+            for j in members:
+                self.section_of[j] = len(self.sections)
+            self.sections.append(members)
+        self.pair_sections = [s for s, members in enumerate(self.sections) if len(members) == 2]
+
+    def _add(self, i):
+        r, s = self.room[i], self.slot[i]
+        self.room_use[r][s] += 1
+        for teacher in self.teachers[i]:
+            self.teacher_use[teacher][s] += 1
+
+    def _remove(self, i):
+        r, s = self.room[i], self.slot[i]
+        self.room_use[r][s] -= 1
+        for teacher in self.teachers[i]:
+            self.teacher_use[teacher][s] -= 1
+
+    def _fits(self, i, r, s):
+        """ Whether entry i can be placed in room r at slot s, with entry i itself not placed """
+        return self._teacher_free(i, s) and self._room_free(r, s)
+
+    def _teacher_free(self, i, s):
+        if (self.blocked[self.teachers[i][0]] >> s) & 1:
+            return False
+        for teacher in self.teachers[i]:
+            use = self.teacher_use[teacher]
+            if any(use[s2] for s2 in self.overlapping[s]):
+                return False
+        return True
+
+    def _room_free(self, r, s):
+        room_use = self.room_use[r]
+        return not any(room_use[s2] for s2 in self.overlapping[s])
+
+    def _times(self, s):
+        """ The bitmask of the slots of section s, and the bitmask of the slots those overlap """
+        need = 0
+        block = 0
+        for i in self.sections[s]:
+            need |= 1 << self.slot[i]
+            block |= self.closure[self.slot[i]]
+        return need, block
+
+    def write_back(self):
+        """ Put the current rooms and times into the schedule, and keep the `taken` lists of rooms up to date """
+        for i, course in enumerate(self.entries):
+            room, time, students = self.schedule[course]
+            new_room, new_time = self.all_rooms[self.room[i]], self.slots[self.slot[i]]
+            if room is new_room and time == new_time:
+                continue
+            if time in room.taken:
+                room.taken.remove(time)
+                new_room.taken.append(new_time)
+            self.schedule[course] = (new_room, new_time, students)
+
+
+class LocalSearch(Placement):
+    """ Improve a schedule in place by local search, see the module docstring. The arguments are those of
+        Placement, the `specs` of lectures must hold their demand.
+
+        Attributes:
+            value (float): the current estimate
+            rng (random.Random): draws the moves, the `random` module if none is given
+    """
+    def __init__(self, schedule, all_rooms, time_list, unavailable=None, lab_slots=(), registry=None, rng=None):
+        Placement.__init__(self, schedule, all_rooms, time_list, unavailable, lab_slots, registry)
+        self.rng = rng if rng is not None else random
+        self._count_shared()
+        self.value = self.estimate()
+
+    def _count_shared(self):
+        """ Count the students every two sections share """
+        self.demand = [len(self.entries[members[0]].specs) for members in self.sections]
+        sections_of = defaultdict(list)
+        for s, members in enumerate(self.sections):
+            for student in self.entries[members[0]].specs:
+                sections_of[student].append(s)
+        self.shared = [defaultdict(int) for _ in self.sections]
+        for wanted in sections_of.values():
+            for a in range(len(wanted)):
+                for b in range(a + 1, len(wanted)):
+                    self.shared[wanted[a]][wanted[b]] += 1
+                    self.shared[wanted[b]][wanted[a]] += 1
+        self.shared = [dict(d) for d in self.shared]
+
+    def _overlaps(self, s):
+        """ {section: whether it overlaps section s} for the sections sharing students with s """
+        block = self._times(s)[1]
+        return {d: bool(block & self._times(d)[0]) for d in self.shared[s]}
+
+    def _value(self, s):
+        """ The estimate of section s: its seats, or its demand less half the students it shares with overlapping
+            sections if that's smaller, since such a student takes one of the two
+        """
+        seats = min(self.all_rooms[self.room[i]].capacity for i in self.sections[s])
+        return max(0, min(seats, self.demand[s] - self.conflicts[s] / 2))
+
+    def estimate(self):
+        """ The estimate of the whole schedule, computed from scratch """
+        self.conflicts = []
+        for s in range(len(self.sections)):
+            overlaps = self._overlaps(s)
+            self.conflicts.append(sum(students for d, students in self.shared[s].items() if overlaps[d]))
+        return sum(self._value(s) for s in range(len(self.sections)))
+
+    def apply(self, moves):
+        """ Try a move, keep it if the estimate doesn't drop
+            Args:
+                moves (list): (entry, room, slot) tuples, the new places of the entries that move
+            Returns:
+                delta (float): how much the estimate grew, None if the move was undone
+        """
+        sections = {self.section_of[i] for i, r, s in moves} - {-1}
+        old = [(i, self.room[i], self.slot[i]) for i, r, s in moves]
+        for i, r, s in moves:
+            self._remove(i)
+        placed = []
+        for i, r, s in moves:
+            if not self._fits(i, r, s):
+                break
+            self.room[i], self.slot[i] = r, s
+            self._add(i)
+            placed.append(i)
+        if len(placed) == len(moves):
+            delta = self._update(sections, old)
+            if delta is not None:
+                self.value += delta
+                return delta
+        for i in placed:
+            self._remove(i)
+        for i, r, s in old:
+            self.room[i], self.slot[i] = r, s
+            self._add(i)
+        return None
+
+    def _update(self, sections, old):
+        """ Update the conflict counts after the entries of `sections` moved from `old` (entry, room, slot) places,
+            returns the change of the estimate, or None after restoring the counts if it would drop
+        """
+        moved = [(i, self.room[i], self.slot[i]) for i, r, s in old]
+        for i, r, s in old:
+            self.room[i], self.slot[i] = r, s
+        before = {s: self._overlaps(s) for s in sections}
+        touched = set(sections)
+        for s in sections:
+            touched.update(self.shared[s])
+        value_before = sum(self._value(s) for s in touched)
+        for i, r, s in moved:
+            self.room[i], self.slot[i] = r, s
+
+        saved = {s: self.conflicts[s] for s in touched}
+        for s in sections:
+            after = self._overlaps(s)
+            self.conflicts[s] = sum(students for d, students in self.shared[s].items() if after[d])
+            for d, students in self.shared[s].items():
+                if d not in sections and after[d] != before[s][d]:
+                    self.conflicts[d] += students if after[d] else -students
+        delta = sum(self._value(s) for s in touched) - value_before
+        if delta >= 0:
+            return delta
+        for s, count in saved.items():
+            self.conflicts[s] = count
+        return None
+
+    def random_move(self):
+        """ A random relocation, swap or swap of lecture and lab pairs, as for `apply` """
+        n = len(self.entries)
+        rng = self.rng
+        pick = rng.random()
+        if pick < 0.1 and len(self.pair_sections) > 1:
+            a, b = rng.sample(self.pair_sections, 2)
+            return [(i, self.room[j], self.slot[j]) for i, j in zip(self.sections[a], self.sections[b])] + \
+                   [(j, self.room[i], self.slot[i]) for i, j in zip(self.sections[a], self.sections[b])]
+        i = rng.randrange(n)
+        if pick < 0.55 and n > 1:
+            j = rng.randrange(n)
+            if j == i or self.kind[i] != self.kind[j]:
+                return None
+            return [(i, self.room[j], self.slot[j]), (j, self.room[i], self.slot[i])]
+        slots = self.kinds[self.kind[i]]
+        if not slots:
+            return None
+        r, s = rng.randrange(len(self.all_rooms)), rng.choice(slots)
+        if (r, s) == (self.room[i], self.slot[i]):
+            return None
+        return [(i, r, s)]
+
+    def run(self, seconds, max_moves=None):
+        """ Apply random moves until `seconds` have passed (or `max_moves` were tried), then write the result back
+            to the schedule
+            Returns:
+                start (int), end (int): the estimate before and after
+                accepted (int): the number of moves kept
+        """
+        start = self.value
+        accepted = 0
+        tried = 0
+        deadline = timeit.default_timer() + seconds
+        while self.entries and (max_moves is None or tried < max_moves):
+            if tried % DEADLINE_CHECK == 0 and timeit.default_timer() >= deadline:
+                break
+            tried += 1
+            moves = self.random_move()
+            if moves is not None and self.apply(moves) is not None:
+                accepted += 1
+        stats.count('improve_moves_tried', tried)
+        stats.count('improve_moves_accepted', accepted)
+        self.write_back()
+        return start, self.value, accepted
+
+
+def improve_schedule(schedule, all_rooms, time_list, seconds, unavailable=None, lab_slots=(), registry=None,
+                     rng=None):
+    """ Run LocalSearch on `schedule` for `seconds`, returns what LocalSearch.run returns """
+    return LocalSearch(schedule, all_rooms, time_list, unavailable, lab_slots, registry, rng).run(seconds)
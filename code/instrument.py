@@ -0,0 +1,112 @@
+""" Phase timers and hot-path counters
+
+`stats` is shared by all modules. It does nothing until it's enabled, e.g. by `main.py --stats <file>`, so the
+scheduler can call it unconditionally. Once enabled, it records
+
+- the wall-clock time spent in every named phase, summed if a phase runs more than once,
+- the peak resident memory of the process at the end of every phase, and with `trace_memory` the peak of memory
+  allocated by Python during the phase (tracemalloc, which slows everything down),
+- counters of hot operations, e.g. conflict checks and lookups of skipped slots.
+"""
+
+import json
+import sys
+import timeit
+import tracemalloc
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """ Peak resident memory of this process in bytes, None where it can't be read """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Instruments:
+    """ Named phase timers, memory readings and counters, see the module docstring
+
+        Attributes:
+            enabled (bool): nothing is recorded while this is False
+            phases (OrderedDict): {phase name: seconds}, in the order phases first ran
+            memory (dict): {phase name: {'peak_rss': bytes, 'traced_peak': bytes}}
+            counters (Counter): {counter name: count}
+    """
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.reset()
+
+    def reset(self):
+        self.phases = OrderedDict()
+        self.memory = {}
+        self.counters = Counter()
+
+    def enable(self, trace_memory=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    @contextmanager
+    def phase(self, name):
+        """ Time the body of a `with` block as phase `name` """
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.add_phase(name, timeit.default_timer() - start)
+            reading = self.memory.setdefault(name, {})
+            reading['peak_rss'] = peak_rss()
+            if self.trace_memory:
+                reading['traced_peak'] = max(reading.get('traced_peak', 0), tracemalloc.get_traced_memory()[1])
+
+    def add_phase(self, name, seconds):
+        """ Record time spent in phase `name` that was measured elsewhere """
+        if self.enabled:
+            self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def report(self):
+        """ Everything recorded so far as a JSON-serializable dict """
+        return {
+            'phases': [{'name': name, 'seconds': round(seconds, 6), 'memory': self.memory.get(name, {})}
+                       for name, seconds in self.phases.items()],
+            'total_seconds': round(sum(self.phases.values()), 6),
+            'peak_rss': peak_rss(),
+            'counters': dict(self.counters),
+        }
+
+    def dump(self, fname):
+        with open(fname, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def __str__(self):
+        lines = ["%-24s %10.4fs" % (name, seconds) for name, seconds in self.phases.items()]
+        lines += ["%-24s %11d" % (name, count) for name, count in sorted(self.counters.items())]
+        return "\n".join(lines)
+
+
+stats = Instruments()
@@ -0,0 +1,406 @@
+""" Input parsing for preference and constraint files
+
+Preference files are parsed in one flat pass: the whole file is tokenized at once, converted to a single
+integer array and cut into ragged per-student lists, so loading is linear in the size of the file and students
+may list any number of classes.
+"""
+
+import gc
+import traceback
+from collections import defaultdict
+from random import randrange
+import numpy as np
+from components import ClassRoom, Student, Course, CourseRegistry, TimeTable
+from pool import StudentPool
+
+# marks the end of a line in the flat token array, student ids and class ids are always positive
+_EOL = -1
+
+
+def read_pref_lists(filename):
+    """ Parse a file of preference lists into CSR arrays
+        Args:
+            filename (string): a `Students <n>` header line followed by lines of `<student>\t<class> <class> ...`,
+            each with any number of classes
+        Returns:
+            ids (ndarray): student ids in file order
+            indptr (ndarray): the classes of student ids[i] are classes[indptr[i]:indptr[i + 1]]
+            classes (ndarray): all preference lists concatenated
+    """
+    with open(filename) as f:
+        f.readline()
+        text = f.read()
+    try:
+        return parse_pref_lists(text)
+    except ValueError:
+        traceback.print_exc()
+        print("Something's wrong while reading student preferences. Please check input format.")
+        for line in text.splitlines():
+            if not all(t.isdigit() for t in line.split()):
+                print("The line that went wrong:", line)
+                break
+        exit(-1)
+
+
+def parse_pref_lists(text):
+    """ Parse preference lists as read_pref_lists does, from the text after the header line, raises ValueError
+        if a token isn't an integer
+    """
+    tokens = text.replace("\n", " %d " % _EOL).split()
+    tokens.append(str(_EOL))
+    flat = np.array(tokens, dtype=np.int64)
+
+    # every line spans [starts, ends), blank lines are dropped
+    ends = np.flatnonzero(flat == _EOL)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+
+    # the first token of a line is the student, the rest are classes
+    is_class = flat != _EOL
+    is_class[starts] = False
+    ids = flat[starts]
+    classes = flat[is_class]
+    indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(ends - starts - 1, out=indptr[1:])
+
+    return ids, indptr, classes
+
+
+def make_students(ids, indptr, classes, compact=False):
+    """ Build Student objects from CSR preference arrays
+        Args:
+            ids, indptr, classes: as returned by read_pref_lists, `classes` may hold any type of class name
+            compact (bool): keep the arrays in a StudentPool instead of making one object per student
+        Returns:
+            all_students (list or StudentPool): a list of Student objects in the order of `ids`
+    """
+    if compact:
+        return StudentPool(ids, indptr, classes)
+    ids = ids.tolist()
+    indptr = indptr.tolist()
+    classes = classes.tolist()
+    # none of these objects can form cycles, so don't let the collector rescan them while they are created
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [Student(ids[i], classes[indptr[i]:indptr[i + 1]]) for i in range(len(ids))]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def read_prefs(filename, compact=False):
+    """ Parse preference lists input
+        Args:
+            filename (string): name of the input preferece lists
+            compact (bool): return a StudentPool, see make_students
+        Returns:
+            all_students (list): a list of Student objects with arrtibute `idx` (int) and `classes` (a list of int)
+    """
+    return make_students(*read_pref_lists(filename), compact=compact)
+
+
+def read_enrollment(filename):
+    """ Parse past enrollment data, same format as the preference lists
+        Args:
+            filename (string): name of the input enrollment file
+        Returns:
+            all_students (list): a list of Student objects with arrtibute `idx` (int) and `classes` (a list of int)
+    """
+    return make_students(*read_pref_lists(filename))
+
+
+def read_extension_prefs(filename, all_classes, compact=False):
+    """ Parse preference lists that refer to classes by their position in `all_classes` (1-based)
+        Args:
+            filename (string): name of the input preferece lists
+            all_classes (list): a list of Course objects
+            compact (bool): return a StudentPool, see make_students
+        Returns:
+            all_students (list): a list of Student objects with arrtibute `idx` (int) and `classes` (a list of
+            class names)
+    """
+    try:
+        return make_extension_students(all_classes, *read_pref_lists(filename), compact=compact)
+    except IndexError:
+        traceback.print_exc()
+        print("When reading extension prefs, a preference is out of range. There are", len(all_classes), "classes.")
+        exit(1)
+
+
+def make_extension_students(all_classes, ids, indptr, classes, compact=False):
+    """ Build Student objects (or a StudentPool if `compact`) from CSR preferences that refer to classes by their
+        position in `all_classes` (1-based), raises IndexError if a position is out of range
+    """
+    names = np.array([c.name for c in all_classes])
+    if len(classes) and classes.min() < 1:
+        raise IndexError("class positions start at 1")
+    return make_students(ids, indptr, names[classes - 1], compact)
+
+
+def read_constraints(filename):
+    """ Parse constraints info
+        Args:
+            filename (string): name of the input file
+        Returns:
+            ntimes (int): the number of non-overlapping time slots
+            all_rooms (list): a list of Classroom objects, with attributes `idx` (str) and `capacity` (int)
+            all_classes (list): a list of Course objects, with attributes `name` (int), `teacher` (int), and `spec`s
+            (empty list)
+            all_teachers (dict): {teacher_id (int): a list of class names (int)}
+    """
+    ntimes = 0
+    nteachers = 0
+    all_rooms = []
+    all_classes = []
+    section = None
+    with open(filename) as f:
+        try:
+            for line in f:
+                row = line.rstrip("\n").split("\t")
+                if row[0] == "Class Times":
+                    ntimes = int(row[1])
+                elif row[0] in ("Rooms", "Classes"):
+                    section = row[0]
+                elif row[0] == "Teachers":
+                    nteachers = int(row[1])
+                    section = "Teachers"
+                elif row[0] == "":
+                    continue
+                elif section == "Rooms":
+                    all_rooms.append(ClassRoom(row[0], int(row[1])))
+                elif section == "Teachers":
+                    all_classes.append(Course(int(row[0]), int(row[1])))
+        except (ValueError, IndexError):
+            traceback.print_exc()
+            print("Something's wrong while reading constraints. Please check input format.")
+            print("The line that went wrong:", line)
+            exit(-1)
+
+    # construct teacher list
+    all_teachers = {t: [] for t in range(1, nteachers + 1)}
+    for c in all_classes:
+        all_teachers.setdefault(c.teacher, []).append(c.name)
+
+    return ntimes, all_rooms, all_classes, all_teachers
+
+
+def split_time(row):
+    """ Split a slot like `11:30 AM  1:00 PM T H` into [start, end, days], leaving the parts as strings """
+    row = row.strip()
+    split_1 = row.find("M") + 1
+    start = row[:split_1]
+    row = row[split_1 + 1:].strip()
+    split_2 = row.find("M")
+    end = row[:split_2 + 1]
+    days = row[split_2 + 2:]
+    return [start, end, days]
+
+
+def read_extension_constraints(filename_rt, filename_c, rng=None):
+    """ Parse constraints info of the Haverford extension
+        Args:
+            filename_rt (string): time slots and room capacities
+            filename_c (string): classes, their teachers, departments and levels
+            rng (random.Random): draws teachers' personal conflicts, the `random` module if None
+        Returns:
+            all_times (TimeTable): {index_time: [start(string), end(string), day(string)]}
+            all_rooms (list): a list of Classroom objects, with attributes `idx` (str) and `capacity` (int)
+            all_classes (list): a list of Course objects, with attributes `name` (str), `teacher` (int), and
+            `specs` (empty list), `dept` (string), `level` (int), core=False
+            all_teachers (dict): {teacher_id (int): [class_name (int), personal_conflicts (list of ints)]}
+    """
+    all_times = TimeTable()
+    all_rooms = []
+    section = None
+    with open(filename_rt) as f:
+        # slots are numbered by their line, blank lines don't count
+        rows = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+    try:
+        for index, row in enumerate(rows):
+            if row[0] in ("Class Times", "Rooms", "Teachers", "Classes"):
+                section = row[0]
+            elif section == "Class Times":
+                all_times[index] = split_time(row[1])
+            elif section == "Rooms":
+                all_rooms.append(ClassRoom(row[0], int(row[1])))
+    except (ValueError, IndexError):
+        traceback.print_exc()
+        print("Something's wrong while reading time slots and rooms. Please check input format.")
+        print("The line that went wrong:", "\t".join(row))
+        exit(-1)
+
+    all_classes = []
+    classes_with_labs = []
+    all_teachers = defaultdict(list)
+
+    # construct Course objects for lectures
+    # record which teacher teach which classes
+    # All labs don't have instructor ID, find them and put into a separate list
+    with open(filename_c) as f:
+        rows = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+    try:
+        for row in rows:
+            name, teacher, dept, level = row
+            if "L" in name:
+                classes_with_labs.append([int(name[:-1]), int(teacher) if teacher else 0])
+            else:
+                all_classes.append(Course(int(name), int(teacher), None, dept, int(level)))
+                all_teachers[int(teacher)].append(int(name))
+    except ValueError:
+        print("When trying to process the following class, something went wrong:")
+        traceback.print_exc()
+        print("\t".join(row))
+        exit(-1)
+
+    # add has_lab attribute and append Course ID to lab instructor's class list
+    registry = CourseRegistry(all_classes)
+    for name, lab_prof in classes_with_labs:
+        c = registry.lecture(name)
+        if not c:
+            print("Possibly can't find the lecture section of this lab")
+            print(name, lab_prof)
+            exit(-1)
+        c.has_lab = c.teacher if lab_prof == 0 else lab_prof
+        if lab_prof != 0:
+            all_teachers[lab_prof].append(name)
+
+    draw_personal_conflicts(all_teachers, len(all_times), rng)
+
+    return all_times, all_rooms, all_classes, all_teachers
+
+
+def draw_personal_conflicts(all_teachers, ntimes, rng=None):
+    """ Replace the class list of every teacher with [classes, personal conflicts], 0 to 4 slots drawn at random
+        from 1..ntimes that the teacher can't teach at, with `rng` (random.Random) or the `random` module
+    """
+    draw = rng.randrange if rng is not None else randrange
+    for t in all_teachers:
+        n_unavailable_t = draw(0, 5)
+        all_teachers[t] = [all_teachers[t], [draw(1, ntimes + 1) for n in range(n_unavailable_t)]]
+
+
+def read_extension_constraints_pandas(filename_rt, filename_c, rng=None):
+    """ Parse constraints info with pandas, only used with main.py --pandas, read_extension_constraints reads
+        the same files without it
+        Args:
+            filename (string): name of the input file
+            rng (random.Random): draws teachers' personal conflicts, the `random` module if None
+        Returns:
+            all_rooms (list): a list of Classroom objects, with attributes `idx` (str) and `capacity` (int)
+            all_classes (list): a list of Course objects, with attributes `name` (str), `teacher` (int), and 
+            `specs` (empty list), `dept` (string), `level` (int), core=False
+            all_times (dict): {index_time: [start(string), end(string), day(string)]}
+            all_teachers (dict): {teacher_id (int): [class_name (int), personal_conflicts (list of ints)]}
+    """
+    import pandas as pd
+    # set max column width so that the list of enrolled students will not be cut off
+    pd.set_option('max_colwidth', 1000000000000000)
+
+    # read file
+    df_raw = pd.read_csv(filename_rt, sep='\t', header=None)
+
+    # process last two lines of constraint file 1
+    teacher_line =  df_raw[df_raw[0] == "Teachers"].index[0]
+    r_start = df_raw[df_raw[0] == "Rooms"].index[0]
+    df_times = df_raw[1:r_start]
+    all_times = TimeTable()
+    for index, times in df_times.iterrows():
+        row = times.to_string(header=False, index=False)
+        row = row[row.find("\n"):].strip()
+        split_1 = row.find("M") + 1
+        start = row[:split_1]
+        row = row[split_1 + 1:].strip()
+        split_2 = row.find("M")
+        end = row[:split_2 + 1]
+        days = row[split_2 + 2:]
+        all_times[index] = [start, end, days]
+
+    # process room info
+    df_rooms = df_raw[r_start + 1:teacher_line]
+    all_rooms = [ClassRoom(row[0], int(row[1]))
+                 for index, row in df_rooms.iterrows()]
+
+    # process class info from second file
+    df_class_info = pd.read_csv(filename_c, sep='\t', header=None)
+    df_class_info.columns = ['Class', 'Teacher', 'Subject', 'Level']
+    all_classes = []
+    classes_with_labs = []
+    all_teachers = defaultdict(list)
+
+    # construct Course objects for lectures
+    # record which teacher teach which classes
+    # All labs don't have instructor ID, find them and put into a separate list
+    try:
+        for index, row in df_class_info.iterrows():
+            # check for NaN, should be false if teacher is NaN
+            if "L" in row['Class']:
+                if row['Teacher'] != row['Teacher']:
+                    classes_with_labs.append([int(row['Class'][:-1]), 0])
+                else:
+                    classes_with_labs.append([int(row['Class'][:-1]), int(row['Teacher'])])
+            else:
+                all_classes.append(Course(int(row['Class']), int(
+                    row['Teacher']), None, row['Subject'], int(row['Level'])))
+                all_teachers[int(row['Teacher'])].append(int(row['Class']))
+
+    except:
+        print("When trying to process the following class, something went wrong:")
+        traceback.print_exc()
+        print(row, index)
+        exit(-1)
+
+    # add has_lab attribute and append Course ID to lab instructor's class list
+    registry = CourseRegistry(all_classes)
+    try:
+        for i in classes_with_labs:
+            c = registry.lecture(i[0])
+            c.has_lab = c.teacher if i[1]==0 else i[1]
+            if i[1]!=0:
+                all_teachers[i[1]].append(i[0])
+    except:
+        traceback.print_exc()
+        print("Possibly can't find the lecture section of this lab")
+        print(i)
+        exit(-1)
+
+    draw_personal_conflicts(all_teachers, len(all_times), rng)
+
+    return all_times, all_rooms, all_classes, all_teachers
+
+
+def build_time_table(time_list):
+    """ Convert format from string to 24h clock in order to detect time conlifcts. If `time_list` is a TimeTable,
+        also compile which slots overlap each other.
+    """
+
+    for time in time_list:
+        # parse start time
+        split_point_s = time_list[time][0].find(":")
+        start_h = int(time_list[time][0][:split_point_s])
+        start_min = int(time_list[time][0][split_point_s + 1:split_point_s + 3])
+        if time_list[time][0][-2] == "P":
+            if start_h != 12:
+                start_h += 12
+        time_list[time][0] = start_h * 100 + start_min
+        # parse end time
+        split_point_e = time_list[time][1].find(":")
+        end_h = int(time_list[time][1][:split_point_e])
+        end_min = int(time_list[time][1][split_point_e + 1:split_point_e + 3])
+        if time_list[time][1][-2] == "P":
+            if end_h != 12:
+                end_h += 12
+        time_list[time][1] = end_h * 100 + end_min
+        # parse day
+        """
+        day_list = []
+        for char in time_list[time][2] :
+            if char != " ":
+                day_list.append(char)
+        time_list[time][2] = day_list
+        """
+        time_list[time][2] = time_list[time][2].split()
+
+    if isinstance(time_list, TimeTable):
+        time_list.compile_overlaps()
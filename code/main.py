@@ -1,339 +1,63 @@
 #! /usr/bin/env python3
 
+import timeit
+# for --stats, importing everything below is part of the fixed start-up cost
+_import_start = timeit.default_timer()
 import argparse
-import pandas as pd
 import subprocess
-import functools
-import timeit
-import traceback
 from collections import defaultdict, OrderedDict
-from random import shuffle, randrange
+from concurrent.futures import ThreadPoolExecutor
+from random import shuffle, Random
 from copy import deepcopy
-from components import ClassRoom, Student, Course
+from components import Course, CourseRegistry, TimeTable, Occupancy, FreeSlots
+from loaders import read_prefs, read_constraints, read_enrollment, read_extension_prefs, make_extension_students, \
+    read_extension_constraints, read_extension_constraints_pandas, build_time_table
+from bundle import load_basic, load_extension
+from pool import StudentPool, schedule_sections
+from admission import flow_admit
+from improve import improve_schedule
+from writers import write_schedule, FORMATS
+from grid import ScheduleGrid, ScheduleView
 from call_is_valid import *
-
-# set max column width so that the list of enrolled students will not be cut off
-pd.set_option('max_colwidth', 1000000000000000)
+from validator import validate_schedule
+from instrument import stats
 
 
 major_count = {"ANTH": 23, "ASTR": 7, "PHYS": 39, "BIOL": 70, "CHEM": 57, "ARCH": 6, "CMSC": 45, "COML": 9, "EAST": 9, "ECON": 91, "ENGL": 59, "ARTS": 11, "FREN": 14, "GERM": 7, "HIST": 21, "LING": 15, "MATH": 45, "MUSC": 12, "PHIL": 24, "POLS": 54, "PSYC": 54, "RELG": 9, "SOCL": 7, "SPAN": 36, "EDUC": 18, "ENVS": 19}
 
 """ Input/Output Processing """
 
-def read_prefs(filename):
-    """ Parse preference lists input
-        Args:
-            filename (string): name of the input preferece lists
-        Returns:
-            all_students (list): a list of Student objects with arrtibute `idx` (int) and `classes` (a list of int)
-    """
-    # read input file
-    df_raw = pd.read_csv(filename, skiprows=1, delim_whitespace=True,
-                         names=['Student', 'Class1', 'Class2', 'Class3', 'Class4'])
-
-    # put each student's class choices into a list
-    classes = defaultdict(list)
-    try:
-        for i in df_raw['Student']:
-            classes[int(i)].append(
-                int(df_raw.loc[df_raw['Student'] == i, 'Class1']))
-            classes[int(i)].append(
-                int(df_raw.loc[df_raw['Student'] == i, 'Class2']))
-            classes[int(i)].append(
-                int(df_raw.loc[df_raw['Student'] == i, 'Class3']))
-            classes[int(i)].append(
-                int(df_raw.loc[df_raw['Student'] == i, 'Class4']))
-    except:
-        traceback.print_exc()
-        print("Something's wrong while reading student preferences. Please check input format.")
-        print("The student", i, 'went wrong.')
-        print("His/hers prefereces are", df_raw.loc[i - 1])
-        print("Here's what we've got when tring to get Class 1:")
-        print(df_raw.loc[df_raw['Student'] == i, 'Class1'])
-        exit(-1)
-
-    # construct a new DataFrame and return a list
-    df_students = pd.DataFrame(list(classes.items()), columns=['Student', 'Classes'])
-    all_students = [Student(i, df_students.loc[i - 1, 'Classes']) for i in df_students['Student']]
-
-    return all_students
-
-
-def read_constraints(filename):
-    """ Parse constraints info
-        Args:
-            filename (string): name of the input file
-        Returns:
-            all_rooms (list): a list of Classroom objects, with attributes `idx` (str) and `capacity` (int)
-            all_classes (list): a list of Course objects, with attributes `name` (str), `teacher` (int), and `spec`s
-            (empty list)
-            ntimes (int): the number of non-overlapping time slots
-            all_teachers (dict): {teacher_id (int): class_name (int)}
-    """
-    # read file
-    df_raw = pd.read_csv(filename, sep='\t', header=None)
-
-    # record the number of time slots
-    ntimes = int(df_raw.loc[0, 1])
-
-    # parse remaining info into two parts, one about rooms, the other about
-    # teachers
-    r_start = df_raw[df_raw[0] == "Rooms"].index[0]
-    t_start = df_raw[df_raw[0] == "Teachers"].index[0]
-    df_rooms = df_raw[r_start:t_start - 2]
-    new_header = df_rooms.iloc[0]
-    nrooms = new_header[1]
-    df_rooms = df_rooms[1:]
-    df_rooms.columns = new_header
-    df_teachers = df_raw.loc[t_start:]
-    new_header = df_teachers.iloc[0]
-    nteachers = new_header[1]
-    df_teachers = df_teachers[1:]
-    df_teachers.columns = new_header
-
-    # construct ClassRoom and Course objects
-    all_rooms = [ClassRoom(r, int(
-        df_rooms.loc[df_rooms['Rooms'] == r, nrooms])) for r in df_rooms['Rooms']]
-    all_classes = [Course(int(c), int(df_teachers.loc[df_teachers['Teachers'] == c, nteachers])) for c in
-                   df_teachers['Teachers']]
-    all_teachers = {}
-
-    # construct teacher list
-    for t in range(1, int(nteachers) + 1):
-        all_teachers[t] = list(map(int, df_teachers.loc[df_teachers[nteachers] == t, 'Teachers'].tolist()))
-
-    return ntimes, all_rooms, all_classes, all_teachers
-
-
-def read_enrollment(filename):
-    """ Parse preference lists input
-        Args:
-            filename (string): name of the input preferece lists
-        Returns:
-            all_students (list): a list of Student objects with arrtibute `idx` (int) and `classes` (a list of int)
-    """
-    # read input file
-    df = pd.read_csv(filename, skiprows=1, sep="\t", names=['Student', 'Classes'])
-
-    try:
-        # put each student's class choices into a list
-        student_classes = {}
-        for index, row in df.iterrows():
-            student_classes[int(row['Student'])] = list(map(int, row['Classes'].split()))
-    except:
-        traceback.print_exc()
-        print("Index, row went wrong:", index, row)
-        exit(-1)
-
-    # construct a list of Student objects
-    all_students = [Student(i, student_classes[i]) for i in student_classes]
-
-    return all_students
-
-def map_prefs(i, all_classes):
-    """ Used for map in read_extension_prefs """
-    return all_classes[int(i)-1].name
-
-
-def read_extension_prefs(filename, all_classes):
-    """ Parse preference lists input
-        Args:
-            filename (string): name of the input preferece lists
-        Returns:
-            all_students (list): a list of Student objects with arrtibute `idx` (int) and `classes` (a list of int)
-    """
-    # read input file
-    df = pd.read_csv(filename, sep="\t", names=['Student', 'Classes'])[1:]
-
-    try:
-        # put each student's class choices into a list
-        student_classes = {}
-        for index, row in df.iterrows():
-            student_classes[int(row['Student'])] = [map_prefs(i, all_classes) for i in row['Classes'].split()]
-    except:
-        print("When reading extension prefs, something went wrong:")
-        traceback.print_exc()
-        print("The student's row:", index, row)
-        exit(1)
-
-    # construct a list of Student objects
-    all_students = [Student(i, student_classes[i]) for i in student_classes]
-
-    return all_students
-
-
-def read_extension_constraints(filename_rt, filename_c):
-    """ Parse constraints info
-        Args:
-            filename (string): name of the input file
-        Returns:
-            all_rooms (list): a list of Classroom objects, with attributes `idx` (str) and `capacity` (int)
-            all_classes (list): a list of Course objects, with attributes `name` (str), `teacher` (int), and 
-            `specs` (empty list), `dept` (string), `level` (int), core=False
-            all_times (dict): {index_time: [start(string), end(string), day(string)]}
-            all_teachers (dict): {teacher_id (int): [class_name (int), personal_conflicts (list of ints)]}
-    """
-
-    # read file
-    df_raw = pd.read_csv(filename_rt, sep='\t', header=None)
-
-    # process last two lines of constraint file 1
-    teacher_line =  df_raw[df_raw[0] == "Teachers"].index[0]
-    num_classes = int(df_raw[df_raw[0] == "Classes"].iloc[:, 1])
-    num_profs = int(df_raw[df_raw[0] == "Teachers"].iloc[:, 1])
-
-    r_start = df_raw[df_raw[0] == "Rooms"].index[0]
-    ntimes = int(df_raw.loc[0, 1])
-    df_times = df_raw[1:r_start]
-    all_times = {}
-    for index, times in df_times.iterrows():
-        row = times.to_string(header=False, index=False)
-        row = row[row.find("\n"):].strip()
-        split_1 = row.find("M") + 1
-        start = row[:split_1]
-        row = row[split_1 + 1:].strip()
-        split_2 = row.find("M")
-        end = row[:split_2 + 1]
-        days = row[split_2 + 2:]
-        all_times[index] = [start, end, days]
-
-    # process room info
-    df_rooms = df_raw[r_start + 1:teacher_line]
-    all_rooms = [ClassRoom(row[0], int(row[1]))
-                 for index, row in df_rooms.iterrows()]
-
-    # process class info from second file
-    df_class_info = pd.read_csv(filename_c, sep='\t', header=None)
-    df_class_info.columns = ['Class', 'Teacher', 'Subject', 'Level']
-    all_classes = []
-    classes_with_labs = []
-    all_teachers = defaultdict(list)
-
-    # construct Course objects for lectures
-    # record which teacher teach which classes
-    # All labs don't have instructor ID, find them and put into a separate list
-    try:
-        for index, row in df_class_info.iterrows():
-            # check for NaN, should be false if teacher is NaN
-            if "L" in row['Class']:
-                if row['Teacher'] != row['Teacher']:
-                    classes_with_labs.append([int(row['Class'][:-1]), 0])
-                else:
-                    classes_with_labs.append([int(row['Class'][:-1]), int(row['Teacher'])])
-            else:
-                all_classes.append(Course(int(row['Class']), int(
-                    row['Teacher']), None, row['Subject'], int(row['Level'])))
-                all_teachers[int(row['Teacher'])].append(int(row['Class']))
-
-    except:
-        print("When trying to process the following class, something went wrong:")
-        traceback.print_exc()
-        print(row, index)
-        exit(-1)
-
-    # add has_lab attribute and append Course ID to lab instructor's class list
-    try:
-        for i in classes_with_labs:
-            c = find_class(all_classes, i[0])
-            c.has_lab = c.teacher if i[1]==0 else i[1]
-            if i[1]!=0:
-                all_teachers[i[1]].append(i[0])
-    except:
-        traceback.print_exc()
-        print("Possibly can't find the lecture section of this lab")
-        print(i)
-        exit(-1)
-
-    # randomly assign personal conflicts for profs
-    for t in all_teachers:
-        n_unavailable_t = randrange(0, 5)
-        all_teachers[t] = [all_teachers[t], [randrange(1, len(all_times)+1) for n in range(n_unavailable_t)]]
-
-    return all_times, all_rooms, all_classes, all_teachers
-
-
 def count_prefs(C, S):
     """ Initialize the pool of prospective students for all classes
         Args:
-            C (list): a list of Course objects - `specs` field will contain Student objects after executing this function
-            S (list): a list of Student objects
+            C (CourseRegistry or list): Course objects - `specs` field will contain Student objects after executing
+            this function
+            S (list or StudentPool): a list of Student objects, or a pool whose positions go into `specs`
     """
+    registry = C if isinstance(C, CourseRegistry) else CourseRegistry(C)
+    if isinstance(S, StudentPool):
+        S.count_prefs(registry)
+        return
     for s in S:
         for c_id in s.classes:
-            a_class = find_class(C, c_id)
-            if a_class and s not in a_class.specs:
-                a_class.specs.append(s)
-            # print('Adding student ' + str(s.idx) + ' to class ' + str(a_class.name))
+            if c_id in registry:
+                registry.add_demand(c_id, s)
 
 
-def print_schedule(schedule, fname):
-    """ Output schedule using pandas
-        Args:
-            schedule (dict): {Course: (ClassRoom, time, [Students])}
-    """
-    # create a dictionary for pandas to print
-    schedule = OrderedDict(sorted(schedule.items(), key=lambda t:t[0].name))
-    dict_schedule = OrderedDict()
-    keys = ["Course", "Room", "Teacher", "Time", "Students"]
-    for i in keys:
-        dict_schedule.setdefault(i, [])
-
-    for course in schedule:
-        dict_schedule["Course"].append(str(course.name))
-        dict_schedule["Room"].append(schedule[course][0].idx)
-        dict_schedule["Teacher"].append(str(course.teacher))
-        dict_schedule["Time"].append(str(schedule[course][1]))
-        dict_schedule["Students"].append(' '.join(
-            [str(s.idx) for s in sorted(schedule[course][2], key=lambda t: t.idx)]))
-
-    # construct a DataFrame from dictionary and print schedule
-    df_schedule = pd.DataFrame(dict_schedule)
-    df_schedule.to_csv(fname, index=False, sep="\t")
-
-
-def print_schedule_extension(schedule, fname, all_times):
-    """ Output schedule using pandas
+def print_schedule(schedule, fname, fmt='tsv'):
+    """ Output schedule in the tab separated format is_valid.pl reads, or another format of writers.py
         Args:
             schedule (dict): {Course: (ClassRoom, time, [Students])}
     """
+    write_schedule(schedule, fname, fmt)
 
-    schedule = OrderedDict(sorted(schedule.items(), key=lambda t:t[0].name))
-
-    f = open(fname, 'w')
-    f.write("Course\tRoom\tTeacher\tTime\tStudents\n")
-    for course in schedule:
-        f.write(str(course.name))
-        f.write("\t")
-        f.write(schedule[course][0].idx)
-        f.write("\t")
-        f.write(str(course.teacher))
-        f.write("\t")
-        f.write(repr_time(all_times[schedule[course][1]]))
-        f.write("\t")
-        f.write(' '.join([str(s.idx) for s in sorted(schedule[course][2], key=lambda t: t.idx)]))
-        f.write("\n")
-    f.close()
-
-
-def repr_time(t):
-    """ convert time back to a printable form 
+
+def print_schedule_extension(schedule, fname, all_times, fmt='tsv'):
+    """ Output the extension schedule with readable times
         Args:
-            t (list): [start (int), end (int), days (list)] e.g.[1000, 1100, ['T', 'H']]
-        Returns:
-            str_t (string): "10:00 AM  11:00 AM TH"
+            schedule (dict): {Course: (ClassRoom, time, [Students])}
     """
-    str_t = ""
-    for i in range(2):
-        if t[i] >= 1200:
-            if t[i] // 100 == 12:
-                str_t += str(t[i] // 100)+ ":" + str(t[i] % 100).zfill(2) + " PM"
-            else:
-                str_t += str(t[i] // 100 - 12)+ ":" + str(t[i] % 100).zfill(2) + " PM"
-        else:
-            str_t += str(t[i] // 100)+ ":" + str(t[i] % 100).zfill(2) + " AM"
-        str_t += " "
-    str_t += "".join(t[2])
-    return str_t
+    write_schedule(schedule, fname, fmt, all_times)
 
 
 """ Helper Functions """
@@ -341,47 +65,28 @@ def repr_time(t):
 def find_class(C, c_id):
     """ find the class object by its id
         Args:
-            C (iterable): a list of Course objects or a dictionary with Course objects as keys
+            C (iterable): a CourseRegistry, a list of Course objects or a dictionary with Course objects as keys
             c_id (int): index of the class
         Returns:
             this_class (Course object)
             False if no matching class found
     """
+    stats.count('find_class_calls')
+    if isinstance(C, CourseRegistry):
+        return C.lecture(c_id)
     for this_class in C:
         if this_class.name == c_id:
             return this_class
     return False
 
 
-def build_time_table(time_list):
-    """ Convert format from string to 24h clock in order to detect time conlifcts """
-
-    for time in time_list:
-        # parse start time
-        split_point_s = time_list[time][0].find(":")
-        start_h = int(time_list[time][0][:split_point_s])
-        start_min = int(time_list[time][0][split_point_s + 1:split_point_s + 3])
-        if time_list[time][0][-2] == "P":
-            if start_h != 12:
-                start_h += 12
-        time_list[time][0] = start_h * 100 + start_min
-        # parse end time
-        split_point_e = time_list[time][1].find(":")
-        end_h = int(time_list[time][1][:split_point_e])
-        end_min = int(time_list[time][1][split_point_e + 1:split_point_e + 3])
-        if time_list[time][1][-2] == "P":
-            if end_h != 12:
-                end_h += 12
-        time_list[time][1] = end_h * 100 + end_min
-        # parse day
-        """
-        day_list = []
-        for char in time_list[time][2] :
-            if char != " ":
-                day_list.append(char)
-        time_list[time][2] = day_list
-        """
-        time_list[time][2] = time_list[time][2].split()
+def clone_lab(course, lab_prof, registry=None):
+    """ Create the lab section of a lecture, it shares name and specs with the lecture and has `has_lab` -1 """
+    lab = Course(course.name, lab_prof, course.specs, course.dept, course.level)
+    lab.has_lab = -1
+    if registry is not None:
+        registry.add_lab(lab)
+    return lab
 
 
 def seperate_time_table(time_list):
@@ -397,34 +102,47 @@ def seperate_time_table(time_list):
     return lab_time, class_time
 
 
-def choose_student(schedule):
+def choose_student(schedule, pool=None, rng=None):
     """ Choose student from specs to into the student list of corresponding class in dictionary
         Args:
             schedule (dict): {Course: (ClassRoom, time, [Students])}
+            pool (StudentPool): if `specs` hold positions in this pool, it admits them instead
+            rng (random.Random): shuffles the students, the `random` module if None
     """
-    for a_class in schedule:
+    if pool is not None:
+        pool.admit(schedule, rng=rng)
+        return
+    mix = rng.shuffle if rng is not None else shuffle
+    for a_class, (room, time, admitted) in schedule.items():
         student_list = a_class.specs
-        shuffle(student_list)
-        time = schedule[a_class][1]
+        mix(student_list)
         count = 0
         for student in student_list:
-            if count >= schedule[a_class][0].capacity:
+            if count >= room.capacity:
                 break
             elif time in student.taken:
                 continue
             else:
-                schedule.get(a_class)[2].append(student)
+                admitted.append(student)
                 count = count + 1
                 student.taken.append(time)
 
 
-def find_lab(schedule,course):
+def find_lab(schedule, course, registry=None):
     """ find whether a course has a lab. If so return a tuple contains this class and lab, otherwise, return an
         empty tuple:
         Args:
              schedule (dict): {Course: (ClassRoom, time, [Students])}
              course: Course 
+             registry (CourseRegistry): labs created while scheduling, the schedule is searched without it
     """
+    if isinstance(schedule, ScheduleView):
+        return schedule.lab(course)
+    if registry is not None:
+        lab = registry.lab(course.name)
+        if lab and lab in schedule:
+            return lab
+        return None
     for lab in schedule:
         if lab.name == course.name and lab != course:
             return lab
@@ -433,48 +151,56 @@ def check_student_conflict(t1,student,time_list):
     """
        check whether a student has conflicted class in his schedule with input time
     """
+    stats.count('student_conflict_checks')
     for t2 in student.taken:
         if time_conflict(t1,t2,time_list):
             return True
     return False
             
                 
-def choose_student_extension(schedule,time_list):
+def choose_student_extension(schedule, time_list, registry=None, pool=None, rng=None):
     """ Choose student from specs to into the student list of corresponding class in dictionary
         Args:
             schedule (dict): {Course: (ClassRoom, time, [Students])}
+            registry (CourseRegistry): used to look up labs
+            pool (StudentPool): if `specs` hold positions in this pool, it admits them instead
+            rng (random.Random): shuffles the students, the `random` module if None
         If the course has a lab, lab will share the same name of that course and stored time in it.
     """
-    for a_class in schedule:
+    if pool is not None:
+        pool.admit(schedule, time_list, registry, rng)
+        return
+    mix = rng.shuffle if rng is not None else shuffle
+    #if a_class has lab, its has_lab attribute will be more than 0, and the lab comes with it
+    for a_class, (room, time_class, admitted), lab, lab_value in schedule_sections(schedule, registry):
         student_list = a_class.specs
-        shuffle(student_list)
-        time_class = schedule[a_class][1]
+        mix(student_list)
         count = 0
-        #if a_class has lab, its has_lab attribute will be more than 0, and we will find lab
-        if a_class.has_lab > 0 and find_lab(schedule,a_class):
-            lab = find_lab(schedule,a_class)
-            time_lab = schedule[lab][1]
+        if lab:
+            lab_room, time_lab, lab_admitted = lab_value
+            # students attend both sections, so the smaller room is the limit
+            capacity = min(room.capacity, lab_room.capacity)
             for student in student_list:
-                 if count >= schedule[a_class][0].capacity:
+                 if count >= capacity:
                      break
                  elif check_student_conflict(time_class, student, time_list) or check_student_conflict(time_lab, student, time_list):
                      continue
                  else:
-                     schedule[a_class][2].append(student)
-                     schedule[lab][2].append(student)
+                     admitted.append(student)
+                     lab_admitted.append(student)
                      count = count + 1
-                     student.taken.append(schedule[a_class][1])
-                     student.taken.append(schedule[lab][1])
+                     student.taken.append(time_class)
+                     student.taken.append(time_lab)
         elif a_class.has_lab == 0:
             for student in student_list:
-                 if count >= schedule[a_class][0].capacity:
+                 if count >= room.capacity:
                      break
                  elif check_student_conflict(time_class, student, time_list):
                      continue
                  else:
-                     schedule[a_class][2].append(student)
+                     admitted.append(student)
                      count = count + 1
-                     student.taken.append(schedule[a_class][1]) 
+                     student.taken.append(time_class) 
 
 def assign_core(class_list):
     core_count = {}
@@ -491,7 +217,7 @@ def assign_core(class_list):
                 core_count[course.dept][course.level -1] = core_count[course.dept][course.level - 1] - 1
 
 
-def TeacherIsValid(teacherList, result, classToSchedule, timeToSchedule):
+def TeacherIsValid(teacherList, result, classToSchedule, timeToSchedule, registry=None):
     """
     Test whether the class we are scheduling has conflict respect to teachers (whether they're taught by the same teacher and both classes are at the same time slot)
     Args:
@@ -499,10 +225,15 @@ def TeacherIsValid(teacherList, result, classToSchedule, timeToSchedule):
         result: The schedule we have so far. Key is class, value is a tuple -> (location, time, students)
         classToSchedule: The class we're currently scheduling.
         timeToSchedule: The time we're considering.
+        registry: CourseRegistry to look classes up by name, otherwise `result` is searched
     """
+    stats.count('conflict_checks')
     teacher = classToSchedule.teacher
     classes = teacherList[teacher]
-    already_scheduled = [find_class(result, c) for c in classes if find_class(result, c)]
+    if registry is None:
+        already_scheduled = [find_class(result, c) for c in classes if find_class(result, c)]
+    else:
+        already_scheduled = [c for c in map(registry.lecture, classes) if c in result]
     return (not any(result[c][1] == timeToSchedule for c in already_scheduled))
 
 
@@ -518,6 +249,9 @@ def sort_class(course):
 
 def time_conflict(t1, t2, time_list):
     """ Return true if two time slots t1 and t2 overlaps, false otherwise """
+    stats.count('conflict_checks')
+    if isinstance(time_list, TimeTable) and time_list.overlap:
+        return (time_list.overlap[t1] >> t2) & 1 == 1
     # test whether days are the same
     if any(day in time_list[t1][2] for day in time_list[t2][2]):
         #if days overlap, sort by start time
@@ -542,152 +276,106 @@ def check_time_conflict(t1, teacher_unavailable, timelist, all_rooms, index_r):
 """ Actual Scheduling Algorithm """    
 
 def make_schedule_basic(all_students, all_classes, all_rooms, ntimes, teacherList):
+    """
+        Args:
+            all_classes (list): list of Course objects w/ attr. name (int), teacher (int), specs (list of Students)
+            all_rooms (list): list of ClassRoom obejcts, w/ attr. idx (str), capacity (int)
+            ntimes (int): the number of non-overlapping time slots
+            teacherList (dict): {teacher_id (int): class_name (int)}, teacher conflicts are tracked from the
+                                `teacher` of each class as it's placed
+        Returns:
+            schedule (ScheduleView): {Course: (ClassRoom, time, [Students])}, a view of the ScheduleGrid the
+                                     classes were placed in
+    """
     # sort classes by popularity, sort classrooms by size
     all_classes.sort(key=lambda x: len(x.specs), reverse=True)
     all_rooms.sort(key=lambda x: x.capacity, reverse=True)
 
-    skipped_slots = []
+    # room-time pairs passed over because the teacher of the class at hand was busy
+    skipped_slots = FreeSlots()
+    # bitmasks of the time slots each teacher already teaches in, kept up to date as classes are placed
+    teacher_times = defaultdict(int)
     nslots = len(all_rooms) * ntimes
     index_class = 0
     index_slot = 0
-    result = {}
+    result = ScheduleGrid(all_rooms, range(1, ntimes + 1)).view
+
+    def place(course, index_r, time):
+        result.place_at(course, index_r, time, [])
+        teacher_times[course.teacher] |= 1 << time
 
     # index_slot represents the current slot in the while_loop
     # index_room = index_slot//ntimes
     # index_time = index_slot % ntimes+1
     while index_class < len(all_classes) and index_slot < nslots:
-        if len(skipped_slots) == 0:
-            while not TeacherIsValid(teacherList, result, all_classes[index_class], index_slot % ntimes + 1) and index_slot < nslots:
-                # class name : location, time, students
-                skipped_slots.append(index_slot)
+        course = all_classes[index_class]
+        # the first skipped slot the teacher is free at
+        found = skipped_slots.first(~teacher_times[course.teacher])
+        if found is not None:
+            skipped_slots.claim(*found)
+            place(course, *found)
+        else:
+            while index_slot < nslots and (teacher_times[course.teacher] >> (index_slot % ntimes + 1)) & 1:
+                skipped_slots.release(index_slot // ntimes, index_slot % ntimes + 1)
+                stats.count('slots_skipped')
                 index_slot = index_slot + 1
             if index_slot < nslots: #else will actually break out of while loop
-                result[all_classes[index_class]] = (all_rooms[index_slot // ntimes], index_slot % ntimes + 1, [])
+                place(course, index_slot // ntimes, index_slot % ntimes + 1)
                 index_slot = index_slot + 1
-        else:
-            copy_skipped_slots = []
-            assigned = False  # mark whether current class has been assigned
-            while len(skipped_slots) > 0:
-                possible_time = skipped_slots.pop(0)
-                if TeacherIsValid(teacherList, result, all_classes[index_class], possible_time % ntimes + 1):
-                    # class name : location, time, Students
-                    result[all_classes[index_class]] = (all_rooms[possible_time // ntimes], possible_time % ntimes + 1, [])
-                    assigned = True
-                    break
-                else:
-                    copy_skipped_slots = [possible_time] + copy_skipped_slots                 
-            if len(skipped_slots) == 0:
-                if not assigned:
-                    while not TeacherIsValid(teacherList, result, all_classes[index_class], index_slot % ntimes + 1) and index_slot < nslots:
-                        # class name : location, time, students
-                        skipped_slots.append(index_slot)                        
-                        index_slot = index_slot + 1
-                    if index_slot < nslots: #else will actually break out of while loop
-                        result[all_classes[index_class]] = (all_rooms[index_slot // ntimes], index_slot % ntimes + 1, [])
-                        index_slot += 1
-            # recover skipped_slots
-            skipped_slots += copy_skipped_slots
-
         index_class = index_class + 1
 
     # try to fully utilize skipped slots
-    while index_class < len(all_classes):
-        skipped_copy = []
-        while len(skipped_slots) > 0:
-            possible_time = skipped_slots.pop(0)
-            if TeacherIsValid(teacherList, result, all_classes[index_class], possible_time % ntimes + 1):
-                result[all_classes[index_class]] = (all_rooms[possible_time // ntimes], possible_time % ntimes + 1, [])
-                break
-            else:
-                skipped_copy.append(possible_time)
+    while index_class < len(all_classes) and skipped_slots:
+        course = all_classes[index_class]
+        found = skipped_slots.first(~teacher_times[course.teacher])
+        if found is not None:
+            skipped_slots.claim(*found)
+            place(course, *found)
         index_class += 1
-        skipped_slots = skipped_copy
 
     return result
 
 
-def make_lab(lab, timelist, lec_time, lec_queue, lab_queue, teacherList, all_classes, all_rooms, result, index_slot,
-             ntimes, lab_prof):
+def place_lab(lab, lab_prof, index_r, time, all_classes, all_rooms, result, registry, occupancy):
+    """ Put the lab section of all_classes[lab], taught by lab_prof, in the room at position index_r at `time` """
+    if all_classes[lab].dept == "ARTS":
+        result.place_at(all_classes[lab], index_r, time, [])
+    else:
+        new_course = clone_lab(all_classes[lab], lab_prof, registry)
+        result.place_at(new_course, index_r, time, [])
+    # assign time to room
+    occupancy.block_room(index_r, time)
+    occupancy.block_teacher(lab_prof, time)
+
+
+def make_lab(lab, timelist, lec_time, teacherList, all_classes, all_rooms, result, index_slot, ntimes, lab_prof,
+             registry=None, occupancy=None):
+    """ Schedule the lab section of all_classes[lab], taught by lab_prof, in the first lab slot that fits: a
+        skipped one if there is one, otherwise the next one of the scheduler's sweep.
+        occupancy (Occupancy) holds the times rooms and teachers are already blocked and the skipped slots, it's
+        updated in place
+    """
+    if occupancy is None:
+        occupancy = Occupancy(timelist, all_rooms, teacherList)
     nslots = len(timelist) * len(all_rooms)
-    if len(lab_queue) == 0:
-        while index_slot < nslots and (index_slot % ntimes + 1 in lec_time.keys() or \
-                check_time_conflict(index_slot % ntimes + 1, teacherList[lab_prof][1],
-                                        timelist, all_rooms, index_slot // ntimes)):
-            if index_slot % ntimes + 1 in lec_time.keys():
-                lec_queue.append(index_slot)
-            else:
-                lab_queue.append(index_slot)
+    lab_times = sum(1 << t for t in timelist if t not in lec_time)
+    found = occupancy.first_free(lab_prof, lab_times)
+    if found is not None:
+        place_lab(lab, lab_prof, found[0], found[1], all_classes, all_rooms, result, registry, occupancy)
+    else:
+        while index_slot < nslots and (index_slot % ntimes + 1 in lec_time or \
+                occupancy.conflict(index_slot % ntimes + 1, lab_prof, index_slot // ntimes)):
+            occupancy.skip(index_slot // ntimes, index_slot % ntimes + 1)
             index_slot = index_slot + 1
-        if index_slot < nslots and not check_time_conflict(index_slot % ntimes + 1, teacherList[lab_prof][1],
-                timelist, all_rooms, index_slot // ntimes):
-            if all_classes[lab].dept == "ARTS":
-                result[all_classes[lab]] = (all_rooms[index_slot // ntimes], index_slot % ntimes + 1, [])
-            else:
-                new_course = Course(all_classes[lab].name, lab_prof, all_classes[lab].specs,
-                                    all_classes[lab].dept, all_classes[lab].level)
-                new_course.has_lab = -1
-                result[new_course] = (all_rooms[index_slot // ntimes], index_slot % ntimes + 1, [])
-            # assign time to room
-            all_rooms[index_slot // ntimes].taken.append(index_slot % ntimes + 1)
-            teacherList[lab_prof][1].append(index_slot % ntimes + 1)
+        if index_slot < nslots:
+            place_lab(lab, lab_prof, index_slot // ntimes, index_slot % ntimes + 1, all_classes, all_rooms, result,
+                      registry, occupancy)
             index_slot = index_slot + 1
 
-    else:
-        copy_lab = []
-        assigned = False
-        while not len(lab_queue) == 0:
-            possible_time = lab_queue.pop(0)
-
-            # if no conflict, assign class
-            if not check_time_conflict(possible_time % ntimes + 1, teacherList[lab_prof][1], timelist,
-                                   all_rooms, possible_time // ntimes):
-                # class name : location, time, Students
-                if all_classes[lab].dept == "ARTS":
-                    result[all_classes[lab]] = (all_rooms[possible_time // ntimes],
-                                                possible_time % ntimes + 1, [])
-                else:
-                    new_course = Course(all_classes[lab].name, lab_prof, all_classes[lab].specs,
-                                        all_classes[lab].dept, all_classes[lab].level)
-                    new_course.has_lab = -1
-                    result[new_course] = (all_rooms[possible_time // ntimes],
-                                          possible_time % ntimes + 1, [])
-                all_rooms[possible_time // ntimes].taken.append(possible_time % ntimes + 1)
-                teacherList[lab_prof][1].append(possible_time % ntimes + 1)
-                assigned = True
-                break
-            else:
-                copy_lab.append(possible_time)
-
-        if len(lab_queue) == 0:
-            if not assigned:
-                while index_slot < nslots and (check_time_conflict(index_slot % ntimes + 1, teacherList[lab_prof][1],
-                                              timelist, all_rooms, index_slot // ntimes) or index_slot % ntimes + 1 in lec_time.keys()):
-                    if index_slot % ntimes + 1 in lec_time.keys():
-                        lec_queue.append(index_slot)
-                    else:
-                        lab_queue.append(index_slot)
-                    index_slot = index_slot + 1
-                if index_slot < nslots and not check_time_conflict(index_slot % ntimes + 1, teacherList[lab_prof][1],
-                         timelist, all_rooms, index_slot // ntimes):
-                    if all_classes[lab].dept == "ARTS":
-                        result[all_classes[lab]] = (all_rooms[index_slot // ntimes],
-                                                    index_slot % ntimes + 1, [])
-                    else:
-                        new_course = Course(all_classes[lab].name, lab_prof, all_classes[lab].specs,
-                                            all_classes[lab].dept, all_classes[lab].level)
-                        new_course.has_lab = -1
-                        result[new_course] = (all_rooms[index_slot // ntimes],
-                                              index_slot % ntimes + 1, [])
-                    all_rooms[index_slot // ntimes].taken.append(index_slot % ntimes + 1)
-                    teacherList[lab_prof][1].append(possible_time % ntimes + 1)
-                    index_slot = index_slot + 1
-        # recover skipped_slots
-        lab_queue += copy_lab
-
-    return result, index_slot, lec_queue, lab_queue, teacherList
+    return result, index_slot, teacherList
 
 
-def make_schedule_extension(all_classes, all_rooms, teacherList, time_list):
+def make_schedule_extension(all_classes, all_rooms, teacherList, time_list, registry=None):
     """
         Args:
             all_classes (list): list of Course objects w/ attr. name (int), teacher (int), dept (str),
@@ -695,211 +383,468 @@ def make_schedule_extension(all_classes, all_rooms, teacherList, time_list):
             all_rooms (list): list of ClassRoom obejcts, w/ attr. idx (str), capacity (int)
             teacherList (dict): {teacher_id (int): [class_name (int), personal_conflicts (list of ints)]}
             time_list (dict): {index_time: [start(int), end(int), day(list of strings)]}
+            registry (CourseRegistry): lab sections created here are registered in it
         Returns:
-            schedule (dict): {Course: (ClassRoom, time, [Students])}
+            schedule (ScheduleView): {Course: (ClassRoom, time, [Students])}, a view of the ScheduleGrid the
+                                     classes were placed in
     """
+    if registry is None:
+        registry = CourseRegistry(all_classes)
 
     all_classes.sort(key=lambda x: sort_class(x), reverse=True)
     all_rooms.sort(key=lambda x: x.capacity, reverse=True)
     lab_time, lec_time = seperate_time_table(time_list)
-    skipped_slots_lec = []
-    skipped_slots_lab = []
+    lec_times = sum(1 << t for t in lec_time)
+    lab_times = sum(1 << t for t in lab_time)
+    # rooms are referred to by their position in all_rooms from here on, and skipped slots are kept in
+    # occupancy.free
+    occupancy = Occupancy(time_list, all_rooms, teacherList)
     ntimes = len(time_list)
     nslots = len(all_rooms) * ntimes
     index_class = 0
     index_slot = 0
-    result = {}
+    result = ScheduleGrid(all_rooms, time_list).view
+
+    def place(course, index_r, time):
+        result.place_at(course, index_r, time, [])
+        occupancy.block_room(index_r, time)
+        occupancy.block_teacher(course.teacher, time)
+
     while index_class < len(all_classes) and index_slot < nslots:
-        if all_classes[index_class].dept == "ARTS":
-            result, index_slot, skipped_slots_lec, skipped_slots_lab, teacherList= \
-                make_lab(index_class, time_list, lec_time, skipped_slots_lec,
-                         skipped_slots_lab, teacherList, all_classes, all_rooms, result, index_slot,
-                         ntimes, all_classes[index_class].teacher)
-            teacherList[all_classes[index_class].teacher][1].append((index_slot-1) % ntimes + 1)
+        course = all_classes[index_class]
+        if course.dept == "ARTS":
+            result, index_slot, teacherList = make_lab(index_class, time_list, lec_time, teacherList, all_classes,
+                                                       all_rooms, result, index_slot, ntimes, course.teacher,
+                                                       registry, occupancy)
+            occupancy.block_teacher(course.teacher, (index_slot-1) % ntimes + 1)
         else:
-            if len(skipped_slots_lec) == 0:
-                # teacherList[all_classes[index_class].teacher][1] are time that have already been taken
-                while index_slot < nslots and (index_slot % ntimes + 1 in lab_time.keys() or check_time_conflict(
-                    index_slot % ntimes + 1, teacherList[all_classes[index_class].teacher][1],
-                    time_list, all_rooms, index_slot // ntimes)):
-                    # class name : location, time, students
-                    if index_slot % ntimes + 1 in lab_time.keys():
-                        skipped_slots_lab.append(index_slot)
-                    else:
-                        skipped_slots_lec.append(index_slot)
+            # the first skipped lecture slot that fits, otherwise the next one of the sweep
+            found = occupancy.first_free(course.teacher, lec_times)
+            if found is None:
+                # occupancy.teacher[course.teacher] are time that have already been taken
+                while index_slot < nslots and (index_slot % ntimes + 1 in lab_time or occupancy.conflict(
+                        index_slot % ntimes + 1, course.teacher, index_slot // ntimes)):
+                    occupancy.skip(index_slot // ntimes, index_slot % ntimes + 1)
                     index_slot = index_slot + 1
-
-                if index_slot < nslots and not check_time_conflict(
-                    index_slot % ntimes + 1, teacherList[all_classes[index_class].teacher][1],
-                    time_list, all_rooms, index_slot // ntimes): #else will actually exit out of while loop
-                    result[all_classes[index_class]] = (all_rooms[index_slot // ntimes], index_slot % ntimes + 1, [])
-                    all_rooms[index_slot // ntimes].taken.append(index_slot % ntimes + 1)
-                    teacherList[all_classes[index_class].teacher][1].append(index_slot % ntimes + 1)
+                if index_slot < nslots: #else will actually exit out of while loop
+                    found = (index_slot // ntimes, index_slot % ntimes + 1)
                     index_slot += 1
-                    
-                    if all_classes[index_class].has_lab != 0 and index_slot < nslots:
-                        # append the lecture time to lab instructor's unavailable times
-                        # so that labs won't conflict with lecture
-                        if index_slot % ntimes + 1 not in teacherList[all_classes[index_class].has_lab][1]:
-                            teacherList[all_classes[index_class].has_lab][1].append(index_slot % ntimes + 1)
-                        result, index_slot, skipped_slots_lec, skipped_slots_lab, teacherList = make_lab(
-                            index_class, time_list, lec_time, skipped_slots_lec, skipped_slots_lab, 
-                            teacherList, all_classes, all_rooms, result, index_slot, ntimes, 
-                            all_classes[index_class].has_lab)
-
-            else:
-                copy_skipped_slots = []
-                assigned = False  # mark whether current class has been assigned
-                while len(skipped_slots_lec) > 0:
-                    possible_time = skipped_slots_lec.pop(0)
-
-                    # if no conflict, assign class
-                    if not check_time_conflict(possible_time % ntimes + 1, teacherList[all_classes[index_class].teacher][1],
-                                           time_list, all_rooms, possible_time // ntimes):
-                        # class name : location, time, Students
-                        result[all_classes[index_class]] = (
-                            all_rooms[possible_time // ntimes], possible_time % ntimes + 1, [])
-                        all_rooms[possible_time // ntimes].taken.append(possible_time % ntimes + 1)
-                        teacherList[all_classes[index_class].teacher][1].append(possible_time % ntimes + 1)
-                        assigned = True
-                        if all_classes[index_class].has_lab > 0:
-                            if possible_time % ntimes + 1 not in teacherList[all_classes[index_class].has_lab][1]:
-                                teacherList[all_classes[index_class].has_lab][1].append(possible_time % ntimes + 1)
-                            result, index_slot, skipped_slots_lec, skipped_slots_lab, teacherList = make_lab(
-                                index_class, time_list, lec_time, skipped_slots_lec, skipped_slots_lab, 
-                                teacherList, all_classes, all_rooms, result, index_slot, ntimes, 
-                                all_classes[index_class].has_lab)
-                        break
-                    else:
-                        copy_skipped_slots.append(possible_time)
-
-                if len(skipped_slots_lec) == 0:
-                    if not assigned:
-                        while index_slot < nslots and (index_slot % ntimes + 1 in lab_time.keys() or check_time_conflict(
-                            index_slot % ntimes + 1, teacherList[all_classes[index_class].teacher][1], time_list,
-                            all_rooms, index_slot // ntimes)):
-                            # class name : location, time, students
-                            if index_slot % ntimes + 1 in lab_time.keys():
-                                skipped_slots_lab.append(index_slot)
-
-                            else:
-                                skipped_slots_lec.append(index_slot)
-
-                            index_slot = index_slot + 1
-
-                        if index_slot < nslots and not check_time_conflict(
-                                index_slot % ntimes + 1, teacherList[all_classes[index_class].teacher][1],
-                                time_list, all_rooms, index_slot // ntimes): #else will actually exit out of while loop
-                            result[all_classes[index_class]] = (all_rooms[index_slot // ntimes], index_slot % ntimes + 1, [])
-                            all_rooms[index_slot // ntimes].taken.append(index_slot % ntimes + 1)
-                            teacherList[all_classes[index_class].teacher][1].append(index_slot % ntimes + 1)
-                            index_slot += 1
-                            if all_classes[index_class].has_lab > 0:
-                                if index_slot % ntimes + 1 not in teacherList[all_classes[index_class].has_lab][1]:
-                                    teacherList[all_classes[index_class].has_lab][1].append(index_slot % ntimes + 1)
-                                result, index_slot, skipped_slots_lec, skipped_slots_lab, teacherList = make_lab(
-                                        index_class, time_list, lec_time, skipped_slots_lec,
-                                             skipped_slots_lab, teacherList, all_classes, all_rooms, result, index_slot,
-                                             ntimes, all_classes[index_class].has_lab)
-                # recover skipped_slots
-                skipped_slots_lec += copy_skipped_slots
+            if found is not None:
+                place(course, *found)
+                if course.has_lab > 0:
+                    # append the lecture time to lab instructor's unavailable times
+                    # so that labs won't conflict with lecture
+                    occupancy.block_teacher(course.has_lab, found[1])
+                    result, index_slot, teacherList = make_lab(
+                        index_class, time_list, lec_time, teacherList, all_classes, all_rooms, result, index_slot,
+                        ntimes, course.has_lab, registry, occupancy)
 
         index_class = index_class + 1
 
-
     # try to schedule remaining classes with skipped slots
-    while index_class < len(all_classes) and (skipped_slots_lec or skipped_slots_lab):
-        if all_classes[index_class].dept == "ARTS" and skipped_slots_lab:
-            skipped_copy = []
-            while len(skipped_slots_lab) > 0:
-                potential_time = skipped_slots_lab.pop(0)
-                if not check_time_conflict(potential_time % ntimes + 1, teacherList[all_classes[index_class].teacher][1],
-                                            time_list, all_rooms, potential_time // ntimes):
-                    result[all_classes[index_class]] = (all_rooms[potential_time // ntimes], potential_time % ntimes + 1, [])
-                    break
-                else:
-                    skipped_copy.append(potential_time)
-            index_class += 1
-            skipped_slots_lab = skipped_copy
-        elif skipped_slots_lec and all_classes[index_class].has_lab == 0:
-            skipped_copy = []
-            while len(skipped_slots_lec) > 0:
-                potential_time = skipped_slots_lec.pop(0)
-                if not check_time_conflict(potential_time % ntimes + 1, teacherList[all_classes[index_class].teacher][1],
-                                        time_list, all_rooms, potential_time // ntimes):
-                    result[all_classes[index_class]] = (all_rooms[potential_time // ntimes], potential_time % ntimes + 1, [])
-                    break
-                else:
-                    skipped_copy.append(potential_time)
-            index_class += 1
-            skipped_slots_lec = skipped_copy
-        else: # not scheduling classes with labs because it's too complicated... for now
-            index_class += 1
+    while index_class < len(all_classes) and occupancy.free:
+        course = all_classes[index_class]
+        found = None
+        if course.dept == "ARTS" and occupancy.free.times & lab_times:
+            found = occupancy.first_free(course.teacher, lab_times)
+        elif course.has_lab == 0 and occupancy.free.times & lec_times:
+            found = occupancy.first_free(course.teacher, lec_times)
+        # not scheduling classes with labs because it's too complicated... for now
+        if found is not None:
+            place(course, *found)
+        index_class += 1
 
     return result
 
 
+def make_schedule_basic_fit(all_students, all_classes, all_rooms, ntimes, teacherList):
+    """ Like make_schedule_basic, but instead of filling the largest room at every time before moving on to the
+        next one, every class gets the smallest room that holds its demand (`len(specs)`), or the largest room
+        left if none does. Among the times that room is free at, the one with the least demand so far is chosen,
+        so that popular classes don't all meet at once.
+        Returns:
+            schedule (ScheduleView): {Course: (ClassRoom, time, [Students])}, a view of the ScheduleGrid the
+                                     classes were placed in
+    """
+    all_classes.sort(key=lambda x: len(x.specs), reverse=True)
+    all_rooms.sort(key=lambda x: x.capacity, reverse=True)
+
+    free_slots = FreeSlots(None, [room.capacity for room in all_rooms])
+    for index_r in range(len(all_rooms)):
+        for time in range(1, ntimes + 1):
+            free_slots.release(index_r, time)
+    teacher_times = defaultdict(int)
+    load = defaultdict(int)
+    result = ScheduleGrid(all_rooms, range(1, ntimes + 1)).view
+    for course in all_classes:
+        if not free_slots:
+            break
+        found = free_slots.best_fit(~teacher_times[course.teacher], len(course.specs), load)
+        if found is not None:
+            index_r, time = found
+            free_slots.claim(index_r, time)
+            result.place_at(course, index_r, time, [])
+            teacher_times[course.teacher] |= 1 << time
+            load[time] += len(course.specs)
+    return result
 
 
+def make_schedule_extension_fit(all_classes, all_rooms, teacherList, time_list, registry=None):
+    """ Like make_schedule_extension, but every lecture and lab gets the smallest free room that holds the demand
+        of the course, as in make_schedule_basic_fit. Labs are placed right after their lecture.
+        Returns:
+            schedule (ScheduleView): {Course: (ClassRoom, time, [Students])}, a view of the ScheduleGrid the
+                                     classes were placed in
+    """
+    if registry is None:
+        registry = CourseRegistry(all_classes)
+
+    all_classes.sort(key=lambda x: sort_class(x), reverse=True)
+    all_rooms.sort(key=lambda x: x.capacity, reverse=True)
+    lab_time, lec_time = seperate_time_table(time_list)
+    lec_times = sum(1 << t for t in lec_time)
+    lab_times = sum(1 << t for t in lab_time)
+    occupancy = Occupancy(time_list, all_rooms, teacherList)
+    for index_r in range(len(all_rooms)):
+        for time in time_list:
+            if not (occupancy.room[index_r] >> time) & 1:
+                occupancy.free.release(index_r, time)
+    load = defaultdict(int)
+    result = ScheduleGrid(all_rooms, time_list).view
+
+    def fit(teacher, times, demand):
+        found = occupancy.free.best_fit(times & ~occupancy.teacher[teacher], demand, load)
+        if found is not None:
+            load[found[1]] += demand
+        return found
+
+    for index_class, course in enumerate(all_classes):
+        if not occupancy.free:
+            break
+        demand = len(course.specs)
+        if course.dept == "ARTS":
+            found = fit(course.teacher, lab_times, demand)
+            if found is not None:
+                place_lab(index_class, course.teacher, found[0], found[1], all_classes, all_rooms, result, registry,
+                          occupancy)
+            continue
+        found = fit(course.teacher, lec_times, demand)
+        if found is None:
+            continue
+        result.place_at(course, found[0], found[1], [])
+        occupancy.block_room(*found)
+        occupancy.block_teacher(course.teacher, found[1])
+        if course.has_lab > 0:
+            # so that the lab won't conflict with the lecture
+            occupancy.block_teacher(course.has_lab, found[1])
+            lab = fit(course.has_lab, lab_times, demand)
+            if lab is not None:
+                place_lab(index_class, course.has_lab, lab[0], lab[1], all_classes, all_rooms, result, registry,
+                          occupancy)
+    return result
+
+
+""" Pipelines """
+
+def report_improvement(result):
+    start, end, accepted = result
+    print("Local search: estimated preferences satisfied %.1f -> %.1f, %d moves kept" % (start, end, accepted))
+
+
+def room_fill(schedule):
+    """ How full every room is
+        Args:
+            schedule (dict): {Course: (ClassRoom, time, [Students])} with students admitted
+        Returns:
+            fill (list): (ClassRoom, number of classes, students, seats) for every room used, largest room first,
+            where seats are the capacity of the room times its number of classes
+    """
+    if isinstance(schedule, ScheduleView):
+        grid = schedule.grid
+        used, classes, students = grid.room_totals()
+        rooms = OrderedDict((grid.rooms[r], (int(classes[r]), int(students[r]))) for r in used)
+    else:
+        rooms = OrderedDict()
+        for course, (room, time, students) in schedule.items():
+            classes, taken = rooms.get(room, (0, 0))
+            rooms[room] = (classes + 1, taken + len(students))
+    fill = [(room, classes, taken, classes * room.capacity) for room, (classes, taken) in rooms.items()]
+    fill.sort(key=lambda x: x[0].capacity, reverse=True)
+    return fill
+
+
+def report_room_fill(schedule):
+    fill = room_fill(schedule)
+    print("Room fill: room, capacity, classes, students / seats")
+    for room, classes, taken, seats in fill:
+        print("%s\t%d\t%d\t%d / %d\t%.1f%%" % (room.idx, room.capacity, classes, taken, seats,
+                                                100.0 * taken / seats if seats else 0))
+    taken = sum(f[2] for f in fill)
+    seats = sum(f[3] for f in fill)
+    print("Overall: %d / %d seats filled, %.1f%%" % (taken, seats, 100.0 * taken / seats if seats else 0))
+
+
+def schedule_basic(all_students, ntimes, all_rooms, all_classes, all_teachers, admission='greedy', improve=0,
+                   rooms='sweep', rng=None):
+    """ Make a schedule for the basic version and admit students to it
+        Args:
+            as returned by read_prefs and read_constraints
+            admission (string): 'greedy' admits with choose_student, 'flow' with flow_admit
+            improve (float): seconds of local search on the schedule before students are admitted
+            rooms (string): 'sweep' places classes with make_schedule_basic, 'best-fit' with
+            make_schedule_basic_fit
+            rng (random.Random): the random draws of local search and admission, the `random` module if None
+        Returns:
+            schedule (dict): {Course: (ClassRoom, time, [Students])}
+    """
+    registry = CourseRegistry(all_classes)
+    with stats.phase('count_prefs'):
+        count_prefs(registry, all_students)
+    with stats.phase('make_schedule'):
+        make_schedule = make_schedule_basic_fit if rooms == 'best-fit' else make_schedule_basic
+        schedule = make_schedule(all_students, all_classes, all_rooms, ntimes, all_teachers)
+    if improve:
+        with stats.phase('improve'):
+            report_improvement(improve_schedule(schedule, all_rooms, range(1, ntimes + 1), improve, rng=rng))
+    pool = all_students if isinstance(all_students, StudentPool) else None
+    with stats.phase('choose_students'):
+        if admission == 'flow':
+            flow_admit(schedule, pool=pool)
+        else:
+            choose_student(schedule, pool, rng)
+    return schedule
+
+
+def schedule_extension(past_students, all_times, all_rooms, all_classes, all_teachers, rooms='sweep'):
+    """ Make a schedule for the Haverford extension from past enrollment, without admitting anyone yet
+        Args:
+            past_students (list): Student objects from read_enrollment
+            all_times, all_rooms, all_classes, all_teachers: as returned by read_extension_constraints, with
+            build_time_table already applied to all_times
+            rooms (string): 'sweep' places classes with make_schedule_extension, 'best-fit' with
+            make_schedule_extension_fit
+        Returns:
+            schedule (dict): {Course: (ClassRoom, time, [Students])}
+            registry (CourseRegistry): lectures and the lab sections of the schedule
+    """
+    registry = CourseRegistry(all_classes)
+    with stats.phase('count_prefs'):
+        count_prefs(registry, past_students)
+    with stats.phase('assign_core'):
+        assign_core(all_classes)
+    with stats.phase('make_schedule'):
+        make_schedule = make_schedule_extension_fit if rooms == 'best-fit' else make_schedule_extension
+        schedule = make_schedule(all_classes, all_rooms, all_teachers, all_times, registry)
+    # remove previous enrolled student data
+    registry.clear_demand()
+    return schedule, registry
+
+
+def admit_extension(schedule, registry, all_students, all_times, admission='greedy', improve=0, all_rooms=None,
+                    all_teachers=None, rng=None):
+    """ Admit students to a schedule made by schedule_extension, `admission`, `improve` and `rng` are as for
+        schedule_basic, local search needs all_rooms and all_teachers as read_extension_constraints returns them
+    """
+    with stats.phase('count_prefs'):
+        count_prefs(registry, all_students)
+    if improve:
+        with stats.phase('improve'):
+            report_improvement(improve_schedule(schedule, all_rooms, all_times, improve,
+                                                {t: all_teachers[t][1] for t in all_teachers},
+                                                seperate_time_table(all_times)[0], registry, rng))
+    pool = all_students if isinstance(all_students, StudentPool) else None
+    with stats.phase('choose_students'):
+        if admission == 'flow':
+            flow_admit(schedule, all_times, registry, pool)
+        else:
+            choose_student_extension(schedule, all_times, registry, pool, rng)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='Usage: python3 main.py <studentprefs/enrollment.txt> <basic_constraints.txt> '
                     '(<extension_constriants-2.txt> <random_prefs.txt>) (--extension)')
-    parser.add_argument('infiles', type=str, nargs='+',
+    parser.add_argument('infiles', type=str, nargs='*',
                         help='Name of input file(s). Assuming the first file contains preference lists, '
                              'the second file contains basic constraints, the third one contains constraints for '
-                             'Haverford extension.')
+                             'Haverford extension. With --bundle, only an optional preference file.')
     parser.add_argument('--outfile', '-o', type=str,
                         help='Name of output schedule')
+    parser.add_argument('--format', choices=FORMATS, default='tsv',
+                        help="format of the output schedule: tab separated (tsv, the default), JSON lines (jsonl) "
+                             "or the binary roster format of writers.py (binary)")
     parser.add_argument('--extension', action='store_true',
                         help="whether allowing haverford extension, by default, run the basic version")
     parser.add_argument('--test', action='store_true',
                         help="print intermediate outputs")
+    parser.add_argument('--perl', action='store_true',
+                        help="check the schedule with is_valid.pl instead of the built-in validator")
+    parser.add_argument('--stats', type=str, metavar='STATS.json',
+                        help="time every phase, count hot operations and write them to this file")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="with --stats, also record the peak Python allocations of every phase (slow)")
+    parser.add_argument('--pandas', action='store_true',
+                        help="read the extension constraints with pandas")
+    parser.add_argument('--bundle', type=str,
+                        help="load the instance from a directory compiled by bundle.py instead of the text files, "
+                             "a preference file given as input file replaces the preferences in the bundle")
+    parser.add_argument('--compact', action='store_true',
+                        help="keep students in NumPy arrays instead of one object each, for very large inputs")
+    parser.add_argument('--admission', choices=['greedy', 'flow'], default='greedy',
+                        help="how students are admitted to the schedule: first come first served in random order "
+                             "(greedy, the default) or filling as many seats as possible (flow)")
+    parser.add_argument('--improve', type=float, default=0, metavar='SECONDS',
+                        help="improve the schedule by local search for this many seconds before admitting students")
+    parser.add_argument('--rooms', choices=['sweep', 'best-fit'], default='sweep',
+                        help="how classes get rooms: filling the largest room at every time first (sweep, the "
+                             "default) or giving every class the smallest room that holds its demand (best-fit)")
+    parser.add_argument('--room-fill', action='store_true',
+                        help="print how full every room is after students are admitted")
+    parser.add_argument('--starts', type=int, default=0, metavar='N',
+                        help="schedule N variants with random tie-breaks, slot and admission orders and keep the best")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="with --starts, the seed of the first variant, the others count up from it")
+    parser.add_argument('--instance-seed', type=int, metavar='SEED',
+                        help="extension with --starts: the seed teachers' personal conflicts are drawn with (default: "
+                             "--seed), so that reruns solve the same input")
+    parser.add_argument('--workers', type=int, metavar='W',
+                        help="with --starts or --shards, how many variants or shards run at once (default: one "
+                             "per core)")
+    parser.add_argument('--shards', type=int, default=0, metavar='N',
+                        help="extension only: schedule the courses in up to N department shards in parallel and "
+                             "merge them, see shards.py")
     args = parser.parse_args()
 
+    if args.perl and args.format != 'tsv' and not args.extension:
+        print("is_valid.pl reads the tsv format, --perl can't be used with --format", args.format + ".")
+        exit(-1)
+    instance_seed = args.seed if args.instance_seed is None else args.instance_seed
+    if args.shards and (not args.extension or args.starts):
+        print("--shards schedules the extension once, it can't be used without --extension or with --starts.")
+        exit(-1)
+    if args.bundle:
+        if args.perl:
+            print("--perl needs the text input files, it can't be used with --bundle.")
+            exit(-1)
+        prefs_file = args.infiles[0] if args.infiles else None
+    elif len(args.infiles) < (4 if args.extension else 2):
+        parser.error("not enough input files")
+    else:
+        prefs_file = args.infiles[3] if args.extension else args.infiles[0]
+
+    if args.stats:
+        stats.enable(args.trace_memory)
+        stats.add_phase('imports', timeit.default_timer() - _import_start)
+
     if not args.extension:
         # read input
         start_time = timeit.default_timer()
-        all_students = read_prefs(args.infiles[0])
-        ntimes, all_rooms, all_classes, all_teachers = read_constraints(args.infiles[1])
-        count_prefs(all_classes, all_students)
+        with stats.phase('read'):
+            if args.bundle:
+                all_students, ntimes, all_rooms, all_classes, all_teachers = load_basic(args.bundle, args.compact)
+            else:
+                ntimes, all_rooms, all_classes, all_teachers = read_constraints(args.infiles[1])
+            if prefs_file:
+                all_students = read_prefs(prefs_file, args.compact)
         # make schedule for basic version
-        schedule = make_schedule_basic(all_students, all_classes, all_rooms, ntimes, all_teachers)
-        choose_student(schedule)
-        print_schedule(schedule, args.outfile)
+        if args.starts:
+            from multistart import best_of, rebuild_schedule, describe
+            with stats.phase('multistart'):
+                best, results = best_of('basic', (all_students, ntimes, all_rooms, all_classes, all_teachers),
+                                        range(args.seed, args.seed + args.starts), args.workers, args.admission,
+                                        args.improve, args.rooms)
+                schedule = rebuild_schedule(best[3], all_classes, all_rooms, all_students)
+            print(describe(best, results))
+        else:
+            schedule = schedule_basic(all_students, ntimes, all_rooms, all_classes, all_teachers, args.admission,
+                                      args.improve, args.rooms)
+        with stats.phase('write'):
+            print_schedule(schedule, args.outfile, args.format)
         elapsed = timeit.default_timer() - start_time
         print("Time taken:", elapsed)
-        subprocess.call(["perl", "is_valid.pl", args.infiles[1], args.infiles[0], args.outfile])
+        with stats.phase('validate'):
+            if args.perl:
+                subprocess.call(["perl", "is_valid.pl", args.infiles[1], args.infiles[0], args.outfile])
+            else:
+                print(validate_schedule(schedule, all_students, all_classes))
+        if args.room_fill:
+            report_room_fill(schedule)
         print('\n')
 
     else:
         # read enrollment data
         start_time = timeit.default_timer()
-        all_students = read_enrollment(args.infiles[0])
-        all_times, all_rooms, all_classes, all_teachers = read_extension_constraints(args.infiles[1], args.infiles[2])
-        build_time_table(all_times)
-        count_prefs(all_classes, all_students)
-        assign_core(all_classes)
+        with stats.phase('read'):
+            if args.bundle:
+                # the time table comes compiled
+                past_students, all_times, all_rooms, all_classes, all_teachers, prefs = load_extension(args.bundle)
+                if prefs is None and prefs_file is None:
+                    print("Bundle", args.bundle, "has no student preferences, please give a preference file.")
+                    exit(-1)
+            else:
+                past_students = read_enrollment(args.infiles[0])
+                read_constraints_extension = read_extension_constraints_pandas if args.pandas \
+                    else read_extension_constraints
+                # with --starts, the input the variants solve is drawn from a seed too
+                rng = Random(instance_seed) if args.starts else None
+                all_times, all_rooms, all_classes, all_teachers = read_constraints_extension(args.infiles[1],
+                                                                                             args.infiles[2], rng)
+        if not args.bundle:
+            with stats.phase('build_time_table'):
+                build_time_table(all_times)
+        if args.starts:
+            # the variants start from the instance as read, this run only fixes the order of all_classes that
+            # the preferences refer to
+            instance = deepcopy((past_students, all_times, all_rooms, all_classes, all_teachers))
         # make schedule
-        schedule = make_schedule_extension(all_classes, all_rooms, all_teachers, all_times)
-
-        # remove previous enrolled student data
-        for c in schedule:
-            c.specs = []
+        if args.shards:
+            from shards import schedule_extension_sharded
+            schedule, registry = schedule_extension_sharded(past_students, all_times, all_rooms, all_classes,
+                                                            all_teachers, args.shards, args.workers, args.rooms)
+        else:
+            schedule, registry = schedule_extension(past_students, all_times, all_rooms, all_classes, all_teachers,
+                                                    args.rooms)
 
         # read in randomly generated preregistration data
-        all_students = read_extension_prefs(args.infiles[3], all_classes)
-        count_prefs(all_classes, all_students)
-        choose_student_extension(schedule, all_times)
+        with stats.phase('read'):
+            if prefs_file:
+                all_students = read_extension_prefs(prefs_file, all_classes, args.compact)
+            else:
+                all_students = make_extension_students(all_classes, *prefs, compact=args.compact)
+        if args.starts:
+            from multistart import best_of, rebuild_schedule, describe
+            with stats.phase('multistart'):
+                best, results = best_of('extension', instance + (all_students,),
+                                        range(args.seed, args.seed + args.starts), args.workers, args.admission,
+                                        args.improve, args.rooms)
+                schedule = rebuild_schedule(best[3], all_classes, all_rooms, all_students)
+            print(describe(best, results, None if args.bundle else instance_seed))
+        else:
+            admit_extension(schedule, registry, all_students, all_times, args.admission, args.improve, all_rooms,
+                            all_teachers)
         elapsed = timeit.default_timer() - start_time
         print("Time taken:", elapsed)
-        
-        # for calling is_valid.pl
-        # This will generate extra input files
-        print_prefs(len(all_students), all_classes, args.infiles[3][:-4]+"_test.txt", args.infiles[3])
-        print_constraints(all_rooms, all_classes, all_times, all_teachers, args.outfile[:-12]+'extension_constraints.txt')
-        print_schedule_call_perl(schedule, args.outfile[:-4]+"_test.txt", all_times, all_rooms, args.outfile[:-12]+'extension_constraints.txt', args.infiles[3][:-4]+"_test.txt")
+
+        with stats.phase('write'):
+            # the files for is_valid.pl are written on a worker thread while the readable schedule is written
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                if args.perl:
+                    perl = perl_files(args.outfile, prefs_file)
+                    export = executor.submit(export_for_perl, perl, schedule, all_students, all_classes, all_rooms,
+                                             all_times, all_teachers)
+                print_schedule_extension(schedule, args.outfile, all_times, args.format)
+                if args.perl:
+                    export.result()
+        with stats.phase('validate'):
+            if args.perl:
+                call_perl(perl)
+            else:
+                print(validate_schedule(schedule, all_students, all_classes, all_times))
+        if args.room_fill:
+            report_room_fill(schedule)
         print('\n')
-        print_schedule_extension(schedule, args.outfile, all_times)
+
+    if args.stats:
+        stats.dump(args.stats)
+        print(stats)
 
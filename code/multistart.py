@@ -0,0 +1,170 @@
+""" Multi-start scheduling
+
+The scheduler is greedy: which of two equally popular classes is placed first, which of two rooms of the same
+size is filled first and the order slots are scanned in all change the schedule, and admission shuffles the
+demand of every class. best_of runs one variant of an instance per seed, each with these orders drawn at random
+from its seed, on a pool of worker processes. It scores every variant with the built-in validator and keeps the
+best valid one.
+
+The random parts of the input (teachers' personal conflicts in the extension) are drawn once, before the variants
+run, so that all of them solve the same instance, and from their own seed (`--instance-seed`, `--seed` by
+default). The seed of a variant and that of the input reproduce it exactly, with
+`--starts 1 --seed <seed> --instance-seed <input seed>`, unless local search is on, since that stops at a
+wall-clock deadline.
+"""
+
+import multiprocessing
+import random
+from copy import deepcopy
+from functools import partial
+from random import shuffle
+import numpy as np
+from components import CourseRegistry, TimeTable
+from pool import Roster, StudentPool, roster_ids
+from validator import Validator
+
+# the instance variants are made from, set in every worker process
+_instance = None
+
+
+def _set_instance(instance):
+    global _instance
+    _instance = instance
+
+
+def permute_slots(all_times, all_teachers, order):
+    """ Relabel the time slots so that the scheduler, which scans slots by number, scans them in `order`
+        Args:
+            all_times (TimeTable): slots numbered 1..n
+            all_teachers (dict): {teacher: [classes, unavailable slots]}, the slots are relabeled in place
+            order (list): the old slot numbers in their new order, slot order[k] becomes slot k + 1
+        Returns:
+            relabeled (TimeTable): with overlaps compiled
+    """
+    relabeled = TimeTable()
+    new_of = {}
+    for new, old in enumerate(order, 1):
+        relabeled[new] = all_times[old]
+        new_of[old] = new
+    relabeled.compile_overlaps()
+    for teacher in all_teachers:
+        all_teachers[teacher][1] = [new_of[t] for t in all_teachers[teacher][1]]
+    return relabeled
+
+
+def schedule_rows(schedule, order=None):
+    """ A schedule as plain tuples that are cheap to send between processes:
+        (course name, whether it's a lab, teacher, room idx, time, student ids), times are mapped back through
+        `order` as permute_slots made it
+    """
+    return [(course.name, course.has_lab == -1, course.teacher, room.idx,
+             order[time - 1] if order is not None else time, roster_ids(students))
+            for course, (room, time, students) in schedule.items()]
+
+
+def rebuild_schedule(rows, all_classes, all_rooms, all_students):
+    """ Turn schedule_rows back into a schedule {Course: (ClassRoom, time, [Students])} of these objects, labs are
+        made anew like clone_lab does
+    """
+    lectures = CourseRegistry(all_classes).lectures
+    rooms = {r.idx: r for r in all_rooms}
+    if isinstance(all_students, StudentPool):
+        position = {idx: p for p, idx in enumerate(all_students.ids.tolist())}
+    else:
+        students = {s.idx: s for s in all_students}
+    schedule = {}
+    for name, is_lab, teacher, room, time, ids in rows:
+        course = lectures[name]
+        if is_lab:
+            lecture = course
+            course = type(lecture)(lecture.name, teacher, lecture.specs, lecture.dept, lecture.level)
+            course.has_lab = -1
+        if isinstance(all_students, StudentPool):
+            roster = Roster(all_students, np.array([position[i] for i in ids.tolist()], dtype=np.int64))
+        else:
+            roster = [students[i] for i in ids.tolist()]
+        schedule[course] = (rooms[room], time, roster)
+    return schedule
+
+
+def run_variant(seed, kind, admission='greedy', improve=0, rooms='sweep'):
+    """ Schedule and score one variant of the instance of this process
+        Args:
+            seed (int): seeds `random`, which draws the orders and admission
+            kind (string): 'basic', the instance is (all_students, ntimes, all_rooms, all_classes, all_teachers),
+            or 'extension', the instance is (past_students, all_times, all_rooms, all_classes, all_teachers,
+            all_students)
+            admission, improve, rooms: as for schedule_basic
+        Returns:
+            seed (int), valid (bool), score (int), rows (list): the schedule as schedule_rows
+    """
+    from main import schedule_basic, schedule_extension, admit_extension
+
+    random.seed(seed)
+    if kind == 'basic':
+        all_students, ntimes, all_rooms, all_classes, all_teachers = deepcopy(_instance)
+        # the scheduler sorts with a stable sort, so shuffling first breaks ties at random
+        shuffle(all_classes)
+        shuffle(all_rooms)
+        schedule = schedule_basic(all_students, ntimes, all_rooms, all_classes, all_teachers, admission, improve,
+                                  rooms)
+        report = Validator(all_students, all_classes).validate(schedule)
+        rows = schedule_rows(schedule)
+    else:
+        past_students, all_times, all_rooms, all_classes, all_teachers, all_students = deepcopy(_instance)
+        shuffle(all_classes)
+        shuffle(all_rooms)
+        order = list(all_times)
+        shuffle(order)
+        all_times = permute_slots(all_times, all_teachers, order)
+        schedule, registry = schedule_extension(past_students, all_times, all_rooms, all_classes, all_teachers,
+                                                rooms)
+        admit_extension(schedule, registry, all_students, all_times, admission, improve, all_rooms, all_teachers)
+        report = Validator(all_students, all_classes, all_times).validate(schedule)
+        rows = schedule_rows(schedule, order)
+    return seed, report.valid, report.score, rows
+
+
+def best_of(kind, instance, seeds, workers=None, admission='greedy', improve=0, rooms='sweep'):
+    """ Run one variant per seed, `workers` at a time (all cores by default), and keep the best
+        Args:
+            kind, instance, admission, improve, rooms: as for run_variant
+            seeds (list): one seed per variant
+        Returns:
+            best (tuple): what run_variant returned for the best variant, valid ones first, then by score, then
+            by the smallest seed
+            results (list): (seed, valid, score) of every variant, by seed
+    """
+    run = partial(run_variant, kind=kind, admission=admission, improve=improve, rooms=rooms)
+    best = None
+    results = []
+
+    def keep(outcome):
+        nonlocal best
+        seed, valid, score, rows = outcome
+        results.append((seed, valid, score))
+        if best is None or (valid, score, -seed) > (best[1], best[2], -best[0]):
+            best = outcome
+
+    if workers == 1 or len(seeds) == 1:
+        _set_instance(instance)
+        for outcome in map(run, seeds):
+            keep(outcome)
+    else:
+        with multiprocessing.Pool(workers, _set_instance, (instance,)) as pool:
+            for outcome in pool.imap_unordered(run, seeds):
+                keep(outcome)
+    return best, sorted(results)
+
+
+def describe(best, results, instance_seed=None):
+    """ A line about the best variant and how to rerun it, with the seed of the extension's input if given """
+    seed, valid, score, rows = best
+    scores = [r[2] for r in results if r[1]]
+    line = "Best of %d starts: seed %d, value %d" % (len(results), seed, score)
+    if scores:
+        line += " (valid starts from %d to %d, median %g)" % (min(scores), max(scores), np.median(scores))
+    rerun = "--starts 1 --seed %d" % seed
+    if instance_seed is not None:
+        rerun += " --instance-seed %d" % instance_seed
+    return line + ". Rerun it with " + rerun + "."
@@ -0,0 +1,221 @@
+""" Students as arrays
+
+A StudentPool keeps all students in a few NumPy arrays instead of one Student object each: their ids, their
+preferences in CSR form and a bitmask of the slots each of them is busy in. Courses refer to students by their
+position in the pool, and the students admitted to a class are a Roster, an array of positions. Student-like
+views are only made when something iterates a roster, so pools of millions of students stay compact.
+
+count_prefs, choose_student and choose_student_extension in main.py hand over to a pool when they're given one,
+and admit students exactly as they would with Student objects, including the order of random shuffles.
+"""
+
+from random import shuffle
+import numpy as np
+from components import TimeTable
+from grid import ScheduleView
+
+_WORD = 64
+_ALL_BITS = (1 << _WORD) - 1
+
+
+class PooledStudent:
+    """ A read-only Student-like view of one student in a StudentPool, with `idx` and `classes` """
+    __slots__ = ('pool', 'position')
+
+    def __init__(self, pool, position):
+        self.pool = pool
+        self.position = position
+
+    @property
+    def idx(self):
+        return int(self.pool.ids[self.position])
+
+    @property
+    def classes(self):
+        return self.pool.student_classes(self.position)
+
+    def __eq__(self, other):
+        return isinstance(other, PooledStudent) and self.pool is other.pool and self.position == other.position
+
+    def __hash__(self):
+        return hash((id(self.pool), self.position))
+
+
+class Roster:
+    """ The students of one class as positions in a StudentPool, it reads like a list of students """
+    __slots__ = ('pool', 'positions')
+
+    def __init__(self, pool, positions):
+        self.pool = pool
+        self.positions = positions
+
+    @property
+    def ids(self):
+        return self.pool.ids[self.positions]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        pool = self.pool
+        return (PooledStudent(pool, p) for p in self.positions.tolist())
+
+    def __getitem__(self, i):
+        return PooledStudent(self.pool, int(self.positions[i]))
+
+
+def scheduled_lab(schedule, course, registry=None):
+    """ The scheduled lab of a lecture like find_lab in main.py, None if it has none """
+    if isinstance(schedule, ScheduleView):
+        return schedule.lab(course)
+    if registry is not None:
+        lab = registry.lab(course.name)
+        return lab if lab and lab in schedule else None
+    for lab in schedule:
+        if lab.name == course.name and lab != course:
+            return lab
+    return None
+
+
+def schedule_sections(schedule, registry=None):
+    """ Every class of a schedule with the scheduled lab of every lecture that has one, read from the arrays of a
+        ScheduleView's grid, see ScheduleGrid.sections
+        Returns:
+            sections (list): (course, (ClassRoom, time, [Students]), lab or None, the lab's value or None)
+    """
+    if isinstance(schedule, ScheduleView):
+        return schedule.grid.sections()
+    sections = []
+    for course, value in schedule.items():
+        lab = scheduled_lab(schedule, course, registry) if course.has_lab > 0 else None
+        sections.append((course, value, lab, schedule[lab] if lab is not None else None))
+    return sections
+
+
+def roster_ids(students):
+    """ The ids of a list of students, or of a Roster, as an array """
+    if isinstance(students, Roster):
+        return students.ids
+    return np.array([s.idx for s in students], dtype=np.int64)
+
+
+class StudentPool:
+    """ All students of an instance in struct-of-arrays form
+
+        Args:
+            ids, indptr, classes: CSR preferences as read_pref_lists returns them, `classes` may hold any kind
+            of class names
+
+        Attributes:
+            ids (ndarray): student ids, a student is referred to by its position in this array
+            indptr, classes (ndarray): student i asks for classes[indptr[i]:indptr[i + 1]]
+            taken (ndarray): (students, words) uint64 bitmasks, bit t is set if the student can't take slot t
+            because of a class it's admitted to, i.e. closed under slot overlap
+    """
+    def __init__(self, ids, indptr, classes):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.classes = np.asarray(classes)
+        self.taken = np.zeros((len(self.ids), 0), dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (PooledStudent(self, i) for i in range(len(self.ids)))
+
+    def __getitem__(self, i):
+        return PooledStudent(self, i)
+
+    def student_classes(self, i):
+        return self.classes[self.indptr[i]:self.indptr[i + 1]].tolist()
+
+    def demand(self, names):
+        """ For every name in `names`, the positions of the students who asked for it, in pool order and without
+            repeats, as lists
+        """
+        owner = np.repeat(np.arange(len(self.ids)), np.diff(self.indptr))
+        order = np.lexsort((owner, self.classes))
+        classes = self.classes[order]
+        owner = owner[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (classes[1:] != classes[:-1]) | (owner[1:] != owner[:-1])
+        classes = classes[first]
+        owner = owner[first]
+        starts = np.flatnonzero(np.concatenate(([True], classes[1:] != classes[:-1])))
+        ends = np.append(starts[1:], len(classes))
+        groups = {classes[a].item(): owner[a:b].tolist() for a, b in zip(starts.tolist(), ends.tolist())}
+        return {name: groups.get(name, []) for name in names}
+
+    def count_prefs(self, registry):
+        """ Like count_prefs: add the students who asked for every lecture in `registry` to its `specs`, as
+            positions in this pool. The registry's `demand` sets are not kept up to date.
+        """
+        demand = self.demand(registry.lectures)
+        for name, course in registry.lectures.items():
+            course.specs.extend(demand[name])
+
+    def _reserve(self, nbits):
+        words = (nbits + _WORD - 1) // _WORD
+        if self.taken.shape[1] < words:
+            grown = np.zeros((len(self.ids), words), dtype=np.uint64)
+            grown[:, :self.taken.shape[1]] = self.taken
+            self.taken = grown
+
+    def admit(self, schedule, time_list=None, registry=None, rng=None):
+        """ Admit students to every class of `schedule`, from its `specs`, up to the capacity of its room
+            With a time_list, this is choose_student_extension: overlapping slots exclude each other and lectures
+            with labs admit students who can attend both. Otherwise it's choose_student, only equal slots exclude
+            each other. The rosters of the schedule are replaced by Roster objects.
+            Args:
+                schedule (dict): {Course: (ClassRoom, time, [Students])}, `specs` are positions in this pool
+                time_list (TimeTable): the time slots of an extension schedule
+                registry (CourseRegistry): to look up labs
+                rng (random.Random): shuffles the students, the `random` module if None
+        """
+        if time_list is not None and (not isinstance(time_list, TimeTable) or not time_list.overlap):
+            time_list = TimeTable(time_list)
+            time_list.compile_overlaps()
+        overlap = time_list.overlap if time_list is not None else {}
+        times = [value[1] for value in schedule.values()] + list(overlap)
+        self._reserve(max(times) + 1 if times else 0)
+        words = self.taken.shape[1]
+        masks = {}
+
+        def closure(slot):
+            if slot not in masks:
+                mask = overlap.get(slot, 1 << slot)
+                masks[slot] = np.array([(mask >> (_WORD * w)) & _ALL_BITS for w in range(words)], dtype=np.uint64)
+            return masks[slot]
+
+        def free(candidates, slot):
+            return (self.taken[candidates, slot // _WORD] >> np.uint64(slot % _WORD)) & np.uint64(1) == 0
+
+        mix = rng.shuffle if rng is not None else shuffle
+        for a_class, (room, time, roster), lab, lab_value in schedule_sections(schedule, registry):
+            student_list = a_class.specs
+            mix(student_list)
+            if time_list is None:
+                lab = None
+            elif a_class.has_lab > 0:
+                if lab is None:
+                    continue
+            elif a_class.has_lab == 0:
+                lab = None
+            else:
+                continue
+
+            candidates = np.array(student_list, dtype=np.int64)
+            ok = free(candidates, time)
+            capacity = room.capacity
+            if lab is not None:
+                lab_room, lab_time = lab_value[0], lab_value[1]
+                # students attend both sections, so the smaller room is the limit
+                capacity = min(capacity, lab_room.capacity)
+                ok &= free(candidates, lab_time)
+            chosen = candidates[ok][:max(capacity, 0)]
+            self.taken[chosen] |= closure(time)
+            schedule[a_class] = (room, time, Roster(self, chosen))
+            if lab is not None:
+                self.taken[chosen] |= closure(lab_time)
+                schedule[lab] = (lab_room, lab_time, Roster(self, chosen))
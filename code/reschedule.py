@@ -0,0 +1,324 @@
+""" Incremental rescheduling
+
+A Rescheduler holds a schedule students have been admitted to, together with which students are in which class
+and which classes every student asked for. Late changes are applied to it in place instead of running the whole
+pipeline again:
+
+- a teacher becomes unavailable at some times: their classes at those times move,
+- a room goes offline: its classes move to other rooms,
+- the demand of a course changes: students who don't want it any more leave, new students are admitted.
+
+A class that has to move goes to the place that costs the fewest of its students, preferring its own slot, and
+among those to the smallest room that holds its whole demand. Students who can't follow it lose their seat. Only
+the students a change touches are admitted again: freed seats of a moved class are filled from its demand, and
+evicted students are tried in the other classes they asked for. Every change returns a Changes report, after checking
+that the schedule (and the grid of a ScheduleView) still agrees with where the rescheduler put every class; if it
+doesn't, the change raises ScheduleMismatch instead.
+
+    rescheduler = Rescheduler(schedule, all_rooms, all_times, {t: all_teachers[t][1] for t in all_teachers},
+                              seperate_time_table(all_times)[0], registry)
+    print(rescheduler.take_room_offline('KINSC H108'))
+"""
+
+from collections import defaultdict
+from grid import ScheduleView
+from improve import Placement
+from instrument import stats
+from pool import Roster
+
+
+class ScheduleMismatch(RuntimeError):
+    """ The schedule disagrees with the rescheduler after a change. The change was already applied as far as
+        `changes` says, `problems` lists the disagreements as Rescheduler.check gives them.
+    """
+    def __init__(self, problems, changes):
+        RuntimeError.__init__(self, "the schedule disagrees with the rescheduler:\n" + "\n".join(problems))
+        self.problems = problems
+        self.changes = changes
+
+
+class Changes:
+    """ What one change did to the schedule
+
+        Attributes:
+            moved (list): (course, (old room, old time), (new room, new time)) for every class that moved, the new
+            place is None if the class couldn't be placed again and was dropped. Rooms are given by their `idx`.
+            evicted (list): (student idx, course name) for every seat lost
+            admitted (list): (student idx, course name) for every seat given
+    """
+    def __init__(self):
+        self.moved = []
+        self.evicted = []
+        self.admitted = []
+
+    def __str__(self):
+        lines = []
+        for course, old, new in self.moved:
+            if new is None:
+                lines.append("Course %s in room %s at time %s was dropped." % ((course.name,) + old))
+            else:
+                lines.append("Course %s moved from room %s at time %s to room %s at time %s." %
+                             ((course.name,) + old + new))
+        lines.append("%d seats lost, %d seats given." % (len(self.evicted), len(self.admitted)))
+        return "\n".join(lines)
+
+
+class Rescheduler(Placement):
+    """ Apply late changes to an admitted schedule, see the module docstring. The arguments are those of Placement,
+        the `specs` of lectures must hold their demand, i.e. the students admission chose from.
+
+        Lectures and their labs share one roster list in the schedule from here on. Student objects keep their
+        `taken` list up to date; students of a StudentPool don't, their pool's busy masks are only for admission.
+    """
+    def __init__(self, schedule, all_rooms, time_list, unavailable=None, lab_slots=(), registry=None):
+        Placement.__init__(self, schedule, all_rooms, time_list, unavailable, lab_slots, registry)
+        self.offline = set()
+        self.section_times = {}
+        self.placed = [True] * len(self.entries)
+        # sections with a class that couldn't be placed again
+        self.dropped = set()
+        self.pool = next((v[2].pool for v in schedule.values() if isinstance(v[2], Roster)), None)
+
+        self.rosters = []
+        self.enrolled = defaultdict(set)
+        self.wanted = defaultdict(list)
+        self.section_by_name = {}
+        for s, members in enumerate(self.sections):
+            lecture = self.entries[members[0]]
+            roster = list(schedule[lecture][2])
+            for i in members:
+                room, time, students = schedule[self.entries[i]]
+                schedule[self.entries[i]] = (room, time, roster)
+            self.rosters.append(roster)
+            self.section_by_name[lecture.name] = s
+            for student in roster:
+                self.enrolled[student].add(s)
+            for student in lecture.specs:
+                self.wanted[self._student(student)].append(s)
+
+    def _student(self, student):
+        """ Students of a pool are positions in `specs` and views in rosters """
+        return self.pool[student] if self.pool is not None else student
+
+    def _capacity(self, s):
+        return min(self.all_rooms[self.room[i]].capacity for i in self.sections[s])
+
+    def _times(self, s):
+        """ Placement._times, remembered until section s moves """
+        times = self.section_times.get(s)
+        if times is None:
+            times = self.section_times[s] = Placement._times(self, s)
+        return times
+
+    def _busy(self, student, skip=-1):
+        """ The bitmask of slots overlapping the classes of `student`, leaving out section `skip` """
+        mask = 0
+        for s in self.enrolled[student]:
+            if s != skip:
+                mask |= self._times(s)[1]
+        return mask
+
+    def _admit(self, student, s, changes):
+        self.rosters[s].append(student)
+        self.enrolled[student].add(s)
+        taken = getattr(student, 'taken', None)
+        if taken is not None:
+            taken.extend(self.slots[self.slot[i]] for i in self.sections[s])
+        changes.admitted.append((student.idx, self.entries[self.sections[s][0]].name))
+
+    def _evict(self, student, s, changes):
+        self.rosters[s].remove(student)
+        self.enrolled[student].discard(s)
+        taken = getattr(student, 'taken', None)
+        if taken is not None:
+            for i in self.sections[s]:
+                if self.slots[self.slot[i]] in taken:
+                    taken.remove(self.slots[self.slot[i]])
+        changes.evicted.append((student.idx, self.entries[self.sections[s][0]].name))
+
+    def _fits_student(self, student, s):
+        return s not in self.enrolled[student] and not self._busy(student) & self._times(s)[0]
+
+    def _fill(self, s, changes):
+        """ Admit students who asked for section s while it has seats """
+        roster = self.rosters[s]
+        capacity = self._capacity(s)
+        for student in self.entries[self.sections[s][0]].specs:
+            if len(roster) >= capacity:
+                break
+            student = self._student(student)
+            if self._fits_student(student, s):
+                self._admit(student, s, changes)
+
+    def _readmit(self, students, changes):
+        """ Try `students` in the sections they asked for and aren't in """
+        for student in students:
+            for s in self.wanted[student]:
+                if s not in self.dropped and len(self.rosters[s]) < self._capacity(s) and self._fits_student(student, s):
+                    self._admit(student, s, changes)
+
+    def _move(self, i, changes):
+        """ Place entry i again, somewhere it fits now, and settle its students """
+        course = self.entries[i]
+        s = self.section_of[i]
+        roster = self.rosters[s] if s >= 0 else []
+        old_room, old_slot = self.room[i], self.slot[i]
+        old = (self.all_rooms[old_room].idx, self.slots[old_slot])
+        self._remove(i)
+
+        # what the students of the class are busy with, the other half of its section included
+        others = 0
+        if s >= 0:
+            for j in self.sections[s]:
+                if j != i:
+                    others |= self.closure[self.slot[j]]
+        busy = [self._busy(student, s) | others for student in roster]
+        demand = len(course.specs) if s >= 0 else 0
+        best = None
+        for slot in self.kinds[self.kind[i]]:
+            bit = 1 << slot
+            lost = sum(1 for mask in busy if mask & bit)
+            if best is not None and lost > best[0][0] or not self._teacher_free(i, slot):
+                continue
+            for r in range(len(self.all_rooms)):
+                if r in self.offline or not self._room_free(r, slot):
+                    continue
+                capacity = self.all_rooms[r].capacity
+                key = (lost + max(0, len(roster) - lost - capacity), slot != old_slot, -min(capacity, demand),
+                       capacity)
+                if best is None or key < best[0]:
+                    best = (key, r, slot)
+        stats.count('reschedule_moves')
+
+        if best is None:
+            # nowhere to go, the whole section is dropped and its students lose their seats
+            self._add(i)
+            evicted = list(roster)
+            for student in evicted:
+                self._evict(student, s, changes)
+            for j in (self.sections[s] if s >= 0 else [i]):
+                self._drop(j, changes)
+            if s >= 0:
+                self.dropped.add(s)
+            self._readmit(evicted, changes)
+            return
+
+        room, time, students = self.schedule[course]
+        if time in room.taken:
+            room.taken.remove(time)
+        evicted = []
+        self.room[i], self.slot[i] = best[1], best[2]
+        self._add(i)
+        self.section_times.pop(s, None)
+        new_room, new_time = self.all_rooms[best[1]], self.slots[best[2]]
+        new_room.taken.append(new_time)
+        self.schedule[course] = (new_room, new_time, students)
+        changes.moved.append((course, old, (new_room.idx, new_time)))
+        if s < 0:
+            return
+        for student, mask in zip(list(roster), busy):
+            taken = getattr(student, 'taken', None)
+            if taken is not None and time in taken:
+                taken[taken.index(time)] = new_time
+            if mask & (1 << best[2]):
+                self._evict(student, s, changes)
+                evicted.append(student)
+        # the room may be smaller, the students admitted last leave first
+        capacity = self._capacity(s)
+        while len(roster) > capacity:
+            student = roster[-1]
+            self._evict(student, s, changes)
+            evicted.append(student)
+        self._fill(s, changes)
+        self._readmit(evicted, changes)
+
+    def _drop(self, j, changes):
+        """ Take entry j out of the schedule """
+        course = self.entries[j]
+        room, time, students = self.schedule.pop(course)
+        if time in room.taken:
+            room.taken.remove(time)
+        self._remove(j)
+        self.placed[j] = False
+        changes.moved.append((course, (room.idx, time), None))
+
+    def check(self):
+        """ Whether the schedule, its grid if it's a ScheduleView, and the rooms and slots of the entries agree
+            Returns:
+                problems (list): a message for every disagreement, empty if there is none
+        """
+        problems = self.schedule.grid.check() if isinstance(self.schedule, ScheduleView) else []
+        for i, course in enumerate(self.entries):
+            if not self.placed[i]:
+                if course in self.schedule:
+                    problems.append("%s was dropped but is still scheduled" % course.name)
+                continue
+            room, time, students = self.schedule[course]
+            if room is not self.all_rooms[self.room[i]] or time != self.slots[self.slot[i]]:
+                problems.append("%s is in room %s at time %s, the rescheduler has room %s at time %s"
+                                % (course.name, room.idx, time, self.all_rooms[self.room[i]].idx,
+                                   self.slots[self.slot[i]]))
+        return problems
+
+    def _checked(self, changes):
+        """ `changes`, once check() finds nothing wrong, otherwise raises ScheduleMismatch """
+        problems = self.check()
+        if problems:
+            raise ScheduleMismatch(problems, changes)
+        return changes
+
+    def set_unavailable(self, teacher, times):
+        """ Replace the times `teacher` can't teach in, and move their classes that now clash with them
+            Returns:
+                changes (Changes)
+        """
+        changes = Changes()
+        self.blocked[teacher] = 0
+        for t in times:
+            self.blocked[teacher] |= self.closure[self.slot_index[t]]
+        for i, course in enumerate(self.entries):
+            if self.placed[i] and self.teachers[i][0] == teacher and (self.blocked[teacher] >> self.slot[i]) & 1:
+                self._move(i, changes)
+        return self._checked(changes)
+
+    def take_room_offline(self, room):
+        """ Stop using a room (a ClassRoom or its idx), its classes move elsewhere
+            Returns:
+                changes (Changes)
+        """
+        changes = Changes()
+        r = next(k for k, candidate in enumerate(self.all_rooms) if candidate is room or candidate.idx == room)
+        self.offline.add(r)
+        for i in range(len(self.entries)):
+            if self.placed[i] and self.room[i] == r:
+                self._move(i, changes)
+        return self._checked(changes)
+
+    def set_demand(self, name, students):
+        """ Replace the students who ask for the lecture called `name`, as `specs` would hold them. Students who
+            no longer ask for it leave and may take other classes, new ones are admitted while there are seats.
+            Returns:
+                changes (Changes)
+        """
+        changes = Changes()
+        s = self.section_by_name[name]
+        lecture = self.entries[self.sections[s][0]]
+        old = set(self._student(student) for student in lecture.specs)
+        lecture.specs = list(students)
+        for i in self.sections[s][1:]:
+            self.entries[i].specs = lecture.specs
+        new = set(self._student(student) for student in lecture.specs)
+        for student in old - new:
+            self.wanted[student].remove(s)
+        for student in new - old:
+            self.wanted[student].append(s)
+
+        evicted = []
+        if s not in self.dropped:
+            for student in list(self.rosters[s]):
+                if student not in new:
+                    self._evict(student, s, changes)
+                    evicted.append(student)
+            self._fill(s, changes)
+        self._readmit(evicted, changes)
+        return self._checked(changes)
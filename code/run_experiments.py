@@ -1,65 +1,185 @@
 #! /usr/bin/env python3
 
 import argparse
+import csv
+import functools
+import os
+import random
 import timeit
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from main import *
+from generator import check_basic_sizes, write_basic_instance, random_basic_instance, write_extension_prefs, random_extension_students
 
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def check_one_schedule(partial_name):
-    subprocess.call(["python3", "main.py", partial_name + "_basic_studentprefs.txt", partial_name + "_basic_constraints.txt", '-o', partial_name + "_basic_schedule.txt"])
+# columns of the results table
+PHASES = ['generate_time', 'read_time', 'schedule_time', 'write_time', 'validate_time']
+RESULT_FIELDS = ['experiment', 'seed', 'students', 'classes', 'scheduled', 'requested', 'score', 'satisfaction',
+                 'valid'] + PHASES + ['total_time']
 
-def check_one_schedule_extension(partial_name):
-    subprocess.call(['python3', 'main.py', 'S14Enrollment.txt', 'haverfordConstraints_1.txt', 'haverfordConstraints_2.txt', partial_name+'_extension_studentprefs.txt', '--extension', '-o', partial_name+'_extension_schedule.txt'])
 
+def run_basic_experiment(i, nr, nc, nt, ns, outdir, seed, in_memory=False):
+    """ Generate one random basic instance, schedule it in-process and validate it
+        Args:
+            in_memory (bool): hand the instance straight to the scheduler instead of writing and reading input files
+        Returns:
+            result (dict): one row of the results table, see RESULT_FIELDS
+    """
+    random.seed(seed)
+    partial_name = os.path.join(outdir, str(i))
+    constraints = partial_name + "_basic_constraints.txt"
+    prefs = partial_name + "_basic_studentprefs.txt"
+
+    timer = timeit.default_timer
+    start = timer()
+    if in_memory:
+        all_students, ntimes, all_rooms, all_classes, all_teachers = random_basic_instance(nr, nc, nt, ns, seed)
+        generated = read = timer()
+    else:
+        write_basic_instance(nr, nc, nt, ns, constraints, prefs, seed)
+        generated = timer()
+        all_students = read_prefs(prefs)
+        ntimes, all_rooms, all_classes, all_teachers = read_constraints(constraints)
+        read = timer()
+    schedule = schedule_basic(all_students, ntimes, all_rooms, all_classes, all_teachers)
+    scheduled = timer()
+    print_schedule(schedule, partial_name + "_basic_schedule.txt")
+    written = timer()
+    report = validate_schedule(schedule, all_students, all_classes)
+    validated = timer()
+
+    return make_result(i, seed, all_students, all_classes, schedule, report,
+                       [start, generated, read, scheduled, written, validated])
+
+
+def run_extension_experiment(i, ns, outdir, seed, datadir, in_memory=False):
+    """ Generate random preferences for the Haverford data, schedule them in-process and validate the schedule
+        Args:
+            in_memory (bool): hand the preferences straight to the scheduler instead of writing and reading a file
+        Returns:
+            result (dict): one row of the results table, see RESULT_FIELDS
+    """
+    random.seed(seed)
+    partial_name = os.path.join(outdir, str(i))
+    prefs = partial_name + "_extension_studentprefs.txt"
+
+    timer = timeit.default_timer
+    start = timer()
+    if not in_memory:
+        write_extension_prefs(prefs, ns, seed)
+    generated = timer()
+    past_students = read_enrollment(os.path.join(datadir, 'S14Enrollment.txt'))
+    all_times, all_rooms, all_classes, all_teachers = read_extension_constraints(
+        os.path.join(datadir, 'haverfordConstraints_1.txt'), os.path.join(datadir, 'haverfordConstraints_2.txt'))
+    build_time_table(all_times)
+    read = timer()
+    schedule, registry = schedule_extension(past_students, all_times, all_rooms, all_classes, all_teachers)
+    if in_memory:
+        all_students = random_extension_students(ns, all_classes, seed)
+    else:
+        all_students = read_extension_prefs(prefs, all_classes)
+    admit_extension(schedule, registry, all_students, all_times)
+    scheduled = timer()
+    print_schedule_extension(schedule, partial_name + "_extension_schedule.txt", all_times)
+    written = timer()
+    report = validate_schedule(schedule, all_students, all_classes, all_times)
+    validated = timer()
+
+    return make_result(i, seed, all_students, all_classes, schedule, report,
+                       [start, generated, read, scheduled, written, validated])
+
+
+def make_result(i, seed, all_students, all_classes, schedule, report, timestamps):
+    """ Collect the quality metrics and the time spent in every phase of one experiment """
+    phases = [b - a for a, b in zip(timestamps, timestamps[1:])]
+    result = {
+        'experiment': i,
+        'seed': seed,
+        'students': len(all_students),
+        'classes': len(all_classes),
+        'scheduled': sum(1 for c in schedule if c.has_lab > -1),
+        'requested': report.requested,
+        'score': report.score,
+        'satisfaction': round(report.score / report.requested, 4) if report.requested else 0,
+        'valid': report.valid,
+        'total_time': round(timestamps[-1] - timestamps[0], 4),
+    }
+    for field, elapsed in zip(PHASES, phases):
+        result[field] = round(elapsed, 4)
+    return result
+
+
+def write_results(results, fname):
+    with open(fname, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, delimiter='\t')
+        writer.writeheader()
+        for result in sorted(results, key=lambda r: r['experiment']):
+            writer.writerow(result)
 
-"""
-make_random_input.pl
-Usage:
-make_random_input.pl: <number of rooms> <number of classes> <number of class times> <number of students> <contraint file> <student prefs file>
-Note: inputs are <number of rooms> <number of classes> <number of class times> <number of students>, the other two arguments are output file names
-"""
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='For basic version, enter: <#rooms> <#classes> <#times> <#students> -n <#experiments>. For Haverford extension, enter ')
     parser.add_argument('insize', type=str, nargs='+',
                         help='input sizes. For basic version, enter <nr> <nc> <nt> <ns>. For extension, enter student number only.')
-    parser.add_argument('--nexp', '-n', type=int,
+    parser.add_argument('--nexp', '-n', type=int, default=1,
                         help='The number of experiment you want to run. Will use the same input size and generate multiple sets of random iputs.')
     parser.add_argument('--extension','-e', action='store_true',
                         help="whether allowing haverford extension, by default, run the basic version")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help="the number of experiments to run in parallel, by default one per core")
+    parser.add_argument('--outdir', '-d', type=str, default='.',
+                        help="directory for generated inputs, schedules and the results table")
+    parser.add_argument('--results', type=str, default='results.tsv',
+                        help="name of the results table, written to the output directory")
+    parser.add_argument('--seed', type=int,
+                        help="seed of the first experiment, experiment i uses seed + i - 1. Random by default")
+    parser.add_argument('--data', type=str, default=CODE_DIR,
+                        help="directory with S14Enrollment.txt and the haverfordConstraints files")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="don't write the generated inputs, hand them to the scheduler directly")
     args = parser.parse_args()
-    
+
     num_tests = args.nexp
+    os.makedirs(args.outdir, exist_ok=True)
+    first_seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2 ** 32)
 
     if not args.extension:
         if len(args.insize) != 4:
             print("Wrong input sizes. <nr> <nc> <nt> <ns>")
             exit(-1)
 
-        nr = args.insize[0]
-        nc = args.insize[1] 
-        nt = args.insize[2]
-        ns = args.insize[3]
+        nr = int(args.insize[0])
+        nc = int(args.insize[1])
+        nt = int(args.insize[2])
+        ns = int(args.insize[3])
         print("\nThe input sizes are: nr, nc, nt, ns=", nr, nc, nt, ns)
-
-        for i in range(1, num_tests+1):
-            print("Beginning experiment", i)
-            # make random input
-            subprocess.call(["perl", "make_random_input.pl", str(nr), str(nc), str(nt), str(ns), str(i)+"_basic_constraints.txt", str(i)+"_basic_studentprefs.txt"])
-
-            # make schedule and time the process
-            check_one_schedule(str(i))
+        try:
+            check_basic_sizes(nr, nc, nt, ns)
+        except ValueError as e:
+            print(e)
+            exit(-1)
+        experiment = functools.partial(run_basic_experiment, nr=nr, nc=nc, nt=nt, ns=ns, outdir=args.outdir,
+                                       in_memory=args.in_memory)
     else:
         if len(args.insize) != 1:
             print("Wrong input sizes. Only <ns> is required.")
             exit(-1)
 
-        ns = args.insize[0]
+        ns = int(args.insize[0])
         print("\nStudent size is", ns)
+        experiment = functools.partial(run_extension_experiment, ns=ns, outdir=args.outdir, datadir=args.data,
+                                       in_memory=args.in_memory)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(experiment, i, seed=first_seed + i - 1) for i in range(1, num_tests + 1)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print("Experiment", result['experiment'], "valid:", result['valid'], "score:", result['score'],
+                  "time taken:", result['total_time'])
 
-        for i in range(1, num_tests+1):
-            # randomely choose an integer within a reasonable(?) range for each value
-            subprocess.call(["perl", "make_random_input_e_student.pl", str(ns), str(i)+"_extension_studentprefs.txt"])
-            print("Beginning experiment", i)
-            check_one_schedule_extension(str(i))
\ No newline at end of file
+    results_file = os.path.join(args.outdir, args.results)
+    write_results(results, results_file)
+    print("Results written to", results_file)
@@ -0,0 +1,259 @@
+""" Department-sharded scheduling for the Haverford extension
+
+make_schedule_extension places every course in one loop. Most of what it weighs is local to a department, so
+schedule_extension_sharded splits the courses into shards of whole departments, schedules every shard on a pool of
+worker processes with the scheduler of the sequential version, and merges the results:
+
+- Departments that share a teacher (of a lecture or a lab) stay in the same shard, so that shards can't book a
+  teacher twice. Only a group of departments bigger than a shard's share is split up by department.
+- Every shard gets a budget of rooms, with all their times, in proportion to the demand of its courses, dealt
+  largest room first so that every shard gets some of the large rooms. Shards never share a room.
+- The merge places the classes of the shards in the order the sequential scheduler would have taken them, and
+  takes out every class whose teacher is already busy at that time, e.g. when a teacher's departments were
+  split up. Those classes and the ones a shard couldn't fit are placed afterwards in whatever room-time pairs
+  are still free in any room.
+"""
+
+import multiprocessing
+from copy import deepcopy
+from components import CourseRegistry, Occupancy
+from grid import ScheduleGrid
+from instrument import stats
+
+
+def _departments(all_classes):
+    """ Group the departments of `all_classes` that share a teacher
+        Returns:
+            groups (list): lists of department names
+    """
+    parent = {}
+
+    def find(d):
+        parent.setdefault(d, d)
+        while parent[d] != d:
+            parent[d] = parent[parent[d]]
+            d = parent[d]
+        return d
+
+    teacher_dept = {}
+    for course in all_classes:
+        teachers = [course.teacher, course.has_lab] if course.has_lab > 0 else [course.teacher]
+        for teacher in teachers:
+            dept = teacher_dept.setdefault(teacher, course.dept)
+            parent[find(course.dept)] = find(dept)
+    groups = {}
+    for course in all_classes:
+        groups.setdefault(find(course.dept), {})[course.dept] = None
+    return [list(depts) for depts in groups.values()]
+
+
+def _weight(courses):
+    """ The share of rooms a set of courses needs: its demand, and a seat for every course and lab without any """
+    return sum(max(len(c.specs), 1) * (2 if c.has_lab > 0 else 1) for c in courses)
+
+
+def shard_courses(all_classes, nshards):
+    """ Split courses into at most `nshards` shards of whole departments, keeping departments that share a teacher
+        together unless they'd be more than a shard's share of the work
+        Returns:
+            shards (list): lists of Course objects, in their order in all_classes, heaviest shard first
+    """
+    by_dept = {}
+    for course in all_classes:
+        by_dept.setdefault(course.dept, []).append(course)
+    share = _weight(all_classes) / max(nshards, 1)
+    units = []
+    for depts in _departments(all_classes):
+        courses = [c for d in depts for c in by_dept[d]]
+        if _weight(courses) > share and len(depts) > 1:
+            units.extend([by_dept[d] for d in depts])
+        else:
+            units.append(courses)
+
+    # the heaviest unit goes to the lightest shard
+    units.sort(key=_weight, reverse=True)
+    shards = [[] for _ in range(min(nshards, len(units)))]
+    loads = [0] * len(shards)
+    for unit in units:
+        lightest = loads.index(min(loads))
+        shards[lightest].extend(unit)
+        loads[lightest] += _weight(unit)
+    position = {id(c): i for i, c in enumerate(all_classes)}
+    for shard in shards:
+        shard.sort(key=lambda c: position[id(c)])
+    shards.sort(key=_weight, reverse=True)
+    return shards
+
+
+def shard_rooms(all_rooms, shards):
+    """ Deal the rooms out to the shards, largest room first, each to the shard with the fewest seats for its
+        weight so far
+        Returns:
+            rooms (list): a list of ClassRoom objects for every shard, largest first
+    """
+    weights = [_weight(shard) for shard in shards]
+    seats = [0] * len(shards)
+    rooms = [[] for _ in shards]
+    for room in sorted(all_rooms, key=lambda r: r.capacity, reverse=True):
+        # shards without a room go first
+        neediest = min(range(len(shards)), key=lambda i: (len(rooms[i]) > 0, seats[i] / weights[i]))
+        rooms[neediest].append(room)
+        seats[neediest] += room.capacity
+    return rooms
+
+
+def schedule_shard(job):
+    """ Schedule one shard with the scheduler of the sequential version
+        Args:
+            job (tuple): (courses, rooms, all_times, all_teachers, rooms mode) of the shard
+        Returns:
+            rows (list): (course name, whether it's a lab, teacher, room idx, time) of every class placed
+    """
+    from main import make_schedule_extension, make_schedule_extension_fit
+
+    courses, rooms, all_times, all_teachers, mode = job
+    make_schedule = make_schedule_extension_fit if mode == 'best-fit' else make_schedule_extension
+    schedule = make_schedule(courses, rooms, all_teachers, all_times, CourseRegistry(courses))
+    return [(course.name, course.has_lab == -1, course.teacher, room.idx, time)
+            for course, (room, time, students) in schedule.items()]
+
+
+def merge_shards(results, all_classes, all_rooms, all_times, all_teachers, registry, rooms='sweep'):
+    """ Merge the rows of the shards into one schedule, taking out classes whose teacher or room is already
+        taken, and place the classes that are left out in the room-time pairs that are still free
+        Args:
+            results (list): the rows of every shard, as schedule_shard returns them
+            all_classes (list): Course objects, in the order the sequential scheduler takes them
+            all_rooms (list): ClassRoom objects, largest first
+            all_times, all_teachers: as for make_schedule_extension
+            registry (CourseRegistry): lab sections are registered in it
+            rooms (string): how the left out classes get rooms, as in make_schedule_extension ('sweep') or
+            make_schedule_extension_fit ('best-fit')
+        Returns:
+            schedule (ScheduleView): {Course: (ClassRoom, time, [Students])}
+            repaired (int): the number of classes taken out because of a conflict
+    """
+    from main import clone_lab, seperate_time_table, sort_class
+
+    lab_time, lec_time = seperate_time_table(all_times)
+    lec_times = sum(1 << t for t in lec_time)
+    lab_times = sum(1 << t for t in lab_time)
+    room_index = {room.idx: i for i, room in enumerate(all_rooms)}
+    occupancy = Occupancy(all_times, all_rooms, all_teachers)
+    result = ScheduleGrid(all_rooms, all_times).view
+
+    # {lecture name: (room position, time)} of the lecture and of its lab from the shards
+    lectures = {}
+    labs = {}
+    for rows in results:
+        for name, is_lab, teacher, room, time in rows:
+            (labs if is_lab else lectures)[name] = (room_index[room], time)
+
+    def free(teacher, index_r, time):
+        return not occupancy.conflict(time, teacher, index_r)
+
+    def place(course, index_r, time, teacher=None):
+        if teacher is not None:
+            course = clone_lab(course, teacher, registry)
+        result[course] = (all_rooms[index_r], time, [])
+        occupancy.block_room(index_r, time)
+        occupancy.block_teacher(course.teacher, time)
+
+    left_out = []
+    repaired = 0
+    for course in all_classes:
+        found = lectures.get(course.name)
+        if found is None or not free(course.teacher, *found):
+            repaired += found is not None
+            left_out.append(course)
+            continue
+        place(course, *found)
+        if course.has_lab > 0:
+            # so that the lab won't conflict with the lecture
+            occupancy.block_teacher(course.has_lab, found[1])
+            lab = labs.get(course.name)
+            if lab is not None:
+                if free(course.has_lab, *lab):
+                    place(course, *lab, teacher=course.has_lab)
+                else:
+                    repaired += 1
+
+    if not left_out:
+        return result, repaired
+    # the room-time pairs no class has
+    slots = sum(1 << t for t in all_times)
+    for index_r in range(len(all_rooms)):
+        free_times = slots & ~occupancy.room[index_r]
+        while free_times:
+            low = free_times & -free_times
+            free_times ^= low
+            occupancy.free.release(index_r, low.bit_length() - 1)
+    load = {}
+
+    def find(teacher, times, demand):
+        if rooms == 'best-fit':
+            found = occupancy.free.best_fit(times & ~occupancy.teacher[teacher], demand, load)
+            if found is not None:
+                load[found[1]] = load.get(found[1], 0) + demand
+            return found
+        return occupancy.first_free(teacher, times)
+
+    for course in sorted(left_out, key=sort_class, reverse=True):
+        if not occupancy.free:
+            break
+        demand = len(course.specs)
+        if course.dept == "ARTS":
+            found = find(course.teacher, lab_times, demand)
+            if found is not None:
+                place(course, *found)
+            continue
+        found = find(course.teacher, lec_times, demand)
+        if found is None:
+            continue
+        place(course, *found)
+        if course.has_lab > 0:
+            occupancy.block_teacher(course.has_lab, found[1])
+            lab = find(course.has_lab, lab_times, demand)
+            if lab is not None:
+                place(course, *lab, teacher=course.has_lab)
+    return result, repaired
+
+
+def schedule_extension_sharded(past_students, all_times, all_rooms, all_classes, all_teachers, nshards,
+                               workers=None, rooms='sweep'):
+    """ Like schedule_extension, but the courses are scheduled in department shards, see the module docstring
+        Args:
+            past_students, all_times, all_rooms, all_classes, all_teachers, rooms: as for schedule_extension
+            nshards (int): the most shards to make
+            workers (int): how many shards are scheduled at once, one per core by default
+        Returns:
+            schedule (ScheduleView): {Course: (ClassRoom, time, [Students])}
+            registry (CourseRegistry): lectures and the lab sections of the schedule
+    """
+    from main import count_prefs, assign_core, sort_class
+
+    registry = CourseRegistry(all_classes)
+    with stats.phase('count_prefs'):
+        count_prefs(registry, past_students)
+    with stats.phase('assign_core'):
+        assign_core(all_classes)
+    # the order the sequential scheduler leaves them in, which preferences refer to
+    all_classes.sort(key=sort_class, reverse=True)
+    all_rooms.sort(key=lambda x: x.capacity, reverse=True)
+
+    with stats.phase('make_schedule'):
+        shards = shard_courses(all_classes, nshards)
+        budgets = shard_rooms(all_rooms, shards)
+        jobs = [(courses, budget, all_times, all_teachers, rooms) for courses, budget in zip(shards, budgets)]
+        if workers == 1 or len(jobs) == 1:
+            # the scheduler changes the courses and rooms it's given, as a worker's copies would be
+            results = [schedule_shard(job) for job in deepcopy(jobs)]
+        else:
+            with multiprocessing.Pool(min(workers or multiprocessing.cpu_count(), len(jobs))) as pool:
+                results = pool.map(schedule_shard, jobs)
+    with stats.phase('merge_shards'):
+        schedule, repaired = merge_shards(results, all_classes, all_rooms, all_times, all_teachers, registry, rooms)
+    stats.count('shard_conflicts_repaired', repaired)
+    # remove previous enrolled student data
+    registry.clear_demand()
+    return schedule, registry
@@ -0,0 +1,251 @@
+#! /usr/bin/env python3
+""" In-process schedule validation
+
+Checks an in-memory schedule against the rules of is_valid.pl, i.e. room collisions, teacher conflicts, room
+capacities, student double-booking and unrequested courses, and additionally takes overlapping time slots and
+lab sections into account. Every check is a handful of NumPy operations over the whole schedule, so there is no
+need to write intermediate files or to strip labs before a schedule can be checked.
+"""
+
+import argparse
+import numpy as np
+from components import ClassRoom, Course, Student, TimeTable
+from loaders import read_constraints, read_prefs
+from pool import StudentPool, roster_ids
+
+# number of offending entries listed per rule before the rest are summarized
+MAX_REPORTED = 5
+
+
+class ValidationReport:
+    """ The outcome of validating one schedule
+
+        Attributes:
+            errors (list): a message for every broken rule
+            score (int): the student preferences value, the number of students placed in lectures
+            requested (int): the number of preferences the students asked for, 0 if they're unknown
+    """
+    def __init__(self):
+        self.errors = []
+        self.score = 0
+        self.requested = 0
+
+    @property
+    def valid(self):
+        return not self.errors
+
+    def __str__(self):
+        lines = list(self.errors) if self.errors else ["Schedule is valid."]
+        lines.append("Student preferences value: " + str(self.score))
+        return "\n".join(lines)
+
+
+class Validator:
+    """ Validates schedules against one set of constraints, precomputing everything that doesn't depend on the
+        schedule so that many schedules can be checked in a batch
+
+        Args:
+            all_students (list): Student objects, if given, students may only be placed in classes they asked for
+            all_classes (list): Course objects, if given, every class must be one of them and every lecture must keep
+                the teacher of its Course
+            time_list (TimeTable): overlapping slots conflict if given, otherwise only identical slots do
+    """
+    def __init__(self, all_students=None, all_classes=None, time_list=None):
+        self.time_list = time_list
+        if isinstance(time_list, TimeTable):
+            if not time_list.overlap:
+                time_list.compile_overlaps()
+            self.slots = list(time_list.slots)
+            self.overlap = time_list.overlap_matrix
+        else:
+            self.slots = []
+            self.overlap = None
+
+        self.teachers = None if all_classes is None else {c.name: c.teacher for c in all_classes}
+
+        # every (student, course) preference encoded as one integer
+        self.course_codes = {}
+        self.pref_keys = None
+        self.requested = 0
+        if isinstance(all_students, StudentPool):
+            students = np.repeat(all_students.ids, np.diff(all_students.indptr))
+            self.requested = len(students)
+            courses = self._encode_courses(all_students.classes.tolist(), grow=True)
+            self.pref_keys = np.unique(students * (len(self.course_codes) + 1) + courses)
+        elif all_students is not None:
+            students = []
+            courses = []
+            for s in all_students:
+                students.extend([s.idx] * len(s.classes))
+                courses.extend(s.classes)
+            self.requested = len(courses)
+            students = np.array(students, dtype=np.int64)
+            courses = self._encode_courses(courses, grow=True)
+            self.pref_keys = np.unique(students * (len(self.course_codes) + 1) + courses)
+
+    def _encode_courses(self, names, grow=False):
+        """ Map course names to dense integer codes, unknown names get a new code if `grow`, -1 otherwise """
+        codes = self.course_codes
+        if grow:
+            return np.array([codes.setdefault(n, len(codes)) for n in names], dtype=np.int64)
+        return np.array([codes.get(n, -1) for n in names], dtype=np.int64)
+
+    def _slot_codes(self, times):
+        """ Map slot numbers to rows of the overlap matrix, slots missing from the time table are an error """
+        if self.overlap is None:
+            slots, codes = np.unique(times, return_inverse=True)
+            return codes, np.eye(len(slots), dtype=bool)
+        position = {t: i for i, t in enumerate(self.slots)}
+        codes = np.array([position.get(t, -1) for t in times.tolist()], dtype=np.int64)
+        if (codes < 0).any():
+            raise ValueError("Schedule uses time slots that are not in the time table: " +
+                             str(sorted(set(times[codes < 0].tolist()))))
+        return codes, self.overlap
+
+    def validate(self, schedule):
+        """ Validate one schedule
+            Args:
+                schedule (dict): {Course: (ClassRoom, time, [Students])}
+            Returns:
+                report (ValidationReport)
+        """
+        report = ValidationReport()
+        report.requested = self.requested
+        entries = list(schedule.items())
+        n = len(entries)
+        if n == 0:
+            return report
+
+        courses = [e[0] for e in entries]
+        names = [c.name for c in courses]
+        is_lab = np.array([c.has_lab == -1 for c in courses], dtype=bool)
+        room_ids = {}
+        room = np.array([room_ids.setdefault(id(e[1][0]), len(room_ids)) for e in entries], dtype=np.int64)
+        capacity = np.array([e[1][0].capacity for e in entries], dtype=np.int64)
+        teacher_ids = {}
+        teacher = np.array([teacher_ids.setdefault(c.teacher, len(teacher_ids)) for c in courses], dtype=np.int64)
+        slot, overlap = self._slot_codes(np.array([e[1][1] for e in entries], dtype=np.int64))
+        size = np.array([len(e[1][2]) for e in entries], dtype=np.int64)
+        roster = np.concatenate([roster_ids(e[1][2]) for e in entries])
+        roster_entry = np.repeat(np.arange(n), size)
+
+        def describe(mask, message):
+            bad = np.flatnonzero(mask)
+            for i in bad[:MAX_REPORTED]:
+                report.errors.append(message(i))
+            if len(bad) > MAX_REPORTED:
+                report.errors.append("... and %d more like this." % (len(bad) - MAX_REPORTED))
+
+        def line(i):
+            return "Course %s in room %s at time %s" % (names[i], entries[i][1][0].idx, entries[i][1][1])
+
+        # every lecture is scheduled once, labs share the name of their lecture
+        lecture_names = [names[i] for i in np.flatnonzero(~is_lab)]
+        if len(set(lecture_names)) != len(lecture_names):
+            seen = set()
+            twice = [c for c in lecture_names if c in seen or seen.add(c)]
+            report.errors.append("Course %s defined more than once." % twice[0])
+
+        if self.teachers is not None:
+            unknown = np.array([n not in self.teachers for n in names], dtype=bool)
+            describe(unknown, lambda i: "Course %s is not in the list of classes." % names[i])
+            wrong = np.array([not lab and n in self.teachers and self.teachers[n] != c.teacher
+                              for c, n, lab in zip(courses, names, is_lab)], dtype=bool)
+            describe(wrong, lambda i: "Course %s does not have the correct teacher." % names[i])
+
+        describe(size > capacity, lambda i: "Room %s is too small to hold course %s with %d students." %
+                 (entries[i][1][0].idx, names[i], size[i]))
+
+        def clashes(owner, count):
+            """ For every entry, whether another entry of the same owner is at an overlapping slot """
+            load = np.zeros((count, overlap.shape[0]), dtype=np.int64)
+            np.add.at(load, (owner, slot), 1)
+            busy = load @ overlap.astype(np.int64)
+            return busy[owner, slot] > 1
+
+        describe(clashes(room, len(room_ids)), lambda i: line(i) + " collides with another course in that room.")
+        describe(clashes(teacher, len(teacher_ids)),
+                 lambda i: line(i) + ": teacher %s is scheduled for overlapping courses." % courses[i].teacher)
+
+        if len(roster):
+            # students booked into overlapping slots, counted per (student, course) pair
+            student_ids, student = np.unique(roster, return_inverse=True)
+            roster_slot = slot[roster_entry]
+            load = np.zeros((len(student_ids), overlap.shape[0]), dtype=np.uint8)
+            np.add.at(load, (student, roster_slot), 1)
+            double = (load[student] * overlap[roster_slot]).sum(axis=1) > 1
+            describe(double, lambda p: "Student %d assigned to time conflicting courses, including %s." %
+                     (roster[p], names[roster_entry[p]]))
+
+            # students placed in courses they didn't ask for
+            if self.pref_keys is not None:
+                keys = roster * (len(self.course_codes) + 1) + self._encode_courses(names)[roster_entry]
+                unrequested = ~np.isin(keys, self.pref_keys)
+                describe(unrequested, lambda p: "Student %d assigned to unrequested course %s." %
+                         (roster[p], names[roster_entry[p]]))
+
+        # a lab must belong to a scheduled lecture and hold exactly its students
+        lectures = {names[i]: i for i in np.flatnonzero(~is_lab)}
+        for i in np.flatnonzero(is_lab):
+            j = lectures.get(names[i])
+            if j is None:
+                report.errors.append("Lab of course %s is scheduled without its lecture." % names[i])
+            elif not np.array_equal(np.sort(roster[roster_entry == i]), np.sort(roster[roster_entry == j])):
+                report.errors.append("Lab of course %s does not hold the same students as the lecture." % names[i])
+
+        report.score = int(size[~is_lab].sum())
+        return report
+
+    def validate_many(self, schedules):
+        """ Validate a batch of schedules, returns a list of ValidationReports in the same order """
+        return [self.validate(schedule) for schedule in schedules]
+
+
+def validate_schedule(schedule, all_students=None, all_classes=None, time_list=None):
+    """ Validate one schedule, see Validator for the arguments """
+    return Validator(all_students, all_classes, time_list).validate(schedule)
+
+
+def read_schedule(filename, all_rooms, all_students):
+    """ Read a schedule in the basic output format back into a schedule dict
+        Args:
+            filename (string): a `Course Room Teacher Time Students` tab separated file
+            all_rooms (list): ClassRoom objects the schedule refers to by `idx`
+            all_students (list): Student objects the schedule refers to by `idx`
+        Returns:
+            schedule (dict): {Course: (ClassRoom, time, [Students])}
+    """
+    rooms = {r.idx: r for r in all_rooms}
+    students = {s.idx: s for s in all_students}
+    schedule = {}
+    with open(filename) as f:
+        header = f.readline().rstrip("\n")
+        if header != "Course\tRoom\tTeacher\tTime\tStudents":
+            raise ValueError("Header line has incorrect format: " + header)
+        for line in f:
+            if not line.strip():
+                continue
+            course, room, teacher, time, stus = line.rstrip("\n").split("\t")
+            if room not in rooms:
+                rooms[room] = ClassRoom(room, 0)
+            roster = [students[s] if s in students else Student(s) for s in map(int, stus.split())]
+            schedule[Course(int(course), int(teacher))] = (rooms[room], int(time), roster)
+    return schedule
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Usage: python3 validator.py <constraints.txt> <studentprefs.txt> <schedule.txt> [...]')
+    parser.add_argument('constraints', type=str, help='basic constraints file')
+    parser.add_argument('prefs', type=str, help='student preferences file')
+    parser.add_argument('schedules', type=str, nargs='+', help='one or more schedules to check')
+    args = parser.parse_args()
+
+    ntimes, all_rooms, all_classes, all_teachers = read_constraints(args.constraints)
+    all_students = read_prefs(args.prefs)
+    validator = Validator(all_students, all_classes)
+    schedules = [read_schedule(f, all_rooms, all_students) for f in args.schedules]
+    for fname, report in zip(args.schedules, validator.validate_many(schedules)):
+        if len(args.schedules) > 1:
+            print(fname)
+        print(report)
@@ -0,0 +1,155 @@
+""" Schedule writers
+
+A schedule is written one row per class, in the order of course names, with the students of every class sorted by
+id. The room and time labels are worked out once per room and time before the first row, and every row goes out
+as a single write through a large buffer, so writing costs about as much as formatting the student ids.
+
+Three formats:
+
+- tsv: the tab separated format is_valid.pl reads, `Course Room Teacher Time Students`
+- jsonl: one JSON object per class, {"course", "room", "teacher", "time", "students": [ids]}
+- binary: a compact roster file, see write_binary
+"""
+
+import json
+import struct
+import numpy as np
+from pool import roster_ids
+
+FORMATS = ('tsv', 'jsonl', 'binary')
+BUFFER_SIZE = 1 << 20
+BINARY_MAGIC = b'SCHEDULE'
+BINARY_VERSION = 1
+
+
+def repr_time(t):
+    """ convert time back to a printable form
+        Args:
+            t (list): [start (int), end (int), days (list)] e.g.[1000, 1100, ['T', 'H']]
+        Returns:
+            str_t (string): "10:00 AM  11:00 AM TH"
+    """
+    str_t = ""
+    for i in range(2):
+        if t[i] >= 1200:
+            if t[i] // 100 == 12:
+                str_t += str(t[i] // 100)+ ":" + str(t[i] % 100).zfill(2) + " PM"
+            else:
+                str_t += str(t[i] // 100 - 12)+ ":" + str(t[i] % 100).zfill(2) + " PM"
+        else:
+            str_t += str(t[i] // 100)+ ":" + str(t[i] % 100).zfill(2) + " AM"
+        str_t += " "
+    str_t += "".join(t[2])
+    return str_t
+
+
+def schedule_rows(schedule, all_times=None, all_rooms=None, skip_labs=False):
+    """ The rows of a schedule, sorted by course name
+        Args:
+            schedule (dict): {Course: (ClassRoom, time, [Students])}
+            all_times (dict): if given, times are written readably with repr_time, otherwise as their number
+            all_rooms (list): if given, rooms are written as their position in this list, otherwise by `idx`
+            skip_labs (bool): leave out lab sections
+        Yields:
+            course name, room label, teacher, time label, student ids (sorted ndarray)
+    """
+    if all_rooms is not None:
+        room_label = {id(room): i for i, room in enumerate(all_rooms)}
+    else:
+        room_label = {id(room): room.idx for room, time, students in schedule.values()}
+    times = {time for room, time, students in schedule.values()}
+    time_label = {t: repr_time(all_times[t]) for t in times} if all_times is not None else {t: t for t in times}
+
+    for course, (room, time, students) in sorted(schedule.items(), key=lambda item: item[0].name):
+        if skip_labs and course.has_lab == -1:
+            continue
+        yield course.name, room_label[id(room)], course.teacher, time_label[time], np.sort(roster_ids(students))
+
+
+def write_tsv(rows, fname):
+    """ Write rows as is_valid.pl reads them """
+    with open(fname, 'w', buffering=BUFFER_SIZE) as f:
+        f.write("Course\tRoom\tTeacher\tTime\tStudents\n")
+        for name, room, teacher, time, ids in rows:
+            f.write("%s\t%s\t%s\t%s\t%s\n" % (name, room, teacher, time, ' '.join(map(str, ids.tolist()))))
+
+
+def write_jsonl(rows, fname):
+    """ Write rows as JSON lines """
+    with open(fname, 'w', buffering=BUFFER_SIZE) as f:
+        for name, room, teacher, time, ids in rows:
+            f.write(json.dumps({'course': name, 'room': room, 'teacher': teacher, 'time': time,
+                                'students': ids.tolist()}))
+            f.write("\n")
+
+
+def _pack_string(value):
+    data = str(value).encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def _id_width(ids):
+    """ The fewest bytes of a signed integer that hold every id """
+    if len(ids) == 0:
+        return 2
+    largest = max(-int(ids.min()) - 1, int(ids.max()))
+    for width in (2, 4):
+        if largest < 1 << (8 * width - 1):
+            return width
+    return 8
+
+
+def write_binary(rows, fname):
+    """ Write rows in the binary roster format: the magic bytes b'SCHEDULE' and a little endian uint32 version,
+        then for every row the course, room, teacher and time as strings (uint16 length and UTF-8 bytes), a
+        uint32 number of students, a byte with the width of their ids (2, 4 or 8, the smallest that holds them) and
+        the ids as little endian signed integers of that width, and an empty course name at the end
+    """
+    with open(fname, 'wb', buffering=BUFFER_SIZE) as f:
+        f.write(BINARY_MAGIC + struct.pack('<I', BINARY_VERSION))
+        for name, room, teacher, time, ids in rows:
+            width = _id_width(ids)
+            f.write(b''.join([_pack_string(name), _pack_string(room), _pack_string(teacher), _pack_string(time),
+                              struct.pack('<IB', len(ids), width)]))
+            f.write(ids.astype('<i%d' % width).tobytes())
+        f.write(struct.pack('<H', 0))
+
+
+def read_binary(fname):
+    """ Read a file written by write_binary
+        Returns:
+            rows (list): (course, room, teacher, time, student ids) with everything but the ids as strings
+    """
+    with open(fname, 'rb') as f:
+        data = f.read()
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError(fname + " is not a binary schedule")
+    pos = len(BINARY_MAGIC)
+    version, = struct.unpack_from('<I', data, pos)
+    if version != BINARY_VERSION:
+        raise ValueError("%s has format version %d, this version reads %d" % (fname, version, BINARY_VERSION))
+    pos += 4
+
+    rows = []
+    while True:
+        fields = []
+        for i in range(4):
+            length, = struct.unpack_from('<H', data, pos)
+            pos += 2
+            if i == 0 and length == 0:
+                return rows
+            fields.append(data[pos:pos + length].decode('utf-8'))
+            pos += length
+        n, width = struct.unpack_from('<IB', data, pos)
+        pos += 5
+        fields.append(np.frombuffer(data, dtype='<i%d' % width, count=n, offset=pos).astype(np.int64))
+        pos += width * n
+        rows.append(tuple(fields))
+
+
+WRITERS = {'tsv': write_tsv, 'jsonl': write_jsonl, 'binary': write_binary}
+
+
+def write_schedule(schedule, fname, fmt='tsv', all_times=None, all_rooms=None, skip_labs=False):
+    """ Write a schedule in one of FORMATS, the other arguments are those of schedule_rows """
+    WRITERS[fmt](schedule_rows(schedule, all_times, all_rooms, skip_labs), fname)